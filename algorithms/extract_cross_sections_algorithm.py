@@ -0,0 +1,91 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from qgis.core import (
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterRasterLayer,
+    QgsProcessingContext,
+    QgsProcessingFeedback
+)
+from qgis.core import QgsProcessing
+import os
+
+from ..extract_cross_sections import extract_cross_sections, raster_resolution, STORE_SUFFIX
+from ..profiling import Profiler
+from ..stage_cache import CachedAlgorithm
+from ..sources import source_signature
+
+
+class ExtractCrossSectionsAlgorithm(CachedAlgorithm):
+    TRANSECTS = 'TRANSECTS'
+    ELEVATION = 'ELEVATION'
+    SPACING = 'SPACING'
+    OUTPUT = 'OUTPUT'
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.TRANSECTS, "Transects Layer", [QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterRasterLayer(self.ELEVATION, "Elevation Raster Layer"))
+        self.addParameter(QgsProcessingParameterNumber(self.SPACING, "Sample spacing along transects (map units; 0 = DEM resolution)", type=QgsProcessingParameterNumber.Double, defaultValue=0, minValue=0))
+        self.addParameter(QgsProcessingParameterFileDestination(
+            self.OUTPUT, "Cross-section profile store", fileFilter=f"OpenRES cross sections (*{STORE_SUFFIX})"
+        ))
+
+    def name(self):
+        return "extract_cross_sections"
+
+    def displayName(self):
+        return "[4a] Extract Cross-Section Profiles"
+
+    def group(self):
+        return "Feature Extraction"
+
+    def groupId(self):
+        return "feature_extraction"
+
+    def createInstance(self):
+        return ExtractCrossSectionsAlgorithm()
+
+    def cacheable(self, parameters, context):
+        # The store is a file output, which the stage cache does not record
+        return False
+
+    def run_stage(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+        transect_layer = self.parameterAsVectorLayer(parameters, self.TRANSECTS, context)
+        raster = self.parameterAsRasterLayer(parameters, self.ELEVATION, context)
+        spacing = self.parameterAsDouble(parameters, self.SPACING, context) or raster_resolution(raster)
+        path = self.parameterAsFileOutput(parameters, self.OUTPUT, context)
+
+        profiler = Profiler(self.name(), feedback)
+
+        # Densify and sample all transects in batches
+        with profiler.phase("cross-section sampling") as p:
+            sections = extract_cross_sections(transect_layer, raster, spacing, feedback)
+            if sections is None:
+                return {}
+            p["count"] = len(sections.station)
+
+        with profiler.phase("profile store write", len(sections)):
+            sections.save(path, {"transects": source_signature(transect_layer), "elevation": source_signature(raster),
+                                 "spacing": spacing})
+        feedback.pushInfo(
+            f"Cross sections: {len(sections)} transects, {len(sections.station)} samples every {spacing:g} map units, "
+            f"{os.path.getsize(path) / 1048576:.1f} MB"
+        )
+
+        profiler.report()
+        return {self.OUTPUT: path}
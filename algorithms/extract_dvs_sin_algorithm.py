@@ -15,7 +15,10 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from qgis.core import (
-    QgsProcessingAlgorithm,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
     QgsProcessingParameterFeatureSource,
     QgsProcessingParameterRasterLayer,
     QgsProcessingParameterVectorDestination,
@@ -25,26 +28,47 @@ from qgis.core import (
     QgsField,
     QgsWkbTypes,
     QgsVectorLayer,
-    QgsFeature,
-    QgsRaster,
-    QgsPointXY
+    QgsFeature
 )
 from qgis.core import QgsProcessing
 from PyQt5.QtCore import QVariant
-import math
+import numpy as np
+
+from ..raster_sampler import sample_raster
+from ..core.segment_table import lookup
+from ..core.metrics import profile_dvs
+from ..feature_sink import write_features
+from ..profiling import Profiler
+from ..stage_cache import CachedAlgorithm
+from ..segment_layers import table_from_layer, table_features, extend_fields
+from ..extract_dvs_sinuosity import (
+    read_lines,
+    assign_dvs_sinuosity,
+    assign_window_sinuosity,
+    parse_windows,
+    window_fields,
+    DVS_METHODS
+)
 
 
-class ExtractDVSAlgorithm(QgsProcessingAlgorithm):
+class ExtractDVSAlgorithm(CachedAlgorithm):
     CENTER_POINTS = 'CENTER_POINTS'
     STREAM_SEGMENTS = 'STREAM_SEGMENTS'
     ELEVATION = 'ELEVATION'
+    DVS_METHOD = 'DVS_METHOD'
+    PROFILE_SPACING = 'PROFILE_SPACING'
+    SIN_WINDOWS = 'SIN_WINDOWS'
     OUTPUT = 'OUTPUT'
 
     def initAlgorithm(self, config=None):
         self.addParameter(QgsProcessingParameterFeatureSource(self.CENTER_POINTS, "Segment Centers Layer", [QgsProcessing.TypeVectorPoint]))
         self.addParameter(QgsProcessingParameterFeatureSource(self.STREAM_SEGMENTS, "River Network Layer", [QgsProcessing.TypeVectorLine]))
         self.addParameter(QgsProcessingParameterRasterLayer(self.ELEVATION, "Elevation Raster Layer"))
+        self.addParameter(QgsProcessingParameterEnum(self.DVS_METHOD, "DVS method", options=DVS_METHODS, defaultValue=0))
+        self.addParameter(QgsProcessingParameterNumber(self.PROFILE_SPACING, "Profile sample spacing (map units; profile DVS and window sinuosity)", type=QgsProcessingParameterNumber.Double, defaultValue=10, minValue=0.01))
+        self.addParameter(QgsProcessingParameterString(self.SIN_WINDOWS, "Sinuosity window lengths (map units, comma-separated, e.g. 500,1000,2000; empty = none)", defaultValue="", optional=True))
         self.addParameter(QgsProcessingParameterVectorDestination(self.OUTPUT, "[5] OpenRES Extraction Output"))
+        self.addParameter(QgsProcessingParameterBoolean(self.BYPASS_CACHE, "Bypass the stage result cache (always recompute)", defaultValue=False))
 
     def name(self):
         return "extract_dvs_sinuosity"
@@ -61,74 +85,65 @@ class ExtractDVSAlgorithm(QgsProcessingAlgorithm):
     def createInstance(self):
         return ExtractDVSAlgorithm()
 
-    def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+    def run_stage(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
         center_layer = self.parameterAsVectorLayer(parameters, self.CENTER_POINTS, context)
         stream_layer = self.parameterAsVectorLayer(parameters, self.STREAM_SEGMENTS, context)
         raster = self.parameterAsRasterLayer(parameters, self.ELEVATION, context)
-
-        # Make editable copy of center points
-        out_layer = QgsVectorLayer("Point?crs={}".format(center_layer.sourceCrs().authid()), "temp_center", "memory")
-        out_dp = out_layer.dataProvider()
-        out_dp.addAttributes(center_layer.fields())
-        out_layer.updateFields()
-        out_dp.addFeatures([f for f in center_layer.getFeatures()])
-
-        # Add missing fields
-        for name in ["DVS", "SIN"]:
-            if out_layer.fields().indexFromName(name) == -1:
-                out_dp.addAttributes([QgsField(name, QVariant.Double)])
-        out_layer.updateFields()
-
-        # Stream features by t_id
-        stream_by_id = {f["t_id"]: f for f in stream_layer.getFeatures()}
-
-        # Elevation helper
-        def get_elev(pt):
-            pt = pt if isinstance(pt, QgsPointXY) else QgsPointXY(pt.x(), pt.y())
-            ident = raster.dataProvider().identify(pt, QgsRaster.IdentifyFormatValue)
-            return ident.results().get(1, None) if ident.isValid() else None
+        dvs_method = self.parameterAsEnum(parameters, self.DVS_METHOD, context)
+        spacing = self.parameterAsDouble(parameters, self.PROFILE_SPACING, context)
+        windows = parse_windows(self.parameterAsString(parameters, self.SIN_WINDOWS, context))
+
+        profiler = Profiler(self.name(), feedback)
+
+        with profiler.phase("read layers") as p:
+            centers = table_from_layer(center_layer, "t_id")
+            stream_ids, lines = read_lines(stream_layer, "t_id")
+            p["count"] = len(centers) + len(lines)
+
+        # End points and lengths of every stream segment, joined to the centers by t_id
+        with profiler.phase("stream end points", len(lines)):
+            x0, y0, x1, y1 = lines.endpoints()
+            lengths = lines.lengths()
+            rows = lookup(stream_ids, centers.t_id)
+            rows = rows[rows >= 0]
+            rows = rows[~np.isnan(x0[rows])]
+
+        # Sample start and end elevations in one batched raster read
+        with profiler.phase("raster sampling", 2 * len(rows)):
+            elevations = sample_raster(raster, np.concatenate([x0[rows], x1[rows]]),
+                                       np.concatenate([y0[rows], y1[rows]]))
+
+        # Profile DVS: sample every segment at a fixed spacing in one batch and fit the slope
+        dvs = None
+        if dvs_method > 0:
+            with profiler.phase("profile sampling") as p:
+                owner, distance, px, py = lines.densify(spacing, rows)
+                profile = sample_raster(raster, px, py)
+                p["count"] = len(owner)
+            with profiler.phase("profile DVS", len(rows)):
+                dvs = profile_dvs(owner, distance, profile, len(rows), breach=dvs_method == 2)
 
         # Compute DVS and SIN
-        out_layer.startEditing()
-        dvs_idx = out_layer.fields().indexFromName("DVS")
-        sin_idx = out_layer.fields().indexFromName("SIN")
-
-        for i, feat in enumerate(out_layer.getFeatures()):
-            t_id = feat["t_id"]
-            stream = stream_by_id.get(t_id)
-            if not stream:
-                continue
-
-            geom = stream.geometry()
-            stream_points = list(geom.constGet().points()) if not geom.isMultipart() else list(geom.parts())[0].points()
-
-            if len(stream_points) < 2:
-                continue
-
-            start, end = stream_points[0], stream_points[-1]
-            elev_start, elev_end = get_elev(start), get_elev(end)
-
-            if elev_start is None or elev_end is None:
-                continue
-
-            length = geom.length()
-            straight = math.hypot(end.x() - start.x(), end.y() - start.y())
-
-            dvs = ((elev_start - elev_end) / length) * 100 if length > 0 else None
-            sin = (length / straight) if straight > 0 else None
-
-            out_layer.changeAttributeValue(feat.id(), dvs_idx, dvs)
-            out_layer.changeAttributeValue(feat.id(), sin_idx, sin)
-
-            if i % 100 == 0:
-                feedback.setProgress(int(100 * i / out_layer.featureCount()))
+        with profiler.phase("DVS and SIN", len(rows)):
+            assign_dvs_sinuosity(centers, stream_ids[rows], x0[rows], y0[rows], x1[rows], y1[rows],
+                                 lengths[rows], elevations[:len(rows)], elevations[len(rows):], dvs=dvs)
 
-        out_layer.commitChanges()
+        # Sinuosity over sliding windows of each length, from one walk of the vertex arrays
+        if windows:
+            with profiler.phase("window sinuosity", len(rows)):
+                assign_window_sinuosity(centers, stream_ids[rows], lines, rows, windows, spacing)
+        feedback.setProgress(90)
 
         # Save output
+        out_fields = extend_fields(
+            center_layer.fields(),
+            [("DVS", QVariant.Double), ("SIN", QVariant.Double)]
+            + [(name, QVariant.Double) for names in window_fields(windows) for name in names]
+        )
         sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context,
-                                             out_layer.fields(), QgsWkbTypes.Point, out_layer.sourceCrs())
-        for f in out_layer.getFeatures():
-            sink.addFeature(f)
+                                             out_fields, QgsWkbTypes.Point, center_layer.sourceCrs())
+        with profiler.phase("sink writes") as p:
+            p["count"] = write_features(sink, table_features(centers, out_fields), feedback=feedback)
 
+        profiler.report()
         return {self.OUTPUT: dest_id}
@@ -15,33 +15,41 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from qgis.core import (
-    QgsProcessingAlgorithm,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterFeatureSource,
     QgsProcessingParameterRasterLayer,
     QgsProcessingParameterVectorLayer,
     QgsProcessingParameterField,
+    QgsProcessingParameterNumber,
     QgsProcessingParameterVectorDestination,
     QgsFeatureSink,
     QgsField,
     QgsWkbTypes,
-    QgsSpatialIndex,
     QgsPointXY,
     QgsFeature,
     QgsVectorLayer,
     QgsProcessingContext,
-    QgsProcessingFeedback,
-    QgsRaster
+    QgsProcessingFeedback
 )
 from qgis.core import QgsProcessing
 from PyQt5.QtCore import QVariant
+import numpy as np
 
+from ..raster_sampler import sample_raster
+from ..extract_point_data import polygon_attribute_at
+from ..feature_sink import write_features
+from ..profiling import Profiler
+from ..stage_cache import CachedAlgorithm
+from ..segment_layers import table_from_layer, table_features, extend_fields
 
-class ExtractPointDataAlgorithm(QgsProcessingAlgorithm):
+
+class ExtractPointDataAlgorithm(CachedAlgorithm):
     POINTS = 'POINTS'
     RASTER1 = 'RASTER1'
     RASTER2 = 'RASTER2'
     POLYGONS = 'POLYGONS'
     POLY_FIELD = 'POLY_FIELD'
+    GEO_RESOLUTION = 'GEO_RESOLUTION'
     OUTPUT = 'OUTPUT'
 
     def initAlgorithm(self, config=None):
@@ -50,7 +58,9 @@ class ExtractPointDataAlgorithm(QgsProcessingAlgorithm):
         self.addParameter(QgsProcessingParameterRasterLayer(self.RASTER2, "Precipitation Raster Layer (for 'PRE')"))
         self.addParameter(QgsProcessingParameterVectorLayer(self.POLYGONS, "Geology Polygon Layer (for 'GEO')", [QgsProcessing.TypeVectorPolygon]))
         self.addParameter(QgsProcessingParameterField(self.POLY_FIELD, "Geology Attribute Field", parentLayerParameterName=self.POLYGONS))
+        self.addParameter(QgsProcessingParameterNumber(self.GEO_RESOLUTION, "Geology grid resolution (map units; 0 = prepared polygons, same GEO values)", type=QgsProcessingParameterNumber.Double, defaultValue=0, minValue=0))
         self.addParameter(QgsProcessingParameterVectorDestination(self.OUTPUT, "[2] Segment Centers"))
+        self.addParameter(QgsProcessingParameterBoolean(self.BYPASS_CACHE, "Bypass the stage result cache (always recompute)", defaultValue=False))
 
     def name(self):
         return "extract_point_attributes"
@@ -67,68 +77,44 @@ class ExtractPointDataAlgorithm(QgsProcessingAlgorithm):
     def createInstance(self):
         return ExtractPointDataAlgorithm()
 
-    def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+    def run_stage(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
 
         points = self.parameterAsVectorLayer(parameters, self.POINTS, context)
         raster1 = self.parameterAsRasterLayer(parameters, self.RASTER1, context)
         raster2 = self.parameterAsRasterLayer(parameters, self.RASTER2, context)
         polygons = self.parameterAsVectorLayer(parameters, self.POLYGONS, context)
         poly_field = self.parameterAsString(parameters, self.POLY_FIELD, context)
+        geo_resolution = self.parameterAsDouble(parameters, self.GEO_RESOLUTION, context)
 
-        # Make an editable memory copy
-        out_layer = QgsVectorLayer("Point?crs={}".format(points.sourceCrs().authid()), "temp_points", "memory")
-        out_dp = out_layer.dataProvider()
-        out_dp.addAttributes(points.fields())
-        out_layer.updateFields()
-        out_dp.addFeatures([f for f in points.getFeatures()])
+        profiler = Profiler(self.name(), feedback)
 
-        # Add new fields if needed
-        for name, typ in [("ELE", QVariant.Double), ("PRE", QVariant.Double), ("GEO", QVariant.String)]:
-            if out_layer.fields().indexFromName(name) == -1:
-                out_dp.addAttributes([QgsField(name, typ)])
-        out_layer.updateFields()
+        with profiler.phase("read centers") as p:
+            centers = table_from_layer(points)
+            p["count"] = len(centers)
 
-        # Sample raster 1 (ELE)
-        self.extract_raster_value(out_layer, raster1, "ELE", feedback)
-        self.extract_raster_value(out_layer, raster2, "PRE", feedback)
-        self.extract_polygon_value(out_layer, polygons, poly_field, "GEO", feedback)
+        with profiler.phase("raster sampling ELE", len(centers)):
+            self.extract_raster_value(centers, raster1, "ELE")
+        with profiler.phase("raster sampling PRE", len(centers)):
+            self.extract_raster_value(centers, raster2, "PRE")
+        feedback.setProgress(50)
+        with profiler.phase("geology lookup", len(centers)):
+            self.extract_polygon_value(centers, polygons, poly_field, "GEO", geo_resolution)
 
         # Output
+        out_fields = extend_fields(points.fields(), [("ELE", QVariant.Double), ("PRE", QVariant.Double), ("GEO", QVariant.String)])
         sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context,
-                                             out_layer.fields(), QgsWkbTypes.Point, out_layer.sourceCrs())
-        for f in out_layer.getFeatures():
-            sink.addFeature(f)
+                                             out_fields, QgsWkbTypes.Point, points.sourceCrs())
+        with profiler.phase("sink writes") as p:
+            p["count"] = write_features(sink, table_features(centers, out_fields), feedback=feedback)
 
+        profiler.report()
         return {self.OUTPUT: dest_id}
 
-    def extract_raster_value(self, point_layer, raster_layer, field_name, feedback):
-        point_layer.startEditing()
-        for i, feature in enumerate(point_layer.getFeatures()):
-            point = feature.geometry().asPoint() if not feature.geometry().isMultipart() else feature.geometry().asMultiPoint()[0]
-            pt_xy = QgsPointXY(point.x(), point.y())
-            ident = raster_layer.dataProvider().identify(pt_xy, QgsRaster.IdentifyFormatValue)
-            value = ident.results().get(1, None) if ident.isValid() else None
-            feature[field_name] = value if value is not None else -9999
-            point_layer.updateFeature(feature)
-            if i % 100 == 0:
-                feedback.setProgress(int(100 * i / point_layer.featureCount()))
-        point_layer.commitChanges()
-
-    def extract_polygon_value(self, point_layer, polygon_layer, polygon_attribute, target_field, feedback):
-        spatial_index = QgsSpatialIndex(polygon_layer.getFeatures())
-        point_layer.startEditing()
-        for i, feature in enumerate(point_layer.getFeatures()):
-            geom = feature.geometry()
-            point = geom.asPoint() if not geom.isMultipart() else geom.asMultiPoint()[0]
-            candidates = spatial_index.intersects(geom.boundingBox())
-            value = "No Data"
-            for pid in candidates:
-                poly = polygon_layer.getFeature(pid)
-                if poly.geometry().contains(geom):
-                    value = poly[polygon_attribute]
-                    break
-            feature[target_field] = value
-            point_layer.updateFeature(feature)
-            if i % 100 == 0:
-                feedback.setProgress(int(100 * i / point_layer.featureCount()))
-        point_layer.commitChanges()
+    def extract_raster_value(self, centers, raster_layer, field_name):
+        values = sample_raster(raster_layer, centers.x, centers.y)
+        centers[field_name] = np.where(np.isnan(values), -9999, values)
+
+    def extract_polygon_value(self, centers, polygon_layer, polygon_attribute, target_field, resolution):
+        column = np.empty(len(centers), dtype=object)
+        column[:] = polygon_attribute_at(polygon_layer, polygon_attribute, centers.x, centers.y, resolution)
+        centers[target_field] = column
@@ -15,7 +15,9 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from qgis.core import (
-    QgsProcessingAlgorithm,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFile,
     QgsProcessingParameterFeatureSource,
     QgsProcessingParameterRasterLayer,
     QgsProcessingParameterVectorDestination,
@@ -27,20 +29,33 @@ from qgis.core import (
     QgsProcessingContext,
     QgsProcessingFeedback,
     QgsFields,
+    QgsProcessingException,
 )
 from qgis.core import QgsProcessing
 from PyQt5.QtCore import QVariant
 
-from ..extract_side_slopes import calculate_side_slopes_from_pairs
+from ..extract_side_slopes import (
+    calculate_side_slopes_from_pairs,
+    calculate_side_slopes_from_profiles,
+    SLOPE_METHODS
+)
+from ..extract_cross_sections import STORE_SUFFIX
+from ..core.cross_sections import CrossSections
+from ..feature_sink import write_features
+from ..profiling import Profiler
+from ..stage_cache import CachedAlgorithm
+from ..segment_layers import table_from_layer, table_features, extend_fields
 
 
-class ExtractSideSlopesAlgorithm(QgsProcessingAlgorithm):
+class ExtractSideSlopesAlgorithm(CachedAlgorithm):
     CENTER = 'CENTER'
     LEFT_VW = 'LEFT_VW'
     LEFT_VFW = 'LEFT_VFW'
     RIGHT_VW = 'RIGHT_VW'
     RIGHT_VFW = 'RIGHT_VFW'
     RASTER = 'RASTER'
+    SLOPE_METHOD = 'SLOPE_METHOD'
+    CROSS_SECTIONS = 'CROSS_SECTIONS'
     OUTPUT = 'OUTPUT'
 
     def initAlgorithm(self, config=None):
@@ -50,7 +65,13 @@ class ExtractSideSlopesAlgorithm(QgsProcessingAlgorithm):
         self.addParameter(QgsProcessingParameterFeatureSource(self.RIGHT_VW, "Right Valley Width Reference Layer", [QgsProcessing.TypeVectorPoint]))
         self.addParameter(QgsProcessingParameterFeatureSource(self.RIGHT_VFW, "Right Valley Floor Width Reference Layer", [QgsProcessing.TypeVectorPoint]))
         self.addParameter(QgsProcessingParameterRasterLayer(self.RASTER, "Elevation Raster Layer"))
+        self.addParameter(QgsProcessingParameterEnum(self.SLOPE_METHOD, "Side slope method", options=SLOPE_METHODS, defaultValue=0))
+        self.addParameter(QgsProcessingParameterFile(
+            self.CROSS_SECTIONS, "Cross-section profile store from [4a] (cross-section regression)",
+            fileFilter=f"OpenRES cross sections (*{STORE_SUFFIX})", optional=True
+        ))
         self.addParameter(QgsProcessingParameterVectorDestination(self.OUTPUT, "[4] Segment Centers"))
+        self.addParameter(QgsProcessingParameterBoolean(self.BYPASS_CACHE, "Bypass the stage result cache (always recompute)", defaultValue=False))
 
     def name(self):
         return "extract_side_slopes"
@@ -67,7 +88,7 @@ class ExtractSideSlopesAlgorithm(QgsProcessingAlgorithm):
     def createInstance(self):
         return ExtractSideSlopesAlgorithm()
 
-    def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+    def run_stage(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
 
         center = self.parameterAsVectorLayer(parameters, self.CENTER, context)
         left_vw = self.parameterAsVectorLayer(parameters, self.LEFT_VW, context)
@@ -75,23 +96,40 @@ class ExtractSideSlopesAlgorithm(QgsProcessingAlgorithm):
         right_vw = self.parameterAsVectorLayer(parameters, self.RIGHT_VW, context)
         right_vfw = self.parameterAsVectorLayer(parameters, self.RIGHT_VFW, context)
         raster = self.parameterAsRasterLayer(parameters, self.RASTER, context)
-
-        # Make an in-memory copy to edit safely
-        temp_center = QgsVectorLayer("Point?crs={}".format(center.crs().authid()), "temp_center", "memory")
-        temp_center_data = temp_center.dataProvider()
-        temp_center_data.addAttributes(center.fields())
-        temp_center.updateFields()
-
-        features = [f for f in center.getFeatures()]
-        temp_center_data.addFeatures(features)
-
-        # Run slope calculation and write LSS/RSS
-        calculate_side_slopes_from_pairs(temp_center, left_vw, left_vfw, right_vw, right_vfw, raster)
+        regression = self.parameterAsEnum(parameters, self.SLOPE_METHOD, context) == 1
+        sections = None
+        if regression:
+            store_path = self.parameterAsFile(parameters, self.CROSS_SECTIONS, context)
+            sections = CrossSections.load(store_path) if store_path else None
+            if sections is None:
+                raise QgsProcessingException(
+                    "Cross-section regression needs a profile store written by [4a] Extract Cross-Section Profiles"
+                )
+
+        profiler = Profiler(self.name(), feedback)
+
+        # Read the layers into columnar tables keyed by t_ID
+        with profiler.phase("read layers") as p:
+            centers = table_from_layer(center, "t_id")
+            left_vw, left_vfw, right_vw, right_vfw = [
+                table_from_layer(layer, "t_id") for layer in (left_vw, left_vfw, right_vw, right_vfw)
+            ]
+            p["count"] = len(centers)
+
+        # Run slope calculation and write LVS/RVS
+        if sections is not None:
+            with profiler.phase("side slopes (profile regression)", len(left_vw) + len(right_vw)):
+                calculate_side_slopes_from_profiles(centers, sections, left_vw, left_vfw, right_vw, right_vfw)
+        else:
+            with profiler.phase("side slopes (raster sampling)", len(left_vw) + len(right_vw)):
+                calculate_side_slopes_from_pairs(centers, left_vw, left_vfw, right_vw, right_vfw, raster)
 
         # Output to user-defined destination
+        out_fields = extend_fields(center.fields(), [("LVS", QVariant.Double), ("RVS", QVariant.Double)])
         sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context,
-                                             temp_center.fields(), QgsWkbTypes.Point, temp_center.crs())
-        for f in temp_center.getFeatures():
-            sink.addFeature(f)
+                                             out_fields, QgsWkbTypes.Point, center.crs())
+        with profiler.phase("sink writes") as p:
+            p["count"] = write_features(sink, table_features(centers, out_fields), feedback=feedback)
 
+        profiler.report()
         return {self.OUTPUT: dest_id}
@@ -15,10 +15,10 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from qgis.core import (
-    QgsProcessingAlgorithm,
     QgsProcessingParameterFeatureSource,
     QgsProcessingParameterVectorLayer,
     QgsProcessingParameterVectorDestination,
+    QgsProcessingParameterBoolean,
     QgsWkbTypes,
     QgsProcessingContext,
     QgsProcessingFeedback,
@@ -36,12 +36,19 @@ from PyQt5.QtCore import QVariant
 
 from ..extract_valley_width import (
     find_two_intersections_by_side,
+    reference_fields,
     add_points_in_batch,
-    compute_valley_width
+    compute_valley_width,
+    intersection_table_signature
 )
+from ..feature_sink import write_features
+from ..profiling import Profiler
+from ..sources import signature_digest
+from ..stage_cache import CachedAlgorithm
+from ..segment_layers import table_from_layer, table_features, extend_fields
 
 
-class ExtractVWAlgorithm(QgsProcessingAlgorithm):
+class ExtractVWAlgorithm(CachedAlgorithm):
     TRANSECTS = 'TRANSECTS'
     CENTER_POINTS = 'CENTER_POINTS'
     VALLEY_LINES = 'VALLEY_LINES'
@@ -51,18 +58,23 @@ class ExtractVWAlgorithm(QgsProcessingAlgorithm):
     LEFT_VW = 'LEFT_VW'
     RIGHT_VW = 'RIGHT_VW'
     CENTER_OUT = 'CENTER_OUT'
+    VECTORIZED = 'VECTORIZED'
+    INTERSECTIONS = 'INTERSECTIONS'
 
     def initAlgorithm(self, config=None):
         self.addParameter(QgsProcessingParameterFeatureSource(self.TRANSECTS, "Transects Layer", [QgsProcessing.TypeVectorLine]))
         self.addParameter(QgsProcessingParameterFeatureSource(self.CENTER_POINTS, "Segment Centers Layer", [QgsProcessing.TypeVectorPoint]))
         self.addParameter(QgsProcessingParameterFeatureSource(self.VALLEY_LINES, "Valley Lines Layer", [QgsProcessing.TypeVectorLine]))
         self.addParameter(QgsProcessingParameterFeatureSource(self.STREAM_NETWORK, "River Network Layer", [QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterBoolean(self.VECTORIZED, "Vectorized intersection kernel (NumPy; off uses prepared GEOS geometries)", defaultValue=True))
+        self.addParameter(QgsProcessingParameterFeatureSource(self.INTERSECTIONS, "Transect intersections from [1] (optional; skips re-intersecting the transects)", [QgsProcessing.TypeVectorPoint], optional=True))
 
         self.addParameter(QgsProcessingParameterVectorDestination(self.LEFT_VFW, "Left VFW Reference"))
         self.addParameter(QgsProcessingParameterVectorDestination(self.RIGHT_VFW, "Right VFW Reference"))
         self.addParameter(QgsProcessingParameterVectorDestination(self.LEFT_VW, "Left VW Reference"))
         self.addParameter(QgsProcessingParameterVectorDestination(self.RIGHT_VW, "Right VW Reference"))
         self.addParameter(QgsProcessingParameterVectorDestination(self.CENTER_OUT, "[3] Segment Centers"))
+        self.addParameter(QgsProcessingParameterBoolean(self.BYPASS_CACHE, "Bypass the stage result cache (always recompute)", defaultValue=False))
 
     def name(self):
         return "extract_valley_width"
@@ -79,60 +91,61 @@ class ExtractVWAlgorithm(QgsProcessingAlgorithm):
     def createInstance(self):
         return ExtractVWAlgorithm()
 
-    def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+    def run_stage(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
 
         transects = self.parameterAsVectorLayer(parameters, self.TRANSECTS, context)
         center = self.parameterAsVectorLayer(parameters, self.CENTER_POINTS, context)
         valley_lines = self.parameterAsVectorLayer(parameters, self.VALLEY_LINES, context)
         stream_network = self.parameterAsVectorLayer(parameters, self.STREAM_NETWORK, context)
+        vectorized = self.parameterAsBool(parameters, self.VECTORIZED, context)
+        intersections = self.parameterAsVectorLayer(parameters, self.INTERSECTIONS, context)
+        if intersections is not None:
+            lines_sig = signature_digest(valley_lines)
+            if lines_sig is None or intersection_table_signature(intersections) != lines_sig:
+                feedback.pushWarning(
+                    "The intersection side table was not computed from these valley lines "
+                    "(or they have unsaved edits); intersecting the transects again"
+                )
+                intersections = None
 
         centers_crs = center.sourceCrs()
-        crs = centers_crs.authid()
-
-        def create_output_layer(name):
-            fields = QgsFields()
-            fields.append(QgsField("side", QVariant.String))
-            fields.append(QgsField("t_ID", QVariant.Int))     # Field needed downstream
-            fields.append(QgsField("distance", QVariant.Double))
-            
-            layer = QgsVectorLayer(f"Point?crs={crs}", name, "memory")
-            layer.dataProvider().addAttributes(fields)
-            layer.updateFields()
-    
-            return layer, fields
-
-        # Create memory layers
-        left_vfw, left_fields = create_output_layer("Left_VFW")
-        right_vfw, _ = create_output_layer("Right_VFW")
-        left_vw, _ = create_output_layer("Left_VW")
-        right_vw, _ = create_output_layer("Right_VW")
 
-        # Run intersection logic
-        left1, left2, right1, right2 = find_two_intersections_by_side(transects, valley_lines, stream_network)
-
-        # Add features to layers
-        add_points_in_batch(left1, left_vfw, "left")
-        add_points_in_batch(right1, right_vfw, "right")
-        add_points_in_batch(left2, left_vw, "left")
-        add_points_in_batch(right2, right_vw, "right")
-
-        # Save temporary layers to outputs
-        self.save_output_layer(left_vfw, parameters, self.LEFT_VFW, context)
-        self.save_output_layer(right_vfw, parameters, self.RIGHT_VFW, context)
-        self.save_output_layer(left_vw, parameters, self.LEFT_VW, context)
-        self.save_output_layer(right_vw, parameters, self.RIGHT_VW, context)
-        
+        profiler = Profiler(self.name(), feedback)
 
-        # Compute valley widths and get updated layer
-        center_updated1 = compute_valley_width(center, left1, right1, out_field="VFW")
-        center_updated2 = compute_valley_width(center_updated1, left2, right2, out_field="VW")
-
-        if center_updated2.isValid():
-            center_updated2.setCrs(centers_crs)
-
-        self.save_output_layer(center_updated2, parameters, self.CENTER_OUT, context)
+        # Run intersection logic
+        left1, left2, right1, right2 = find_two_intersections_by_side(
+            transects, valley_lines, stream_network, vectorized=vectorized, profiler=profiler,
+            intersection_layer=intersections, feedback=feedback
+        )
 
+        # Write reference points straight from the tables
+        with profiler.phase("sink writes (reference points)") as p:
+            p["count"] = 0
+            for points, side, param_name in [(left1, "left", self.LEFT_VFW), (right1, "right", self.RIGHT_VFW),
+                                              (left2, "left", self.LEFT_VW), (right2, "right", self.RIGHT_VW)]:
+                sink, _ = self.parameterAsSink(
+                    parameters, param_name, context,
+                    reference_fields(), QgsWkbTypes.Point, centers_crs
+                )
+                add_points_in_batch(points, sink, side)
+                p["count"] += len(points)
+
+        # Compute valley widths on the columnar center table
+        with profiler.phase("valley widths") as p:
+            centers = table_from_layer(center)
+            compute_valley_width(centers, left1, right1, out_field="VFW")
+            compute_valley_width(centers, left2, right2, out_field="VW")
+            p["count"] = len(centers)
+
+        out_fields = extend_fields(center.fields(), [("VFW", QVariant.Double), ("VW", QVariant.Double)])
+        sink, _ = self.parameterAsSink(
+            parameters, self.CENTER_OUT, context,
+            out_fields, QgsWkbTypes.Point, centers_crs
+        )
+        with profiler.phase("sink writes") as p:
+            p["count"] = write_features(sink, table_features(centers, out_fields), feedback=feedback)
 
+        profiler.report()
         return {
             self.LEFT_VFW: parameters[self.LEFT_VFW],
             self.RIGHT_VFW: parameters[self.RIGHT_VFW],
@@ -140,18 +153,3 @@ class ExtractVWAlgorithm(QgsProcessingAlgorithm):
             self.RIGHT_VW: parameters[self.RIGHT_VW],
             self.CENTER_OUT: parameters[self.CENTER_OUT]
         }
-
-    def save_output_layer(self, layer, parameters, param_name, context):
-        fields = layer.fields()
-        geometry_type = layer.wkbType()
-        crs = layer.sourceCrs()
-
-        sink, dest_id = self.parameterAsSink(
-            parameters, param_name, context,
-            fields, geometry_type, crs
-        )
-
-        if sink is not None:
-            for f in layer.getFeatures():
-                sink.addFeature(f, QgsFeatureSink.FastInsert)
-        return dest_id
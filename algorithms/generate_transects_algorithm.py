@@ -15,10 +15,10 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from qgis.core import (
-    QgsProcessingAlgorithm,
     QgsProcessingParameterFeatureSource,
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterNumber,
+    QgsProcessingParameterBoolean,
     QgsFeature,
     QgsGeometry,
     QgsPointXY,
@@ -35,24 +35,49 @@ from qgis.core import (
 )
 from qgis.core import QgsProcessing
 from PyQt5.QtCore import QVariant
-import math
+
+from ..generate_transects import (
+    transect_origin,
+    build_half_transect,
+    join_half_transects,
+    cast_transects,
+    intersection_fields,
+    intersection_features,
+    tag_river_layer
+)
+from ..core.transects import transect_hits
+from ..valley_lines import build_valley_index
+from ..feature_sink import BatchedSink, write_features
+from ..profiling import Profiler
+from ..sources import signature_digest
+from ..stage_cache import CachedAlgorithm
 
 
-class GenerateTransectsAlgorithm(QgsProcessingAlgorithm):
+class GenerateTransectsAlgorithm(CachedAlgorithm):
     RIVER_LAYER = 'RIVER_LAYER'
     LINE_LAYER = 'LINE_LAYER'
     EXTENSION_INCREMENT = 'EXTENSION_INCREMENT'
     MAX_LENGTH = 'MAX_LENGTH'
+    WORKERS = 'WORKERS'
+    RAY_CASTING = 'RAY_CASTING'
     TRANSECTS = 'TRANSECTS'
     CENTER_POINTS = 'CENTER_POINTS'
+    INTERSECTIONS = 'INTERSECTIONS'
 
     def initAlgorithm(self, config=None):
         self.addParameter(QgsProcessingParameterFeatureSource(self.RIVER_LAYER, "River Network Layer"))
         self.addParameter(QgsProcessingParameterFeatureSource(self.LINE_LAYER, "Valley Lines Layer"))
         self.addParameter(QgsProcessingParameterNumber(self.EXTENSION_INCREMENT, "Extension Increment (m)", defaultValue=250))
         self.addParameter(QgsProcessingParameterNumber(self.MAX_LENGTH, "Max Length (m)", defaultValue=50000))
+        self.addParameter(QgsProcessingParameterBoolean(self.RAY_CASTING, "Single-shot ray casting (same output as incremental extension)", defaultValue=True))
+        self.addParameter(QgsProcessingParameterNumber(self.WORKERS, "Worker processes for ray casting (1 = single process, 0 = all CPU cores)", type=QgsProcessingParameterNumber.Integer, defaultValue=1, minValue=0))
         self.addParameter(QgsProcessingParameterFeatureSink(self.TRANSECTS, "Transects"))
         self.addParameter(QgsProcessingParameterFeatureSink(self.CENTER_POINTS, "[1] Segment Centers"))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.INTERSECTIONS, "Transect intersections (optional, reused by [3])", QgsProcessing.TypeVectorPoint,
+            optional=True, createByDefault=False
+        ))
+        self.addParameter(QgsProcessingParameterBoolean(self.BYPASS_CACHE, "Bypass the stage result cache (always recompute)", defaultValue=False))
 
     def name(self):
         return "generate_transects"
@@ -69,19 +94,15 @@ class GenerateTransectsAlgorithm(QgsProcessingAlgorithm):
     def createInstance(self):
         return GenerateTransectsAlgorithm()
 
-    def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+    def run_stage(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
         river_layer = self.parameterAsSource(parameters, self.RIVER_LAYER, context)
         river_vector_layer = self.parameterAsVectorLayer(parameters, self.RIVER_LAYER, context)
         lines_layer = self.parameterAsSource(parameters, self.LINE_LAYER, context)
+        lines_vector_layer = self.parameterAsVectorLayer(parameters, self.LINE_LAYER, context)
         extension_increment = self.parameterAsInt(parameters, self.EXTENSION_INCREMENT, context)
         max_length = self.parameterAsInt(parameters, self.MAX_LENGTH, context)
-
-        # Add t_ID field to river layer
-        if river_vector_layer is not None:
-            if not river_vector_layer.fields().indexFromName("t_ID") >= 0:
-                river_vector_layer.startEditing()
-                river_vector_layer.dataProvider().addAttributes([QgsField("t_ID", QVariant.Int)])
-                river_vector_layer.updateFields()
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
+        ray_casting = self.parameterAsBool(parameters, self.RAY_CASTING, context)
 
         # Output fields
         river_fields = QgsFields()
@@ -100,82 +121,148 @@ class GenerateTransectsAlgorithm(QgsProcessingAlgorithm):
             parameters, self.CENTER_POINTS, context,
             center_fields, QgsWkbTypes.Point, river_layer.sourceCrs()
         )
+        (intersection_sink, intersection_dest_id) = self.parameterAsSink(
+            parameters, self.INTERSECTIONS, context,
+            intersection_fields(), QgsWkbTypes.Point, river_layer.sourceCrs()
+        )
+        # Intersections of the incremental search: (t_ID, half, rank, distance, x, y)
+        incremental_hits = []
+        # Tags the side table with the valley lines it was computed from
+        lines_sig = signature_digest(lines_vector_layer) if intersection_sink is not None else None
 
-        lines_index = QgsSpatialIndex(lines_layer.getFeatures())
+        # Features are buffered and written in FastInsert batches
+        transect_writer = BatchedSink(transect_sink)
+        center_writer = BatchedSink(center_sink)
+
+        profiler = Profiler(self.name(), feedback)
+
+        with profiler.phase("valley line index") as p:
+            if ray_casting:
+                segments, grid = build_valley_index(lines_layer, layer=lines_vector_layer)
+                p["count"] = len(segments)
+            else:
+                lines_index = QgsSpatialIndex(lines_layer.getFeatures())
         feature_count = river_layer.featureCount()
 
-        for i, river_feature in enumerate(river_layer.getFeatures()):
-            if feedback.isCanceled():
-                break
-
-            if feature_count > 0:
-                feedback.setProgress(int(i / feature_count * 100))
-
-            river_geom = river_feature.geometry()
-            if river_geom is None or river_geom.isNull():
-                continue
-
-            midpoint = river_geom.interpolate(river_geom.length() / 2).asPoint()
-            center_distance = river_geom.length() / 2
-            delta = min(500, center_distance - 1)
-            pt_before = river_geom.interpolate(center_distance - delta).asPoint()
-            pt_after = river_geom.interpolate(center_distance + delta).asPoint()
-            perpendicular_angle = self.calculate_perpendicular_angle(pt_before, pt_after)
-
-            # LEFT
-            left_geom, left_intersections = self.extend_until_intersections(
-                midpoint, perpendicular_angle, lines_layer, lines_index, -1, extension_increment, max_length
-            )
-            # RIGHT
-            right_geom, right_intersections = self.extend_until_intersections(
-                midpoint, perpendicular_angle, lines_layer, lines_index, 1, extension_increment, max_length
-            )
-
-            if len(left_intersections) >= 2 and len(right_intersections) >= 2:
-                full_transect = QgsGeometry.fromPolylineXY(
-                    left_geom.asPolyline() + right_geom.asPolyline()[1:]
-                )
+        river_t_ids = {}
+
+        def emit(t_id, river_fid, midpoint, left_geom, right_geom, left_n, right_n):
+            full_transect = join_half_transects(left_geom, right_geom)
+
+            # Create transect feature
+            t_feat = QgsFeature()
+            t_feat.setGeometry(full_transect)
+            t_feat.setAttributes([t_id, left_n, right_n])
+            transect_writer.add(t_feat)
+
+            # Create center point feature
+            c_feat = QgsFeature()
+            c_feat.setGeometry(QgsGeometry.fromPointXY(midpoint))
+            c_feat.setAttributes([t_id])
+            center_writer.add(c_feat)
+
+            # River feature t_IDs, written to the layer at the end
+            river_t_ids[river_fid] = t_id
+
+        # Segments waiting for the batched ray cast: (t_ID, river fid, midpoint, angle)
+        pending = []
+
+        with profiler.phase("transect origins" if ray_casting else "incremental extension", feature_count):
+            for i, river_feature in enumerate(river_layer.getFeatures()):
+                if feedback.isCanceled():
+                    break
+
+                if feature_count > 0:
+                    feedback.setProgress(int(i / feature_count * 100))
+
+                river_geom = river_feature.geometry()
+                if river_geom is None or river_geom.isNull():
+                    continue
+
+                midpoint, perpendicular_angle = transect_origin(river_geom)
 
                 t_id = i  # ✅ Assign unique ID
 
-                # Create transect feature
-                t_feat = QgsFeature()
-                t_feat.setGeometry(full_transect)
-                t_feat.setAttributes([t_id, len(left_intersections), len(right_intersections)])
-                transect_sink.addFeature(t_feat, QgsFeatureSink.FastInsert)
-
-                # Create center point feature
-                c_feat = QgsFeature()
-                c_feat.setGeometry(QgsGeometry.fromPointXY(midpoint))
-                c_feat.setAttributes([t_id])
-                center_sink.addFeature(c_feat, QgsFeatureSink.FastInsert)
-
-                # ✅ Update river feature with t_ID
-                if river_vector_layer is not None:
-                    river_fid = river_feature.id()
-                    field_index = river_vector_layer.fields().indexFromName("t_ID")
-                    if field_index != -1:
-                        river_vector_layer.changeAttributeValue(river_fid, field_index, t_id)
-
-        # ✅ Commit river layer edits
-        if river_vector_layer is not None and river_vector_layer.isEditable():
-            river_vector_layer.commitChanges()
-
-        return {
+                if ray_casting:
+                    pending.append((t_id, river_feature.id(), midpoint, perpendicular_angle))
+                    continue
+
+                # LEFT
+                left_geom, left_intersections = self.extend_until_intersections(
+                    midpoint, perpendicular_angle, lines_layer, lines_index, -1, extension_increment, max_length
+                )
+                # RIGHT
+                right_geom, right_intersections = self.extend_until_intersections(
+                    midpoint, perpendicular_angle, lines_layer, lines_index, 1, extension_increment, max_length
+                )
+
+                if len(left_intersections) >= 2 and len(right_intersections) >= 2:
+                    emit(t_id, river_feature.id(), midpoint, left_geom, right_geom,
+                         len(left_intersections), len(right_intersections))
+                    if intersection_sink is not None:
+                        for half, points in ((-1, left_intersections), (1, right_intersections)):
+                            ranked = sorted(points, key=midpoint.distance)
+                            incremental_hits.extend(
+                                (t_id, half, rank, midpoint.distance(pt), pt.x(), pt.y())
+                                for rank, pt in enumerate(ranked, start=1)
+                            )
+
+        if pending and not feedback.isCanceled():
+            midpoints = [p[2] for p in pending]
+            angles = [p[3] for p in pending]
+            with profiler.phase("ray casting", 2 * len(pending)):
+                lengths, counts, *hits = cast_transects(
+                    midpoints, angles, segments, grid, extension_increment, max_length, feedback,
+                    workers=workers, hits=intersection_sink is not None
+                )
+            with profiler.phase("build transects", len(pending)):
+                for k, (t_id, river_fid, midpoint, angle) in enumerate(pending):
+                    left_n, right_n = int(counts[2 * k]), int(counts[2 * k + 1])
+                    if left_n >= 2 and right_n >= 2:
+                        left_geom = build_half_transect(midpoint, angle, -1, lengths[2 * k])
+                        right_geom = build_half_transect(midpoint, angle, 1, lengths[2 * k + 1])
+                        emit(t_id, river_fid, midpoint, left_geom, right_geom, left_n, right_n)
+
+            if hits:
+                with profiler.phase("intersection side table") as p:
+                    owner, half, rank, distance, xs, ys = transect_hits(
+                        hits[0], segments, [m.x() for m in midpoints], [m.y() for m in midpoints], angles,
+                        keep=(counts[0::2] >= 2) & (counts[1::2] >= 2)
+                    )
+                    t_ids = [q[0] for q in pending]
+                    p["count"] = write_features(
+                        intersection_sink,
+                        intersection_features([t_ids[k] for k in owner.tolist()], half, rank, distance, xs, ys, lines_sig),
+                        feedback=feedback
+                    )
+
+        if incremental_hits:
+            with profiler.phase("intersection side table") as p:
+                p["count"] = write_features(
+                    intersection_sink, intersection_features(*map(list, zip(*incremental_hits)), lines_sig), feedback=feedback
+                )
+
+        transect_writer.flush()
+        center_writer.flush()
+        profiler.record("sink writes", transect_writer.seconds + center_writer.seconds,
+                        transect_writer.count + center_writer.count)
+
+        # ✅ Tag the river network with t_ID
+        if river_vector_layer is not None and not tag_river_layer(river_vector_layer, river_t_ids):
+            feedback.pushWarning("t_ID could not be written to the river layer")
+
+        profiler.report()
+
+        results = {
             self.TRANSECTS: transect_dest_id,
             self.CENTER_POINTS: center_dest_id
         }
+        if intersection_sink is not None:
+            results[self.INTERSECTIONS] = intersection_dest_id
+        return results
 
 
 
-    def calculate_perpendicular_angle(self, line_start, line_end):
-        dx = line_end.x() - line_start.x()
-        dy = line_end.y() - line_start.y()
-        angle = math.atan2(dy, dx) * 180 / math.pi
-        if angle < 0:
-            angle += 360
-        return angle + 90
-
     def find_intersections(self, transect_line, spatial_index, lines_layer, tolerance=1e-8):
         candidate_ids = spatial_index.intersects(transect_line.boundingBox())
         intersections = []
@@ -216,13 +303,7 @@ class GenerateTransectsAlgorithm(QgsProcessingAlgorithm):
 
         while len(intersections) < 2 and length < max_length:
             length += increment
-            dx = math.cos(math.radians(angle)) * length
-            dy = math.sin(math.radians(angle)) * length
-            endpoint = QgsPointXY(midpoint.x() + direction * dx, midpoint.y() + direction * dy)
-            if direction == -1:
-                transect = QgsGeometry.fromPolylineXY([endpoint, midpoint])
-            else:
-                transect = QgsGeometry.fromPolylineXY([midpoint, endpoint])
+            transect = build_half_transect(midpoint, angle, direction, length)
             new_pts = self.find_intersections(transect, spatial_index, lines_layer)
             intersections.extend([i for i in new_pts if i not in intersections])
             geom = transect
@@ -0,0 +1,107 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from qgis.core import (
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterRasterDestination,
+    QgsProcessingParameterRasterLayer,
+    QgsProcessingContext,
+    QgsProcessingFeedback
+)
+from qgis.core import QgsProcessing
+import math
+
+from ..core.rem import tile_windows, compute_rem
+from ..raster_sampler import RasterSampler
+from ..relative_elevation import channel_seeds, read_tile, RemWriter
+from ..profiling import Profiler
+from ..stage_cache import CachedAlgorithm
+
+
+class RelativeElevationAlgorithm(CachedAlgorithm):
+    RIVER_LAYER = 'RIVER_LAYER'
+    ELEVATION = 'ELEVATION'
+    SEARCH_RADIUS = 'SEARCH_RADIUS'
+    TILE_SIZE = 'TILE_SIZE'
+    WORKERS = 'WORKERS'
+    OUTPUT = 'OUTPUT'
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.RIVER_LAYER, "River Network Layer", [QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterRasterLayer(self.ELEVATION, "Elevation Raster Layer"))
+        self.addParameter(QgsProcessingParameterNumber(self.SEARCH_RADIUS, "Search radius around channels (map units)", type=QgsProcessingParameterNumber.Double, defaultValue=1000, minValue=0.01))
+        self.addParameter(QgsProcessingParameterNumber(self.TILE_SIZE, "Tile size (pixels)", type=QgsProcessingParameterNumber.Integer, defaultValue=1024, minValue=64))
+        self.addParameter(QgsProcessingParameterNumber(self.WORKERS, "Worker processes (1 = single process, 0 = all CPU cores)", type=QgsProcessingParameterNumber.Integer, defaultValue=1, minValue=0))
+        self.addParameter(QgsProcessingParameterRasterDestination(self.OUTPUT, "Relative Elevation Model"))
+
+    def name(self):
+        return "relative_elevation_model"
+
+    def displayName(self):
+        return "Relative Elevation Model (REM)"
+
+    def group(self):
+        return "Preprocessing"
+
+    def groupId(self):
+        return "preprocessing"
+
+    def createInstance(self):
+        return RelativeElevationAlgorithm()
+
+    def cacheable(self, parameters, context):
+        # The REM is a raster output, which the stage cache does not record
+        return False
+
+    def run_stage(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+        river_source = self.parameterAsSource(parameters, self.RIVER_LAYER, context)
+        raster = self.parameterAsRasterLayer(parameters, self.ELEVATION, context)
+        radius = self.parameterAsDouble(parameters, self.SEARCH_RADIUS, context)
+        tile_size = self.parameterAsInt(parameters, self.TILE_SIZE, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
+        path = self.parameterAsOutputLayer(parameters, self.OUTPUT, context)
+
+        profiler = Profiler(self.name(), feedback)
+        sampler = RasterSampler(raster)
+        halo = int(math.ceil(radius / min(sampler.x_res, sampler.y_res)))
+
+        # Channel pixels and their elevations
+        with profiler.phase("channel seeds") as p:
+            seeds = channel_seeds(river_source, sampler, tile_size)
+            p["count"] = len(seeds.z)
+        feedback.pushInfo(
+            f"REM: {len(seeds.z)} channel pixels, {sampler.width}x{sampler.height} pixels in "
+            f"{tile_size}-pixel tiles with a {halo}-pixel halo"
+        )
+        if feedback.isCanceled():
+            return {}
+
+        # Height above the nearest channel pixel, tile by tile
+        writer = RemWriter(path, raster, sampler)
+        with profiler.phase("REM tiles", sampler.width * sampler.height):
+            compute_rem(
+                list(tile_windows(sampler.width, sampler.height, tile_size)),
+                lambda window: read_tile(sampler, window), seeds, halo, radius,
+                sampler.x_res, sampler.y_res, writer.write, workers,
+                is_canceled=feedback.isCanceled,
+                progress=lambda fraction: feedback.setProgress(int(100 * fraction)),
+                on_fallback=feedback.pushWarning
+            )
+        writer.close()
+
+        profiler.report()
+        return {self.OUTPUT: path}
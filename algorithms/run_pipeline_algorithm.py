@@ -0,0 +1,359 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from qgis.core import (
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterRasterLayer,
+    QgsProcessingParameterVectorLayer,
+    QgsProcessingParameterField,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingContext,
+    QgsProcessingFeedback,
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsWkbTypes
+)
+from qgis.core import QgsProcessing
+from PyQt5.QtCore import QVariant
+import numpy as np
+
+from ..generate_transects import (
+    transect_origin,
+    build_half_transect,
+    join_half_transects,
+    cast_transects,
+    tag_river_layer
+)
+from ..valley_lines import build_valley_index
+from ..core.transects import transect_hits
+from ..raster_sampler import sample_raster
+from ..extract_point_data import polygon_attribute_at
+from ..extract_valley_width import (
+    classify_intersections,
+    compute_valley_width
+)
+from ..extract_side_slopes import calculate_side_slopes_from_pairs
+from ..extract_dvs_sinuosity import stream_lines, assign_dvs_sinuosity
+from ..core.segment_table import SegmentTable
+from ..segment_layers import table_features
+from ..feature_sink import write_features
+from ..profiling import Profiler
+from ..stage_cache import CachedAlgorithm
+from ..core.result_store import ResultStore
+from ..core.fingerprint import transect_context
+from .. import incremental
+from ..sources import source_signature
+
+
+class RunPipelineAlgorithm(CachedAlgorithm):
+    RIVER_LAYER = 'RIVER_LAYER'
+    LINE_LAYER = 'LINE_LAYER'
+    EXTENSION_INCREMENT = 'EXTENSION_INCREMENT'
+    MAX_LENGTH = 'MAX_LENGTH'
+    WORKERS = 'WORKERS'
+    ELEVATION = 'ELEVATION'
+    PRECIPITATION = 'PRECIPITATION'
+    POLYGONS = 'POLYGONS'
+    POLY_FIELD = 'POLY_FIELD'
+    GEO_RESOLUTION = 'GEO_RESOLUTION'
+    TRANSECTS = 'TRANSECTS'
+    OUTPUT = 'OUTPUT'
+    STORE = 'STORE'
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.RIVER_LAYER, "River Network Layer", [QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterFeatureSource(self.LINE_LAYER, "Valley Lines Layer", [QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterNumber(self.EXTENSION_INCREMENT, "Extension Increment (m)", defaultValue=250))
+        self.addParameter(QgsProcessingParameterNumber(self.MAX_LENGTH, "Max Length (m)", defaultValue=50000))
+        self.addParameter(QgsProcessingParameterNumber(self.WORKERS, "Worker processes for ray casting (1 = single process, 0 = all CPU cores)", type=QgsProcessingParameterNumber.Integer, defaultValue=1, minValue=0))
+        self.addParameter(QgsProcessingParameterRasterLayer(self.ELEVATION, "Elevation Raster Layer (for 'ELE', 'LVS', 'RVS', 'DVS')"))
+        self.addParameter(QgsProcessingParameterRasterLayer(self.PRECIPITATION, "Precipitation Raster Layer (for 'PRE')"))
+        self.addParameter(QgsProcessingParameterVectorLayer(self.POLYGONS, "Geology Polygon Layer (for 'GEO')", [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterField(self.POLY_FIELD, "Geology Attribute Field", parentLayerParameterName=self.POLYGONS))
+        self.addParameter(QgsProcessingParameterNumber(self.GEO_RESOLUTION, "Geology grid resolution (map units; 0 = prepared polygons, same GEO values)", type=QgsProcessingParameterNumber.Double, defaultValue=0, minValue=0))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.TRANSECTS, "Transects"))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, "[0] OpenRES Extraction Output"))
+        self.addParameter(QgsProcessingParameterFileDestination(
+            self.STORE, "Results store for incremental re-extraction (optional)",
+            fileFilter="SQLite files (*.sqlite)", optional=True, createByDefault=False
+        ))
+        self.addParameter(QgsProcessingParameterBoolean(self.BYPASS_CACHE, "Bypass the stage result cache (always recompute)", defaultValue=False))
+
+    def name(self):
+        return "run_pipeline"
+
+    def displayName(self):
+        return "[0] Run full OpenRES pipeline"
+
+    def group(self):
+        return "Feature Extraction"
+
+    def groupId(self):
+        return "feature_extraction"
+
+    def createInstance(self):
+        return RunPipelineAlgorithm()
+
+    def shortHelpString(self):
+        return (
+            "Runs steps [1] to [5] in one pass and writes the nine OpenRES features "
+            "(ELE, PRE, GEO, VFW, VW, LVS, RVS, DVS, SIN) for every segment center. "
+            "The river network, valley line index and rasters are loaded once and no "
+            "intermediate layers are written. Results match running the five steps in order.\n\n"
+            "With a results store, segments whose geometry and crossed valley lines are "
+            "unchanged since the last run with the same store, rasters, geology and "
+            "parameters are not recomputed, and t_IDs stay stable across edits."
+        )
+
+    def cacheable(self, parameters, context):
+        # Incremental runs reuse results through their own store
+        return super().cacheable(parameters, context) and not self.parameterAsFileOutput(parameters, self.STORE, context)
+
+    def run_stage(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+        river_layer = self.parameterAsSource(parameters, self.RIVER_LAYER, context)
+        river_vector_layer = self.parameterAsVectorLayer(parameters, self.RIVER_LAYER, context)
+        lines_layer = self.parameterAsSource(parameters, self.LINE_LAYER, context)
+        lines_vector_layer = self.parameterAsVectorLayer(parameters, self.LINE_LAYER, context)
+        extension_increment = self.parameterAsInt(parameters, self.EXTENSION_INCREMENT, context)
+        max_length = self.parameterAsInt(parameters, self.MAX_LENGTH, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
+        elevation = self.parameterAsRasterLayer(parameters, self.ELEVATION, context)
+        precipitation = self.parameterAsRasterLayer(parameters, self.PRECIPITATION, context)
+        polygons = self.parameterAsVectorLayer(parameters, self.POLYGONS, context)
+        poly_field = self.parameterAsString(parameters, self.POLY_FIELD, context)
+        geo_resolution = self.parameterAsDouble(parameters, self.GEO_RESOLUTION, context)
+        store_path = self.parameterAsFileOutput(parameters, self.STORE, context)
+
+        profiler = Profiler(self.name(), feedback)
+
+        # [1] Transects ---------------------------------------------------
+        feedback.setProgressText("[1] Generating transects")
+        with profiler.phase("[1] transect origins") as p:
+            rivers = []
+            for i, river_feature in enumerate(river_layer.getFeatures()):
+                river_geom = river_feature.geometry()
+                if river_geom is None or river_geom.isNull():
+                    continue
+                midpoint, angle = transect_origin(river_geom)
+                rivers.append((i, river_feature.id(), river_geom, midpoint, angle))
+            p["count"] = len(rivers)
+        if feedback.isCanceled():
+            return {}
+
+        with profiler.phase("[1] valley line index") as p:
+            segments, grid = build_valley_index(lines_layer, layer=lines_vector_layer)
+            p["count"] = len(segments)
+
+        # Incremental mode: stable t_IDs from the store, and only segments
+        # changed since the last run (or crossing edited valley lines) are
+        # recomputed below
+        clean = np.zeros(len(rivers), dtype=bool)
+        if store_path:
+            key = incremental.run_key({
+                "extension_increment": extension_increment,
+                "max_length": max_length,
+                "elevation": source_signature(elevation),
+                "precipitation": source_signature(precipitation),
+                "geology": source_signature(polygons),
+                "poly_field": poly_field,
+                "geo_resolution": geo_resolution
+            })
+            with profiler.phase("[0] change detection", len(rivers)):
+                fingerprints = incremental.segment_fingerprints([r[2] for r in rivers])
+                with ResultStore(store_path) as store:
+                    t_ids = store.assign_ids(fingerprints)
+                    stored = store.load(fingerprints) if store.run_key == key else {}
+                rivers = [(int(t_id),) + r[1:] for t_id, r in zip(t_ids, rivers)]
+                clean = incremental.clean_segments(
+                    stored, fingerprints, [r[3] for r in rivers], [r[4] for r in rivers], segments, grid
+                )
+            feedback.pushInfo(
+                f"Results store: {int(clean.sum())} of {len(rivers)} segments unchanged, "
+                f"{len(rivers) - int(clean.sum())} to compute"
+            )
+        dirty = [r for r, c in zip(rivers, clean) if not c]
+
+        with profiler.phase("[1] ray casting", 2 * len(dirty)):
+            lengths, counts, ray_hits = cast_transects(
+                [r[3] for r in dirty], [r[4] for r in dirty], segments, grid,
+                extension_increment, max_length, feedback, workers=workers, hits=True
+            )
+
+        # Segments with a valid transect: (t_ID, river fid, river geom, center, transect, left_n, right_n)
+        with profiler.phase("[1] build transects", len(dirty)):
+            records = []
+            for k, (t_id, river_fid, river_geom, midpoint, angle) in enumerate(dirty):
+                left_n, right_n = int(counts[2 * k]), int(counts[2 * k + 1])
+                if left_n >= 2 and right_n >= 2:
+                    transect = join_half_transects(
+                        build_half_transect(midpoint, angle, -1, lengths[2 * k]),
+                        build_half_transect(midpoint, angle, 1, lengths[2 * k + 1])
+                    )
+                    records.append((t_id, river_fid, river_geom, midpoint, transect, left_n, right_n))
+        feedback.setProgress(20)
+        if feedback.isCanceled():
+            return {}
+
+        # Columnar table of segment centers; every stage writes its columns here
+        centers = SegmentTable(
+            [r[0] for r in records],
+            [r[3].x() for r in records],
+            [r[3].y() for r in records]
+        )
+        centers["t_ID"] = centers.t_id
+
+        # [2] Point data ---------------------------------------------------
+        feedback.setProgressText("[2] Extracting ELE, PRE and GEO")
+        for name, raster in [("ELE", elevation), ("PRE", precipitation)]:
+            with profiler.phase(f"[2] raster sampling {name}", len(centers)):
+                values = sample_raster(raster, centers.x, centers.y)
+                centers[name] = np.where(np.isnan(values), -9999, values)
+        with profiler.phase("[2] geology lookup", len(centers)):
+            geo = np.empty(len(centers), dtype=object)
+            geo[:] = polygon_attribute_at(polygons, poly_field, centers.x, centers.y, geo_resolution)
+            centers["GEO"] = geo
+        feedback.setProgress(35)
+        if feedback.isCanceled():
+            return {}
+
+        # [3] Valley floor width and valley width --------------------------
+        feedback.setProgressText("[3] Extracting VW and VFW")
+        # The ray cast of [1] already found every intersection of the transects
+        with profiler.phase("[3] intersections", len(records)):
+            valid = (counts[0::2] >= 2) & (counts[1::2] >= 2)
+            owner, _, _, _, hit_x, hit_y = transect_hits(
+                ray_hits, segments, [r[3].x() for r in dirty], [r[3].y() for r in dirty], [r[4] for r in dirty],
+                keep=valid
+            )
+            hits = (np.cumsum(valid)[owner] - 1, hit_x, hit_y)
+        with profiler.phase("[3] intersection classification", len(records)):
+            left1, left2, right1, right2 = classify_intersections(
+                *hits, [r[0] for r in records], [r[4] for r in records], [r[2] for r in records]
+            )
+            compute_valley_width(centers, left1, right1, out_field="VFW")
+            compute_valley_width(centers, left2, right2, out_field="VW")
+        feedback.setProgress(60)
+        if feedback.isCanceled():
+            return {}
+
+        # [4] Side slopes; DEM blocks come from the shared tile cache --------
+        feedback.setProgressText("[4] Extracting LVS and RVS")
+        with profiler.phase("[4] side slopes (raster sampling)", len(left2) + len(right2)):
+            calculate_side_slopes_from_pairs(centers, left2, left1, right2, right1, elevation)
+        feedback.setProgress(75)
+        if feedback.isCanceled():
+            return {}
+
+        # [5] Down valley slope and sinuosity --------------------------------
+        feedback.setProgressText("[5] Extracting DVS and SIN")
+        with profiler.phase("[5] DVS and SIN", len(records)):
+            lines = stream_lines(r[2] for r in records)
+            x0, y0, x1, y1 = lines.endpoints()
+            lengths_along = lines.lengths()
+            rows = np.flatnonzero(~np.isnan(x0))
+            elevations = sample_raster(elevation, np.concatenate([x0[rows], x1[rows]]),
+                                       np.concatenate([y0[rows], y1[rows]]))
+            assign_dvs_sinuosity(
+                centers, centers.t_id[rows], x0[rows], y0[rows], x1[rows], y1[rows],
+                lengths_along[rows], elevations[:len(rows)], elevations[len(rows):]
+            )
+        feedback.setProgress(90)
+
+        # Save the recomputed segments and merge in the reused ones
+        if store_path:
+            with profiler.phase("[0] results store", len(rivers)):
+                contexts = transect_context(
+                    [r[3].x() for r in dirty], [r[3].y() for r in dirty], [r[4] for r in dirty],
+                    lengths[0::2], lengths[1::2], segments, grid
+                )
+                dirty_fingerprints = [fp for fp, c in zip(fingerprints, clean) if not c]
+                with ResultStore(store_path) as store:
+                    store.save(
+                        key,
+                        incremental.result_rows(dirty_fingerprints, [r[0] for r in dirty], lengths, counts, contexts, centers),
+                        fingerprints
+                    )
+                reused, reused_rows = [], []
+                for r, fp, c in zip(rivers, fingerprints, clean):
+                    row = stored.get(fp) if c else None
+                    if row is None or row["left_n"] < 2 or row["right_n"] < 2:
+                        continue
+                    t_id, river_fid, river_geom, midpoint, angle = r
+                    transect = join_half_transects(
+                        build_half_transect(midpoint, angle, -1, row["left_length"]),
+                        build_half_transect(midpoint, angle, 1, row["right_length"])
+                    )
+                    reused.append((t_id, river_fid, river_geom, midpoint, transect, row["left_n"], row["right_n"]))
+                    reused_rows.append(row)
+                centers = incremental.merge_stored(
+                    centers, reused_rows, [r[3].x() for r in reused], [r[3].y() for r in reused]
+                )
+                records = sorted(records + reused, key=lambda r: r[0])
+
+        # Output -----------------------------------------------------------
+        feedback.setProgressText("Writing output")
+        transect_fields = QgsFields()
+        transect_fields.append(QgsField("t_ID", QVariant.Int))
+        transect_fields.append(QgsField("left_n", QVariant.Int))
+        transect_fields.append(QgsField("right_n", QVariant.Int))
+
+        out_fields = QgsFields()
+        out_fields.append(QgsField("t_ID", QVariant.Int))
+        for name in ["ELE", "PRE"]:
+            out_fields.append(QgsField(name, QVariant.Double))
+        out_fields.append(QgsField("GEO", QVariant.String))
+        for name in ["VFW", "VW", "LVS", "RVS", "DVS", "SIN"]:
+            out_fields.append(QgsField(name, QVariant.Double))
+
+        (transect_sink, transect_dest_id) = self.parameterAsSink(
+            parameters, self.TRANSECTS, context,
+            transect_fields, QgsWkbTypes.MultiLineString, river_layer.sourceCrs()
+        )
+        (out_sink, out_dest_id) = self.parameterAsSink(
+            parameters, self.OUTPUT, context,
+            out_fields, QgsWkbTypes.Point, river_layer.sourceCrs()
+        )
+
+        def transect_features():
+            for t_id, river_fid, river_geom, midpoint, transect, left_n, right_n in records:
+                t_feat = QgsFeature(transect_fields)
+                t_feat.setGeometry(transect)
+                t_feat.setAttributes([t_id, left_n, right_n])
+                yield t_feat
+
+        with profiler.phase("sink writes") as p:
+            p["count"] = write_features(transect_sink, transect_features(), feedback=feedback)
+            p["count"] += write_features(out_sink, table_features(centers, out_fields), feedback=feedback)
+
+        # Tag the river network with t_ID, as step [1] does
+        if river_vector_layer is not None and not tag_river_layer(river_vector_layer, {r[1]: r[0] for r in records}):
+            feedback.pushWarning("t_ID could not be written to the river layer")
+
+        feedback.setProgress(100)
+        profiler.report()
+        results = {
+            self.TRANSECTS: transect_dest_id,
+            self.OUTPUT: out_dest_id
+        }
+        if store_path:
+            results[self.STORE] = store_path
+        return results
@@ -0,0 +1,399 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Batch runner for OpenRES over many watersheds.
+
+Runs [0] Run full OpenRES pipeline (steps [1]-[5]) for every basin of a
+manifest, several basins at a time in worker processes, each with its own
+headless QGIS session. Run it with the QGIS Python interpreter and the
+plugins folder on PYTHONPATH:
+
+    python -m OpenRES.batch basins.csv --out-dir results --jobs 4
+
+The manifest is a CSV (one row per basin) or a JSON list of objects with the
+columns in MANIFEST_COLUMNS; relative paths are resolved against the
+manifest's folder. Every basin gets a folder under --out-dir with the
+transects, the segment centers (GeoPackage and CSV), a log and result.json.
+combined.csv stacks the segment tables of all basins and batch_summary.csv /
+batch_summary.json list status and timing per basin. A failing basin is
+recorded and the batch carries on.
+"""
+
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from .core.parallel import python_executable
+
+# Required manifest columns; geometry inputs are file paths
+MANIFEST_COLUMNS = ["basin", "rivers", "valley_lines", "elevation", "precipitation", "geology", "geology_field"]
+
+# Optional per-basin overrides of the batch options
+OPTION_COLUMNS = {"extension_increment": float, "max_length": float, "geo_resolution": float}
+
+PATH_COLUMNS = ["rivers", "valley_lines", "elevation", "precipitation", "geology"]
+
+SUMMARY_FIELDS = ["basin", "status", "seconds", "segments", "transects", "error", "out_dir"]
+
+# A basin whose worker process dies is retried this many times in a new pool
+MAX_ATTEMPTS = 2
+
+# Present in a basin folder while its run is in progress; left behind by a
+# worker process that dies, which identifies the basins a broken pool was running
+RUNNING_MARKER = "running"
+
+
+# --- Manifest ---
+def read_manifest(path):
+    """
+    Read a basin manifest (CSV or JSON).
+
+    Returns:
+        list: One dict per basin with absolute input paths.
+
+    Raises:
+        ValueError: On missing columns, empty or duplicate basin names.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    if path.lower().endswith(".json"):
+        with open(path) as f:
+            rows = json.load(f)
+    else:
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    basins, seen = [], set()
+    for n, row in enumerate(rows, start=1):
+        missing = [c for c in MANIFEST_COLUMNS if not str(row.get(c) or "").strip()]
+        if missing:
+            raise ValueError(f"Manifest row {n}: missing {', '.join(missing)}")
+        basin = {c: str(row[c]).strip() for c in MANIFEST_COLUMNS}
+        if any(sep in basin["basin"] for sep in ("/", "\\")) or basin["basin"] in (".", ".."):
+            raise ValueError(f"Manifest row {n}: basin name {basin['basin']!r} is not a valid folder name")
+        if basin["basin"] in seen:
+            raise ValueError(f"Manifest row {n}: duplicate basin {basin['basin']!r}")
+        seen.add(basin["basin"])
+        for column in PATH_COLUMNS:
+            basin[column] = os.path.join(base, os.path.expanduser(basin[column]))
+        for column, cast in OPTION_COLUMNS.items():
+            if str(row.get(column) or "").strip():
+                basin[column] = cast(row[column])
+        basins.append(basin)
+    return basins
+
+
+def _copy_vector(source, directory):
+    """
+    Copy a vector file (with shapefile sidecars) into `directory`.
+
+    Returns:
+        str: Path of the copy, keeping any "|layername=..." suffix.
+    """
+    path, _, suffix = source.partition("|")
+    stem = os.path.splitext(path)[0]
+    sources = glob.glob(glob.escape(stem) + ".*") if path.lower().endswith(".shp") else [path]
+    for file in sources:
+        shutil.copy(file, directory)
+    copy = os.path.join(directory, os.path.basename(path))
+    return f"{copy}|{suffix}" if suffix else copy
+
+
+# --- One basin (runs in a worker process) ---
+def _init_worker():
+    from . import headless
+    headless.start_qgis()
+
+
+def _write_csv(layer_path, csv_path):
+    from qgis.core import NULL, QgsVectorLayer
+
+    layer = QgsVectorLayer(layer_path, "segments", "ogr")
+    if not layer.isValid():
+        return 0
+    names = layer.fields().names()
+    count = 0
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(names + ["x", "y"])
+        for feature in layer.getFeatures():
+            point = feature.geometry().asPoint()
+            values = ["" if v is None or v == NULL else v for v in feature.attributes()]
+            writer.writerow(values + [point.x(), point.y()])
+            count += 1
+    return count
+
+
+def run_basin(basin, out_root, options):
+    """
+    Run the full pipeline for one basin.
+
+    The river layer is copied into the basin folder first, since the
+    pipeline writes t_ID into it. Errors are caught and recorded.
+
+    Returns:
+        dict: Result record (also written to <basin folder>/result.json).
+    """
+    from . import headless, profiling
+
+    out_dir = os.path.join(out_root, basin["basin"])
+    os.makedirs(out_dir, exist_ok=True)
+    open(os.path.join(out_dir, RUNNING_MARKER), "w").close()
+    record = {"basin": basin["basin"], "status": "ok", "seconds": None, "segments": None,
+              "transects": None, "error": None, "out_dir": out_dir, "phases": None}
+
+    t0 = time.perf_counter()
+    with open(os.path.join(out_dir, "openres.log"), "w") as log:
+        feedback = headless.LogFeedback(log)
+        try:
+            parameters = {
+                "RIVER_LAYER": _copy_vector(basin["rivers"], out_dir),
+                "LINE_LAYER": basin["valley_lines"],
+                "EXTENSION_INCREMENT": basin.get("extension_increment", options["extension_increment"]),
+                "MAX_LENGTH": basin.get("max_length", options["max_length"]),
+                "WORKERS": options["ray_workers"],
+                "ELEVATION": basin["elevation"],
+                "PRECIPITATION": basin["precipitation"],
+                "POLYGONS": basin["geology"],
+                "POLY_FIELD": basin["geology_field"],
+                "GEO_RESOLUTION": basin.get("geo_resolution", options["geo_resolution"]),
+                "TRANSECTS": os.path.join(out_dir, "transects.gpkg"),
+                "OUTPUT": os.path.join(out_dir, "segments.gpkg"),
+            }
+            profiling.PROFILE_DIR = os.path.join(out_dir, "profile")
+            headless.run_algorithm("run_pipeline", parameters, feedback)
+            record["segments"] = _write_csv(parameters["OUTPUT"], os.path.join(out_dir, "segments.csv"))
+            record["transects"] = _feature_count(parameters["TRANSECTS"])
+            profiles = sorted(glob.glob(os.path.join(profiling.PROFILE_DIR, "*.json")))
+            if profiles:
+                with open(profiles[-1]) as f:
+                    record["phases"] = json.load(f)["phases"]
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = str(e) or type(e).__name__
+            traceback.print_exc(file=log)
+
+    record["seconds"] = round(time.perf_counter() - t0, 3)
+    with open(os.path.join(out_dir, "result.json"), "w") as f:
+        json.dump(record, f, indent=2)
+    os.remove(os.path.join(out_dir, RUNNING_MARKER))
+    return record
+
+
+def _feature_count(path):
+    from qgis.core import QgsVectorLayer
+
+    layer = QgsVectorLayer(path, "count", "ogr")
+    return layer.featureCount() if layer.isValid() else None
+
+
+# --- Batch ---
+def _failed(basin, out_root, error):
+    return {"basin": basin["basin"], "status": "failed", "seconds": None, "segments": None,
+            "transects": None, "error": error, "out_dir": os.path.join(out_root, basin["basin"]),
+            "phases": None}
+
+
+def _started(basin, out_root):
+    return os.path.exists(os.path.join(out_root, basin["basin"], RUNNING_MARKER))
+
+
+def _clear_started(basin, out_root):
+    path = os.path.join(out_root, basin["basin"], RUNNING_MARKER)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _run_alone(basin, out_root, options, context):
+    """
+    Run one basin in a pool of its own, so that a dead worker process can
+    only be its own. Raises BrokenProcessPool if it dies.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker) as executor:
+        return executor.submit(run_basin, basin, out_root, options).result()
+
+
+def run_batch(basins, out_root, options, jobs=1, report=print):
+    """
+    Run every basin and collect their result records.
+
+    Parameters:
+        basins (list): Basins from read_manifest.
+        out_root (str): Output folder.
+        options (dict): extension_increment, max_length, geo_resolution and
+            ray_workers (WORKERS of the pipeline).
+        jobs (int): Basins run at once; 1 runs them in this process.
+        report (callable): Called with one progress line per finished basin.
+
+    Returns:
+        list: Result records in manifest order.
+    """
+    os.makedirs(out_root, exist_ok=True)
+    records = {}
+
+    def done(record):
+        records[record["basin"]] = record
+        status = "ok" if record["status"] == "ok" else f"FAILED: {record['error']}"
+        report(f"[{len(records)}/{len(basins)}] {record['basin']}: {status} ({record['seconds']} s)")
+
+    if jobs <= 1:
+        _init_worker()
+        for basin in basins:
+            done(run_basin(basin, out_root, options))
+        return [records[b["basin"]] for b in basins]
+
+    exe = python_executable()
+    context = multiprocessing.get_context("spawn")
+    if exe is not None:
+        context.set_executable(exe)
+
+    def charge(basin):
+        # One more crashed run of `basin`; True if it may run again
+        attempts[basin["basin"]] += 1
+        if attempts[basin["basin"]] < MAX_ATTEMPTS:
+            return True
+        done(_failed(basin, out_root, "worker process exited unexpectedly"))
+        return False
+
+    attempts = {b["basin"]: 0 for b in basins}
+    pending = list(basins)
+    while pending:
+        # A worker that dies (e.g. a crash in native code) breaks the pool and
+        # every unfinished basin with it
+        broken = []
+        for basin in pending:
+            _clear_started(basin, out_root)
+        with ProcessPoolExecutor(max_workers=min(jobs, len(pending)), mp_context=context,
+                                 initializer=_init_worker) as executor:
+            futures = {executor.submit(run_basin, b, out_root, options): b for b in pending}
+            for future in as_completed(futures):
+                basin = futures[future]
+                try:
+                    done(future.result())
+                except BrokenProcessPool:
+                    broken.append(basin)
+                except Exception as e:
+                    done(_failed(basin, out_root, str(e) or type(e).__name__))
+
+        # Basins that had not started go back to a new pool as they are. The
+        # ones that were running are rerun alone, one pool each, so that a
+        # crash is charged only to the basin that caused it.
+        suspects = [b for b in broken if _started(b, out_root)]
+        pending = [b for b in broken if not _started(b, out_root)]
+        if broken and not suspects:
+            # The pool broke before any basin started (e.g. QGIS failed to start)
+            pending = [b for b in broken if charge(b)]
+        for basin in suspects:
+            while True:
+                _clear_started(basin, out_root)
+                try:
+                    done(_run_alone(basin, out_root, options, context))
+                    break
+                except BrokenProcessPool:
+                    if not charge(basin):
+                        break
+                except Exception as e:
+                    done(_failed(basin, out_root, str(e) or type(e).__name__))
+                    break
+    return [records[b["basin"]] for b in basins]
+
+
+def write_combined(records, out_root):
+    """
+    Stack the segments.csv of every successful basin into combined.csv with
+    a leading basin column.
+
+    Returns:
+        str: Path of combined.csv.
+    """
+    header, rows = ["basin"], []
+    for record in records:
+        path = os.path.join(record["out_dir"], "segments.csv")
+        if record["status"] != "ok" or not os.path.exists(path):
+            continue
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                for name in row:
+                    if name not in header:
+                        header.append(name)
+                rows.append(dict(row, basin=record["basin"]))
+
+    path = os.path.join(out_root, "combined.csv")
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=header, restval="")
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def write_summary(records, out_root):
+    with open(os.path.join(out_root, "batch_summary.json"), "w") as f:
+        json.dump(records, f, indent=2)
+    with open(os.path.join(out_root, "batch_summary.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="CSV or JSON basin manifest")
+    parser.add_argument("--out-dir", required=True, help="Output folder")
+    parser.add_argument("--jobs", type=int, default=1, help="Basins run at once (default 1)")
+    parser.add_argument("--ray-workers", type=int, default=1,
+                        help="WORKERS for the ray cast inside each basin (default 1)")
+    parser.add_argument("--extension-increment", type=float, default=250.0)
+    parser.add_argument("--max-length", type=float, default=50000.0)
+    parser.add_argument("--geo-resolution", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    try:
+        basins = read_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read manifest: {e}", file=sys.stderr)
+        return 2
+
+    options = {
+        "extension_increment": args.extension_increment,
+        "max_length": args.max_length,
+        "geo_resolution": args.geo_resolution,
+        "ray_workers": args.ray_workers,
+    }
+    t0 = time.perf_counter()
+    records = run_batch(basins, args.out_dir, options, jobs=args.jobs)
+    write_summary(records, args.out_dir)
+    combined = write_combined(records, args.out_dir)
+
+    failed = [r["basin"] for r in records if r["status"] != "ok"]
+    print(f"{len(records) - len(failed)} of {len(records)} basins done in "
+          f"{time.perf_counter() - t0:.1f} s; combined table: {combined}")
+    if failed:
+        print(f"Failed: {', '.join(failed)} (see batch_summary.csv)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
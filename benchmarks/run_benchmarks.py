@@ -0,0 +1,367 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Benchmark the five OpenRES stages on synthetic inputs.
+
+For each scale, a synthetic scene is generated (or reused) and steps
+[1]-[5] are run in order, each in a fresh headless QGIS process, recording
+wall time, algorithm time, peak RSS, output feature count and the phase
+profile written by profiling.Profiler. Every scale appends one record to a
+JSON history; the new record is compared with the last comparable one and
+slower stages are flagged.
+
+    python benchmarks/run_benchmarks.py --segments 1000 10000 --work-dir /tmp/openres-bench
+
+Run it with the Python interpreter of the QGIS install (e.g. the OSGeo4W
+shell on Windows), or pass --runner qgis_process to run the stages through
+the qgis_process command line tool with the OpenRES plugin enabled.
+"""
+
+import argparse
+import configparser
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import synthetic
+
+try:
+    from osgeo import ogr
+except ImportError:
+    ogr = None
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+PLUGIN_ROOT = BENCHMARK_DIR.parent
+
+# Stages below this difference are never flagged, whatever the ratio
+MIN_DELTA_SECONDS = 0.5
+
+
+# --- Stages ---
+def _stage_parameters(scene, run_dir, options):
+    """
+    Processing parameters of steps [1]-[5], chained through files in run_dir.
+
+    Returns:
+        list: (algorithm id, parameters dict, primary output key) in run order.
+    """
+    def out(name):
+        return str(run_dir / f"{name}.gpkg")
+
+    rivers = str(run_dir / "rivers.gpkg")
+    return [
+        ("generate_transects", {
+            "RIVER_LAYER": rivers,
+            "LINE_LAYER": scene["valley_lines"],
+            "EXTENSION_INCREMENT": options["extension_increment"],
+            "MAX_LENGTH": options["max_length"],
+            "RAY_CASTING": True,
+            "WORKERS": options["workers"],
+            "TRANSECTS": out("transects"),
+            "CENTER_POINTS": out("centers_1"),
+            "BYPASS_CACHE": True,
+        }, "CENTER_POINTS"),
+        ("extract_point_attributes", {
+            "POINTS": out("centers_1"),
+            "RASTER1": scene["elevation"],
+            "RASTER2": scene["precipitation"],
+            "POLYGONS": scene["geology"],
+            "POLY_FIELD": "GEO_CLASS",
+            "GEO_RESOLUTION": options["geo_resolution"],
+            "OUTPUT": out("centers_2"),
+            "BYPASS_CACHE": True,
+        }, "OUTPUT"),
+        ("extract_valley_width", {
+            "TRANSECTS": out("transects"),
+            "CENTER_POINTS": out("centers_2"),
+            "VALLEY_LINES": scene["valley_lines"],
+            "STREAM_NETWORK": rivers,
+            "VECTORIZED": True,
+            "LEFT_VFW": out("left_vfw"),
+            "RIGHT_VFW": out("right_vfw"),
+            "LEFT_VW": out("left_vw"),
+            "RIGHT_VW": out("right_vw"),
+            "CENTER_OUT": out("centers_3"),
+            "BYPASS_CACHE": True,
+        }, "CENTER_OUT"),
+        ("extract_side_slopes", {
+            "CENTER": out("centers_3"),
+            "LEFT_VW": out("left_vw"),
+            "LEFT_VFW": out("left_vfw"),
+            "RIGHT_VW": out("right_vw"),
+            "RIGHT_VFW": out("right_vfw"),
+            "RASTER": scene["elevation"],
+            "OUTPUT": out("centers_4"),
+            "BYPASS_CACHE": True,
+        }, "OUTPUT"),
+        ("extract_dvs_sinuosity", {
+            "CENTER_POINTS": out("centers_4"),
+            "STREAM_SEGMENTS": rivers,
+            "ELEVATION": scene["elevation"],
+            "OUTPUT": out("centers_5"),
+            "BYPASS_CACHE": True,
+        }, "OUTPUT"),
+    ]
+
+
+def _stage_command(runner, python, algorithm, parameters, parameters_path, result_path):
+    if runner == "qgis_process":
+        command = ["qgis_process", "run", f"openres:{algorithm}"]
+        for key, value in parameters.items():
+            command.append(f"--{key}={str(value).lower() if isinstance(value, bool) else value}")
+        return command
+    return [python, str(BENCHMARK_DIR / "run_stage.py"), algorithm, str(parameters_path), str(result_path)]
+
+
+def _run_process(command, env, log_path):
+    """
+    Run a stage process to completion.
+
+    Returns:
+        tuple: (return code, wall seconds, peak RSS in MB or None). Peak RSS
+        comes from wait4() and is not available on Windows.
+    """
+    t0 = time.perf_counter()
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in bytes on macOS and in KiB elsewhere
+            scale = 1 if sys.platform == "darwin" else 1024
+            peak_mb = round(usage.ru_maxrss * scale / 2**20, 1)
+        else:
+            process.wait()
+            peak_mb = None
+    return process.returncode, time.perf_counter() - t0, peak_mb
+
+
+def _feature_count(path):
+    if ogr is None or not os.path.exists(path):
+        return None
+    dataset = ogr.Open(path)
+    if dataset is None:
+        return None
+    return dataset.GetLayer(0).GetFeatureCount()
+
+
+def _load_profile(directory):
+    profiles = sorted(Path(directory).glob("*.json")) if os.path.isdir(directory) else []
+    if not profiles:
+        return None
+    with open(profiles[-1]) as f:
+        return json.load(f).get("phases")
+
+
+def run_scale(n_segments, work_dir, options):
+    """
+    Generate the scene for `n_segments` and run the stages on it.
+
+    Returns:
+        dict: History record for this scale.
+    """
+    scene_dir = Path(work_dir) / f"scene_{n_segments}"
+    t0 = time.perf_counter()
+    spec, scene = synthetic.generate(scene_dir, n_segments)
+    generate_seconds = time.perf_counter() - t0
+
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    run_dir = Path(work_dir) / f"run_{n_segments}_{stamp}"
+    run_dir.mkdir(parents=True)
+    # Step [1] writes t_ID into the river layer, so every run gets a fresh copy
+    shutil.copy(scene["rivers"], run_dir / "rivers.gpkg")
+
+    stages = []
+    for algorithm, parameters, output_key in _stage_parameters(scene, run_dir, options):
+        print(f"[{n_segments}] {algorithm} ...", flush=True)
+        parameters_path = run_dir / f"{algorithm}.parameters.json"
+        result_path = run_dir / f"{algorithm}.result.json"
+        with open(parameters_path, "w") as f:
+            json.dump(parameters, f, indent=2)
+
+        env = dict(os.environ)
+        env["OPENRES_PROFILE_DIR"] = str(run_dir / "profiles" / algorithm)
+        env["OPENRES_INDEX_SIDECAR"] = "0"
+        command = _stage_command(options["runner"], options["python"], algorithm,
+                                 parameters, parameters_path, result_path)
+        code, wall, peak_mb = _run_process(command, env, run_dir / f"{algorithm}.log")
+
+        stage = {
+            "stage": algorithm,
+            "status": "ok" if code == 0 else f"failed ({code})",
+            "wall_seconds": round(wall, 3),
+            "seconds": None,
+            "peak_rss_mb": peak_mb,
+            "features": _feature_count(parameters[output_key]),
+            "phases": _load_profile(env["OPENRES_PROFILE_DIR"]),
+        }
+        if result_path.exists():
+            with open(result_path) as f:
+                stage["seconds"] = json.load(f)["seconds"]
+        elif stage["phases"] is not None:
+            stage["seconds"] = round(sum(p["seconds"] for p in stage["phases"]), 3)
+        stages.append(stage)
+        print(f"[{n_segments}] {algorithm}: {stage['status']}, {wall:.2f} s wall, "
+              f"peak RSS {peak_mb} MB, {stage['features']} features", flush=True)
+        if code != 0:
+            print(f"  see {run_dir / (algorithm + '.log')}", flush=True)
+            break
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "label": options["label"],
+        "plugin_version": _plugin_version(),
+        "commit": _git_commit(),
+        "machine": {
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "runner": options["runner"],
+        "segments": n_segments,
+        "scene": {key: spec[key] for key in ("version", "rivers", "segments_per_river", "cell_size", "columns", "rows")},
+        "options": {key: options[key] for key in ("workers", "geo_resolution", "extension_increment", "max_length")},
+        "generate_seconds": round(generate_seconds, 3),
+        "run_dir": str(run_dir),
+        "stages": stages,
+    }
+
+
+# --- History ---
+def _plugin_version():
+    parser = configparser.ConfigParser()
+    parser.read(PLUGIN_ROOT / "metadata.txt")
+    return parser.get("general", "version", fallback=None)
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PLUGIN_ROOT,
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return {"runs": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(path, history):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _comparable(a, b):
+    return (
+        a["segments"] == b["segments"]
+        and a["runner"] == b["runner"]
+        and a["scene"] == b["scene"]
+        and a["options"] == b["options"]
+        and a["machine"]["platform"] == b["machine"]["platform"]
+    )
+
+
+def compare(previous, current, threshold):
+    """
+    Print stage times and peak RSS of `current` against `previous`.
+
+    Returns:
+        list: Names of stages that got slower than `threshold` (fraction).
+    """
+    before = {s["stage"]: s for s in previous["stages"]}
+    print(f"\n{current['segments']} segments vs {previous['timestamp']} "
+          f"(version {previous['plugin_version']}, commit {previous['commit']}):")
+    print(f"  {'stage':<26} {'before s':>9} {'now s':>9} {'ratio':>7} {'before MB':>10} {'now MB':>9}")
+    regressions = []
+    for stage in current["stages"]:
+        old = before.get(stage["stage"])
+        if old is None or old["seconds"] is None or stage["seconds"] is None:
+            continue
+        ratio = stage["seconds"] / old["seconds"] if old["seconds"] > 0 else float("inf")
+        slower = ratio > 1 + threshold and stage["seconds"] - old["seconds"] > MIN_DELTA_SECONDS
+        if slower:
+            regressions.append(stage["stage"])
+        print(f"  {stage['stage']:<26} {old['seconds']:>9.2f} {stage['seconds']:>9.2f} {ratio:>7.2f} "
+              f"{str(old['peak_rss_mb']):>10} {str(stage['peak_rss_mb']):>9}"
+              f"{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, nargs="+", default=[1000],
+                        help="Scales to run, in river segments (e.g. 1000 10000 100000 1000000)")
+    parser.add_argument("--work-dir", required=True, help="Directory for generated scenes and stage outputs")
+    parser.add_argument("--history", help="JSON history file (default: <work-dir>/history.json)")
+    parser.add_argument("--label", default="", help="Free-text label stored with the records")
+    parser.add_argument("--runner", choices=["python", "qgis_process"], default="python")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter for the python runner")
+    parser.add_argument("--workers", type=int, default=1, help="WORKERS for [1] Generate Transects")
+    parser.add_argument("--geo-resolution", type=float, default=0.0, help="GEO_RESOLUTION for [2]")
+    parser.add_argument("--extension-increment", type=float, default=250.0)
+    parser.add_argument("--max-length", type=float, default=10000.0)
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Flag stages more than this fraction slower than the last comparable run")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with status 1 when a stage is flagged")
+    args = parser.parse_args(argv)
+
+    options = {
+        "label": args.label,
+        "runner": args.runner,
+        "python": args.python,
+        "workers": args.workers,
+        "geo_resolution": args.geo_resolution,
+        "extension_increment": args.extension_increment,
+        "max_length": args.max_length,
+    }
+    history_path = args.history or os.path.join(args.work_dir, "history.json")
+    history = load_history(history_path)
+
+    regressions = []
+    failed = False
+    for n_segments in args.segments:
+        record = run_scale(n_segments, args.work_dir, options)
+        failed = failed or any(s["status"] != "ok" for s in record["stages"])
+        previous = [r for r in history["runs"] if _comparable(r, record)]
+        history["runs"].append(record)
+        save_history(history_path, history)
+        if previous:
+            regressions += [f"{n_segments}:{name}" for name in compare(previous[-1], record, args.threshold)]
+
+    print(f"\nHistory written to {history_path}")
+    if regressions:
+        print(f"Slower than the last comparable run: {', '.join(regressions)}")
+    if failed:
+        return 2
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
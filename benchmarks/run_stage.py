@@ -0,0 +1,84 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Run one OpenRES Processing algorithm headless in this process.
+
+    python run_stage.py <algorithm> <parameters.json> <result.json>
+
+run_benchmarks.py starts one process per stage so that peak memory is
+measured per algorithm. The plugin is loaded from this checkout (the parent
+of the benchmarks directory), not from the QGIS profile, and the algorithm
+is run through headless.run_algorithm.
+"""
+
+import importlib.util
+import json
+import sys
+import time
+from pathlib import Path
+
+PLUGIN_ROOT = Path(__file__).resolve().parents[1]
+
+# Import name for checkouts whose directory is not a valid module name
+PACKAGE = "openres_benchmark"
+
+
+def load_plugin(module="openres_provider"):
+    """
+    Import a module of the plugin from the checkout.
+
+    The checkout is imported under its directory name through sys.path where
+    possible, so that WORKERS > 1 process pools can re-import it; otherwise
+    it is loaded under PACKAGE.
+    """
+    if PLUGIN_ROOT.name.isidentifier():
+        sys.path.insert(0, str(PLUGIN_ROOT.parent))
+        return importlib.import_module(f"{PLUGIN_ROOT.name}.{module}")
+
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE, PLUGIN_ROOT / "__init__.py", submodule_search_locations=[str(PLUGIN_ROOT)]
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE] = package
+    spec.loader.exec_module(package)
+    return importlib.import_module(f"{PACKAGE}.{module}")
+
+
+def main(argv):
+    if len(argv) != 3:
+        print(__doc__, file=sys.stderr)
+        return 2
+    algorithm, parameters_path, result_path = argv
+    with open(parameters_path) as f:
+        parameters = json.load(f)
+
+    headless = load_plugin("headless")
+    headless.start_qgis()
+
+    t0 = time.perf_counter()
+    headless.run_algorithm(algorithm, parameters)
+    seconds = time.perf_counter() - t0
+
+    with open(result_path, "w") as f:
+        json.dump({"algorithm": algorithm, "seconds": round(seconds, 6)}, f)
+
+    headless.stop_qgis()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,357 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Synthetic OpenRES inputs at a configurable number of river segments.
+
+The scene is a field of parallel sinuous rivers flowing in +x, spaced
+`spacing` apart in y. Each river is cut into segments of `segment_length`
+(measured down valley) and is bracketed by two nested pairs of valley
+lines: the valley floor boundary and, further out, the microshed boundary,
+so every transect meets a VFW and a VW intersection on both sides. The DEM
+is a down-valley ramp with a flat floor and linear valley sides, the
+precipitation raster a smooth field, and geology a grid of square polygons
+in three classes.
+
+Geometry is computed with NumPy only; writing the layers needs GDAL/OGR
+(shipped with QGIS).
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+
+try:
+    from osgeo import gdal, ogr, osr
+except ImportError:  # Layout functions still work; generate() needs GDAL
+    gdal = ogr = osr = None
+
+# Bumped whenever the generated scene changes, so cached inputs are rebuilt
+SCENE_VERSION = 1
+
+GEOLOGY_CLASSES = ["bedrock", "mixed", "alluvial"]
+
+DEFAULTS = {
+    "segment_length": 1000.0,     # m down valley per river segment
+    "spacing": 3000.0,            # m between neighbouring rivers
+    "amplitude": 250.0,           # m meander amplitude
+    "wavelength": 1600.0,         # m meander wavelength
+    "floor_half_width": 150.0,    # m from the meander belt to the floor boundary
+    "vertex_spacing": 50.0,       # m between line vertices
+    "line_chunk": 25,             # river segments per valley line feature
+    "geology_cell": 10000.0,      # m side of a geology polygon
+    "max_pixels": 100_000_000,    # raster size cap; coarsens the cell size
+    "min_cell_size": 30.0,        # m raster cell size for small scenes
+    "epsg": 32633,
+    "origin": (500000.0, 4000000.0),
+}
+
+
+# --- Layout ---
+def layout(n_segments, **options):
+    """
+    Scene dimensions for about `n_segments` river segments.
+
+    Rivers and segments per river are chosen so the scene is roughly square.
+
+    Parameters:
+        n_segments (int): Target number of river segments.
+        **options: Overrides for DEFAULTS.
+
+    Returns:
+        dict: JSON-serialisable scene specification.
+    """
+    spec = dict(DEFAULTS)
+    unknown = set(options) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown scene options: {sorted(unknown)}")
+    spec.update(options)
+
+    per_river = max(1, round(math.sqrt(n_segments * spec["spacing"] / spec["segment_length"])))
+    rivers = max(1, math.ceil(n_segments / per_river))
+    width = per_river * spec["segment_length"]
+    height = rivers * spec["spacing"]
+
+    cell = max(spec["min_cell_size"], math.sqrt(width * height / spec["max_pixels"]))
+    x0, y0 = spec["origin"]
+    spec.update({
+        "version": SCENE_VERSION,
+        "n_segments": int(n_segments),
+        "rivers": int(rivers),
+        "segments_per_river": int(per_river),
+        "extent": [x0, y0, x0 + width, y0 + height],
+        "cell_size": float(cell),
+        "columns": int(math.ceil(width / cell)),
+        "rows": int(math.ceil(height / cell)),
+        "origin": [x0, y0],
+    })
+    return spec
+
+
+def _river_y(spec, j, xs):
+    x0, y0 = spec["origin"]
+    phase = 2 * math.pi * (np.asarray(xs) - x0) / spec["wavelength"]
+    return y0 + (j + 0.5) * spec["spacing"] + spec["amplitude"] * np.sin(phase)
+
+
+def _floor_offset(spec):
+    return spec["amplitude"] + spec["floor_half_width"]
+
+
+def _shed_offset(spec):
+    # Microshed divide just inside the midline between two rivers
+    return 0.5 * spec["spacing"] - 0.05 * spec["spacing"]
+
+
+def _xs(spec, start, stop):
+    n = max(2, int(math.ceil((stop - start) / spec["vertex_spacing"])) + 1)
+    return np.linspace(start, stop, n)
+
+
+def river_segments(spec, j):
+    """
+    Segments of river `j`, each an (xs, ys) vertex array pair.
+
+    Segments share their end vertices, so the network is connected.
+    """
+    x0 = spec["origin"][0]
+    length = spec["segment_length"]
+    segments = []
+    for k in range(spec["segments_per_river"]):
+        xs = _xs(spec, x0 + k * length, x0 + (k + 1) * length)
+        segments.append((xs, _river_y(spec, j, xs)))
+    return segments
+
+
+def valley_lines(spec, j):
+    """
+    Valley floor and microshed boundary lines of river `j`.
+
+    Returns:
+        list: (kind, side, xs, ys) per line feature, where kind is "floor"
+        or "microshed" and side is -1 (right bank, -y) or 1 (left bank, +y).
+        Long lines are split every `line_chunk` segments.
+    """
+    x0 = spec["origin"][0]
+    chunk = spec["line_chunk"] * spec["segment_length"]
+    x_end = x0 + spec["segments_per_river"] * spec["segment_length"]
+    lines = []
+    start = x0
+    while start < x_end:
+        xs = _xs(spec, start, min(start + chunk, x_end))
+        ys = _river_y(spec, j, xs)
+        for kind, offset in [("floor", _floor_offset(spec)), ("microshed", _shed_offset(spec))]:
+            for side in (-1, 1):
+                lines.append((kind, side, xs, ys + side * offset))
+        start += chunk
+    return lines
+
+
+# --- Surfaces ---
+def elevation(spec, xs, ys):
+    """
+    DEM surface: a 0.2 % down-valley ramp, a nearly flat valley floor and
+    15 % valley sides up to the microshed divide.
+    """
+    x0, y0 = spec["origin"]
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    phase = 2 * math.pi * (xs - x0) / spec["wavelength"]
+    across = ys - y0 - spec["amplitude"] * np.sin(phase)
+    spacing = spec["spacing"]
+    d = np.abs(across - spacing * (np.floor(across / spacing) + 0.5))
+    floor = _floor_offset(spec)
+    side = np.maximum(d - floor, 0.0)
+    return 2000.0 - 0.002 * (xs - x0) + 0.001 * np.minimum(d, floor) + 0.15 * side
+
+
+def precipitation(spec, xs, ys):
+    """
+    Smooth mean annual precipitation field in mm.
+    """
+    x0, y0 = spec["origin"]
+    xs = np.asarray(xs, dtype=np.float64) - x0
+    ys = np.asarray(ys, dtype=np.float64) - y0
+    return 800.0 + 300.0 * np.sin(xs / 40000.0) * np.cos(ys / 55000.0) + 0.001 * ys
+
+
+def geology_cells(spec):
+    """
+    Square geology polygons covering the scene.
+
+    Yields:
+        tuple: (xmin, ymin, xmax, ymax, class name)
+    """
+    xmin, ymin, xmax, ymax = spec["extent"]
+    size = spec["geology_cell"]
+    nx = int(math.ceil((xmax - xmin) / size))
+    ny = int(math.ceil((ymax - ymin) / size))
+    for iy in range(ny):
+        for ix in range(nx):
+            name = GEOLOGY_CLASSES[(ix * 7 + iy * 3) % len(GEOLOGY_CLASSES)]
+            yield (
+                xmin + ix * size, ymin + iy * size,
+                min(xmin + (ix + 1) * size, xmax), min(ymin + (iy + 1) * size, ymax),
+                name,
+            )
+
+
+# --- Writers ---
+def _srs(spec):
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(spec["epsg"])
+    return srs
+
+
+def _line_wkb(xs, ys):
+    line = ogr.Geometry(ogr.wkbLineString)
+    for x, y in zip(xs.tolist(), ys.tolist()):
+        line.AddPoint_2D(x, y)
+    return line
+
+
+def _vector_layer(path, name, spec, geometry_type, fields):
+    driver = ogr.GetDriverByName("GPKG")
+    if os.path.exists(path):
+        driver.DeleteDataSource(path)
+    dataset = driver.CreateDataSource(path)
+    layer = dataset.CreateLayer(name, _srs(spec), geometry_type)
+    for field_name, field_type in fields:
+        layer.CreateField(ogr.FieldDefn(field_name, field_type))
+    return dataset, layer
+
+
+def _add_features(layer, rows):
+    layer.StartTransaction()
+    defn = layer.GetLayerDefn()
+    for i, (geometry, attributes) in enumerate(rows):
+        feature = ogr.Feature(defn)
+        feature.SetGeometry(geometry)
+        for name, value in attributes.items():
+            feature.SetField(name, value)
+        layer.CreateFeature(feature)
+        if (i + 1) % 50000 == 0:
+            layer.CommitTransaction()
+            layer.StartTransaction()
+    layer.CommitTransaction()
+
+
+def write_rivers(path, spec):
+    dataset, layer = _vector_layer(path, "rivers", spec, ogr.wkbLineString, [("river", ogr.OFTInteger)])
+    _add_features(layer, (
+        (_line_wkb(xs, ys), {"river": j})
+        for j in range(spec["rivers"])
+        for xs, ys in river_segments(spec, j)
+    ))
+    dataset = None
+
+
+def write_valley_lines(path, spec):
+    dataset, layer = _vector_layer(
+        path, "valley_lines", spec, ogr.wkbLineString,
+        [("river", ogr.OFTInteger), ("kind", ogr.OFTString), ("side", ogr.OFTInteger)]
+    )
+    _add_features(layer, (
+        (_line_wkb(xs, ys), {"river": j, "kind": kind, "side": side})
+        for j in range(spec["rivers"])
+        for kind, side, xs, ys in valley_lines(spec, j)
+    ))
+    dataset = None
+
+
+def write_geology(path, spec):
+    dataset, layer = _vector_layer(path, "geology", spec, ogr.wkbPolygon, [("GEO_CLASS", ogr.OFTString)])
+
+    def rows():
+        for xmin, ymin, xmax, ymax, name in geology_cells(spec):
+            ring = ogr.Geometry(ogr.wkbLinearRing)
+            for x, y in [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax), (xmin, ymin)]:
+                ring.AddPoint_2D(x, y)
+            polygon = ogr.Geometry(ogr.wkbPolygon)
+            polygon.AddGeometry(ring)
+            yield polygon, {"GEO_CLASS": name}
+
+    _add_features(layer, rows())
+    dataset = None
+
+
+def write_raster(path, spec, surface, block_rows=512):
+    """
+    Write `surface(spec, xs, ys)` sampled at cell centres to a tiled,
+    uncompressed Float32 GeoTIFF, one band of rows at a time.
+    """
+    xmin, ymin, xmax, ymax = spec["extent"]
+    cell, cols, rows = spec["cell_size"], spec["columns"], spec["rows"]
+    dataset = gdal.GetDriverByName("GTiff").Create(
+        path, cols, rows, 1, gdal.GDT_Float32,
+        options=["TILED=YES", "BLOCKXSIZE=256", "BLOCKYSIZE=256", "BIGTIFF=IF_SAFER"]
+    )
+    dataset.SetGeoTransform((xmin, cell, 0.0, ymax, 0.0, -cell))
+    dataset.SetProjection(_srs(spec).ExportToWkt())
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(-9999.0)
+
+    xs = xmin + (np.arange(cols) + 0.5) * cell
+    for row in range(0, rows, block_rows):
+        n = min(block_rows, rows - row)
+        ys = ymax - (row + np.arange(n) + 0.5) * cell
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        band.WriteArray(surface(spec, grid_x, grid_y).astype(np.float32), 0, row)
+    band.FlushCache()
+    dataset = None
+
+
+# --- Scene ---
+SCENE_FILES = {
+    "rivers": "rivers.gpkg",
+    "valley_lines": "valley_lines.gpkg",
+    "geology": "geology.gpkg",
+    "elevation": "elevation.tif",
+    "precipitation": "precipitation.tif",
+}
+
+
+def generate(directory, n_segments, **options):
+    """
+    Write a synthetic scene to `directory`, reusing it if the same scene
+    was generated there before.
+
+    Returns:
+        tuple: (spec dict, {name: path}) with the keys of SCENE_FILES.
+    """
+    if gdal is None:
+        raise RuntimeError("Generating benchmark inputs requires the GDAL Python bindings (osgeo).")
+
+    spec = layout(n_segments, **options)
+    os.makedirs(directory, exist_ok=True)
+    paths = {name: os.path.join(directory, filename) for name, filename in SCENE_FILES.items()}
+    spec_path = os.path.join(directory, "scene.json")
+
+    if os.path.exists(spec_path) and all(os.path.exists(p) for p in paths.values()):
+        with open(spec_path) as f:
+            if json.load(f) == json.loads(json.dumps(spec)):
+                return spec, paths
+
+    write_rivers(paths["rivers"], spec)
+    write_valley_lines(paths["valley_lines"], spec)
+    write_geology(paths["geology"], spec)
+    write_raster(paths["elevation"], spec, elevation)
+    write_raster(paths["precipitation"], spec, precipitation)
+    with open(spec_path, "w") as f:
+        json.dump(spec, f, indent=2)
+    return spec, paths
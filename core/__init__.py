@@ -0,0 +1,37 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+QGIS-free computational core for OpenRES.
+
+Modules in this package work on plain NumPy arrays and must not import
+qgis.core, so they can be used outside of a QGIS session (worker processes,
+batch jobs). The Processing algorithms convert layers to arrays and call:
+
+    geometry      - perpendicular angles, ray end points, polyline interpolation
+    transects     - batched ray casting of half-transects
+    sides         - left/right classification of transect intersections
+    metrics       - side slope, down valley slope and sinuosity
+    segments, segment_index, ray_cast, parallel - valley line intersection kernel
+    index_file    - memory-mapped index files of exploded valley lines
+    polylines     - line features as flat vertex arrays (from WKB), end points and lengths
+    cross_sections - per-transect cross-section profile stores and side slope fits
+    rem           - tiled relative elevation model (height above nearest channel)
+    segment_table - columnar per-segment results keyed by t_ID
+    polygon_grid  - rasterized polygon class lookup
+    fingerprint   - geometry and transect fingerprints for change detection
+    result_store  - SQLite store of per-segment results between runs
+"""
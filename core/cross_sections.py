@@ -0,0 +1,191 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from .index_file import write_arrays, read_arrays
+from .metrics import least_squares_slope
+from .segment_index import _expand_ranges
+
+# Profile store files use the array file layout of core.index_file
+MAGIC = b"OPENRES-CROSS-SECTIONS\n"
+VERSION = 1
+
+ARRAYS = ("t_id", "cx", "cy", "ux", "uy", "offsets", "station", "elevation")
+
+
+class CrossSections:
+    """
+    Cross-section profiles of transects in CSR form.
+
+    The samples of transect i are `station[offsets[i]:offsets[i + 1]]` and
+    `elevation[...]`, ordered from the start of the transect line to its
+    end. Stations are signed distances from the transect center (cx, cy)
+    along the unit axis (ux, uy) from the start to the end of the line;
+    stations and elevations are float32 to keep large stores compact.
+    """
+
+    def __init__(self, t_id, cx, cy, ux, uy, offsets, station, elevation):
+        self.t_id = np.asarray(t_id, dtype=np.int64)
+        self.cx = np.asarray(cx, dtype=np.float64)
+        self.cy = np.asarray(cy, dtype=np.float64)
+        self.ux = np.asarray(ux, dtype=np.float64)
+        self.uy = np.asarray(uy, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.station = np.asarray(station, dtype=np.float32)
+        self.elevation = np.asarray(elevation, dtype=np.float32)
+        self._key = None
+
+    def __len__(self):
+        return len(self.t_id)
+
+    def save(self, path, signature=None):
+        """
+        Write the profiles to a store file (core.index_file.write_arrays).
+        """
+        write_arrays(path, MAGIC, {"version": VERSION, "signature": signature},
+                     {name: getattr(self, name) for name in ARRAYS})
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map a store file written by save.
+
+        Returns:
+            CrossSections or None if the file is missing, unreadable or of
+            another format version.
+        """
+        loaded = read_arrays(path, MAGIC)
+        if loaded is None or loaded[0].get("version") != VERSION:
+            return None
+        return cls(*[loaded[1][name] for name in ARRAYS])
+
+    def stations_of(self, rows, x, y):
+        """
+        Signed station of points (x, y) on the axes of transects `rows`.
+        """
+        return (np.subtract(x, self.cx[rows]) * self.ux[rows]
+                + np.subtract(y, self.cy[rows]) * self.uy[rows])
+
+    def _sample_key(self):
+        """
+        Stations shifted per transect so that they increase over the whole
+        store, for locating station windows of many transects in one search.
+        """
+        if self._key is None:
+            station = self.station.astype(np.float64)
+            counts = np.diff(self.offsets)
+            has = counts > 0
+            low = np.zeros(len(self))
+            span = np.zeros(len(self))
+            low[has] = station[self.offsets[:-1][has]]
+            span[has] = station[self.offsets[1:][has] - 1] - low[has]
+            self._base = np.cumsum(span + 1.0) - (span + 1.0) - low
+            self._key = station + np.repeat(self._base, counts)
+        return self._key
+
+    def window_slope(self, rows, start, stop):
+        """
+        Least-squares slope (%) of elevation against station over the
+        samples of transect rows[i] between stations start[i] and stop[i]
+        (either order), for all windows at once.
+
+        Returns:
+            ndarray: Absolute slope in percent per window; NaN for windows
+            with fewer than two valid samples.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        low = np.minimum(start, stop)
+        high = np.maximum(start, stop)
+        key = self._sample_key()
+        first = np.searchsorted(key, self._base[rows] + low, side="left")
+        last = np.searchsorted(key, self._base[rows] + high, side="right")
+        first = np.clip(first, self.offsets[rows], self.offsets[rows + 1])
+        last = np.clip(last, first, self.offsets[rows + 1])
+
+        samples = _expand_ranges(first, last - first)
+        owner = np.repeat(np.arange(len(rows)), last - first)
+        slope = least_squares_slope(owner, self.station[samples], self.elevation[samples], len(rows))
+        return np.abs(slope) * 100
+
+
+def center_distances(lines):
+    """
+    Distance along each transect of its center: the vertex joining the left
+    and right halves of the three-vertex transects built by [1], or half the
+    length of any other line.
+    """
+    step, _ = lines.along()
+    first, stop = lines.vertex_range()
+    center = lines.lengths() / 2
+    joined = (stop - first == 3) & (np.diff(lines.feature_offsets) == 1)
+    center[joined] = step[first[joined]]
+    return center
+
+
+def build_cross_sections(t_ids, lines, spacing, sample, chunk_samples=1_000_000, is_canceled=None):
+    """
+    Densify every transect at `spacing` and sample elevations along all of
+    them, in batches of whole transects holding at most `chunk_samples`
+    samples (a longer transect is a batch of its own), so that memory stays
+    bounded whatever the transect lengths.
+
+    Parameters:
+        t_ids (ndarray): t_ID of every transect line.
+        lines (PolylineSet): Transect lines.
+        spacing (float): Distance between samples along the transects.
+        sample (callable): sample(xs, ys) -> elevations (NaN for no data).
+        chunk_samples (int): Samples densified and sampled per batch.
+        is_canceled (callable): Optional; polled between batches.
+
+    Returns:
+        CrossSections: Profiles of the transects with a non-zero extent, or
+        None when cancelled.
+    """
+    x0, y0, x1, y1 = lines.endpoints()
+    with np.errstate(invalid="ignore"):
+        chord = np.hypot(x1 - x0, y1 - y0)
+    rows = np.flatnonzero(chord > 0)
+    center = center_distances(lines)[rows]
+    cx, cy = lines.interpolate(rows, center)
+
+    # Upper bound on the samples of each transect, for cutting the batches
+    total = np.cumsum(np.floor(lines.lengths()[rows] / spacing) + 2)
+
+    counts, stations, elevations = [], [], []
+    lo = 0
+    while lo < len(rows):
+        if is_canceled is not None and is_canceled():
+            return None
+        done = total[lo - 1] if lo else 0
+        hi = max(lo + 1, int(np.searchsorted(total, done + chunk_samples, side="right")))
+        chunk = rows[lo:hi]
+        owner, distance, x, y = lines.densify(spacing, chunk)
+        counts.append(np.bincount(owner, minlength=len(chunk)))
+        stations.append((distance - center[lo + owner]).astype(np.float32))
+        elevations.append(np.asarray(sample(x, y), dtype=np.float32))
+        lo = hi
+
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    if counts:
+        np.cumsum(np.concatenate(counts), out=offsets[1:])
+    empty = np.empty(0, dtype=np.float32)
+    return CrossSections(
+        np.asarray(t_ids, dtype=np.int64)[rows], cx, cy,
+        (x1 - x0)[rows] / chord[rows], (y1 - y0)[rows] / chord[rows], offsets,
+        np.concatenate(stations) if stations else empty,
+        np.concatenate(elevations) if elevations else empty
+    )
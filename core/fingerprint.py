@@ -0,0 +1,90 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+
+import numpy as np
+
+from .geometry import ray_endpoints
+from .segments import intersect_rays
+
+
+def digest(data):
+    """
+    Short, stable hex digest of bytes or str.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def unique_fingerprints(blobs):
+    """
+    Fingerprints of geometries given as bytes (e.g. WKB). Repeated identical
+    geometries get an occurrence suffix ("#1", "#2", ...) so that every
+    fingerprint is unique and stable while the duplicates keep their order.
+
+    Returns:
+        list: str fingerprints aligned with `blobs`.
+    """
+    seen = {}
+    fingerprints = []
+    for blob in blobs:
+        fp = digest(blob)
+        n = seen.get(fp, 0)
+        seen[fp] = n + 1
+        fingerprints.append(fp if n == 0 else f"{fp}#{n}")
+    return fingerprints
+
+
+def transect_context(ox, oy, angles, left_lengths, right_lengths, segments, grid):
+    """
+    Fingerprint of the valley line segments each transect crosses.
+
+    A transect only depends on the valley segments crossed by its two halves
+    (out to the full reach when it found fewer than two intersections), so
+    a changed fingerprint marks the transect, and everything derived from
+    it, as stale after an edit of the valley lines.
+
+    Parameters:
+        ox, oy (array-like): Transect origins.
+        angles (array-like): Perpendicular angles in degrees.
+        left_lengths, right_lengths (array-like): Half-transect lengths.
+        segments (SegmentSet): Exploded valley lines.
+        grid (SegmentGrid): Segment index over the same valley lines.
+
+    Returns:
+        list: str fingerprints aligned with the origins.
+    """
+    ox = np.asarray(ox, dtype=np.float64)
+    n = len(ox)
+    oy = np.asarray(oy, dtype=np.float64)
+    angles = np.asarray(angles, dtype=np.float64)
+    lx, ly = ray_endpoints(ox, oy, angles, -np.asarray(left_lengths, dtype=np.float64))
+    rx, ry = ray_endpoints(ox, oy, angles, np.asarray(right_lengths, dtype=np.float64))
+    rays_x0, rays_y0 = np.concatenate([ox, ox]), np.concatenate([oy, oy])
+    rays_x1, rays_y1 = np.concatenate([lx, rx]), np.concatenate([ly, ry])
+
+    ray_idx, seg_idx = grid.query_rays(rays_x0, rays_y0, rays_x1, rays_y1)
+    ray_idx, seg_idx, _, _, _ = intersect_rays(rays_x0, rays_y0, rays_x1, rays_y1, segments, ray_idx, seg_idx)
+
+    owner = ray_idx % n if n else ray_idx
+    coords = np.column_stack([segments.x0[seg_idx], segments.y0[seg_idx],
+                              segments.x1[seg_idx], segments.y1[seg_idx]])
+    order = np.lexsort((coords[:, 3], coords[:, 2], coords[:, 1], coords[:, 0], owner))
+    owner, coords = owner[order], coords[order]
+    bounds = np.searchsorted(owner, np.arange(n + 1))
+    return [digest(coords[bounds[i]:bounds[i + 1]].tobytes()) for i in range(n)]
@@ -0,0 +1,119 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+
+# --- Directions ---
+def perpendicular_angle(x0, y0, x1, y1):
+    """
+    Angle (degrees) perpendicular to the line from (x0, y0) to (x1, y1),
+    pointing to its left. Works element-wise on arrays.
+
+    Returns:
+        float or ndarray: Angle in [90, 450), as the transect tools have
+        always reported it.
+    """
+    angle = np.degrees(np.arctan2(np.subtract(y1, y0), np.subtract(x1, x0)))
+    angle = np.where(angle < 0, angle + 360, angle) + 90
+    return float(angle) if np.ndim(angle) == 0 else angle
+
+
+def ray_endpoints(ox, oy, angle, distance):
+    """
+    End points of rays of `distance` from (ox, oy) along `angle` (degrees);
+    a negative distance points the other way. Works element-wise on arrays.
+
+    Returns:
+        tuple: (ex, ey)
+    """
+    theta = np.radians(angle)
+    return np.add(ox, np.cos(theta) * distance), np.add(oy, np.sin(theta) * distance)
+
+
+# --- Polylines given as lists of (xs, ys) parts ---
+def line_length(parts):
+    """
+    Total length of a polyline given as (xs, ys) vertex sequences, one per part.
+    """
+    return sum(
+        float(np.hypot(np.diff(xs), np.diff(ys)).sum())
+        for xs, ys in parts
+    )
+
+
+def interpolate(parts, distance):
+    """
+    Point at `distance` along a polyline, walking its parts in order as
+    QgsGeometry.interpolate does. The distance is clamped to the line.
+
+    Parameters:
+        parts (list): (xs, ys) vertex sequences, one per part.
+        distance (float): Distance from the start of the first part.
+
+    Returns:
+        tuple: (x, y), or None for a line without segments.
+    """
+    remaining = max(float(distance), 0.0)
+    last = None
+    for xs, ys in parts:
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if len(xs) < 2:
+            continue
+        seg = np.hypot(np.diff(xs), np.diff(ys))
+        cumulative = np.cumsum(seg)
+        if remaining <= cumulative[-1]:
+            i = int(np.searchsorted(cumulative, remaining))
+            start = cumulative[i] - seg[i]
+            f = (remaining - start) / seg[i] if seg[i] > 0 else 0.0
+            return float(xs[i] + f * (xs[i + 1] - xs[i])), float(ys[i] + f * (ys[i + 1] - ys[i]))
+        remaining -= cumulative[-1]
+        last = (float(xs[-1]), float(ys[-1]))
+    return last
+
+
+def line_origin(parts, window=500.0):
+    """
+    Midpoint of a polyline and the perpendicular angle of the chord through
+    the points `window` before and after it (less on short lines).
+
+    Returns:
+        tuple: (x, y, angle in degrees), or None for a line without segments.
+    """
+    length = line_length(parts)
+    midpoint = interpolate(parts, length / 2)
+    if midpoint is None:
+        return None
+    delta = min(window, length / 2 - 1)
+    x0, y0 = interpolate(parts, length / 2 - delta)
+    x1, y1 = interpolate(parts, length / 2 + delta)
+    return midpoint[0], midpoint[1], perpendicular_angle(x0, y0, x1, y1)
+
+
+def flow_direction(parts):
+    """
+    Flow vector of a stream segment, from its first vertex to its midpoint.
+
+    Returns:
+        tuple: (start x, start y, mid x, mid y), or None for a line without
+        segments.
+    """
+    midpoint = interpolate(parts, line_length(parts) / 2)
+    if midpoint is None:
+        return None
+    xs, ys = next((xs, ys) for xs, ys in parts if len(xs) > 0)
+    return float(xs[0]), float(ys[0]), midpoint[0], midpoint[1]
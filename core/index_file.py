@@ -0,0 +1,140 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+
+import numpy as np
+
+from .segments import SegmentSet
+from .segment_index import SegmentGrid
+
+# File layout: MAGIC, 8-byte little-endian header length, JSON header, then
+# the raw arrays, each starting at a multiple of ALIGN bytes
+MAGIC = b"OPENRES-SEGMENT-INDEX\n"
+VERSION = 1
+ALIGN = 64
+
+SEGMENT_ARRAYS = ("x0", "y0", "x1", "y1", "fids", "offsets", "fid")
+GRID_ARRAYS = ("cell_start", "cell_segments")
+
+
+# --- Array files ---
+def write_arrays(path, magic, header, arrays):
+    """
+    Write named arrays and a JSON header to a file in the layout above.
+
+    The file is written next to its final path and moved into place, so
+    readers never see a partial file.
+
+    Parameters:
+        path (str): File path.
+        magic (bytes): File type marker.
+        header (dict): JSON-serializable metadata; an "arrays" entry giving
+            the offset, shape and dtype of every array is added.
+        arrays (dict): name -> ndarray.
+    """
+    spec, offset = {}, 0
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    for name, array in arrays.items():
+        spec[name] = [offset, list(array.shape), array.dtype.str]
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    header = json.dumps(dict(header, arrays=spec)).encode("utf-8")
+    data_start = -(-(len(magic) + 8 + len(header)) // ALIGN) * ALIGN
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(magic)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for name, array in arrays.items():
+                f.seek(data_start + spec[name][0])
+                f.write(array.tobytes())
+            f.truncate(data_start + offset)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def read_arrays(path, magic):
+    """
+    Memory-map a file written by write_arrays.
+
+    Returns:
+        tuple: (header dict, {name: read-only array}), or None if the file
+        is missing, unreadable or not of type `magic`.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(magic)) != magic:
+                return None
+            size = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(size).decode("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+    data_start = -(-(len(magic) + 8 + size) // ALIGN) * ALIGN
+    arrays = {}
+    for name, (offset, shape, dtype) in header["arrays"].items():
+        dtype = np.dtype(dtype)
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=data_start + offset, shape=tuple(shape))
+    return header, arrays
+
+
+# --- Valley line indexes ---
+def save_index(path, segments, grid, signature):
+    """
+    Write a SegmentSet and its SegmentGrid to an index file.
+
+    Parameters:
+        path (str): Index file path.
+        segments (SegmentSet): Exploded valley lines.
+        grid (SegmentGrid): Segment index over the same valley lines.
+        signature (str): Signature of the source the index was built from;
+            load_index only returns the index for the same signature.
+    """
+    arrays = {name: getattr(segments, name) for name in SEGMENT_ARRAYS}
+    arrays.update({name: getattr(grid, name) for name in GRID_ARRAYS})
+    write_arrays(path, MAGIC, {"version": VERSION, "signature": signature, "grid": grid.scalars()}, arrays)
+
+
+def load_index(path, signature):
+    """
+    Memory-map an index file written by save_index.
+
+    The segment and cell arrays are read-only views of the file, so loading
+    costs no parsing and pages are read on demand.
+
+    Returns:
+        tuple: (SegmentSet, SegmentGrid), or None if the file is missing,
+        unreadable, of another format version or built from a source with
+        another signature.
+    """
+    loaded = read_arrays(path, MAGIC)
+    if loaded is None:
+        return None
+    header, arrays = loaded
+    if header.get("version") != VERSION or header.get("signature") != signature:
+        return None
+
+    segments = SegmentSet.from_arrays(*[arrays[name] for name in SEGMENT_ARRAYS])
+    grid = SegmentGrid.from_arrays(header["grid"], arrays["cell_start"], arrays["cell_segments"])
+    return segments, grid
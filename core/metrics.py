@@ -0,0 +1,190 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+
+def side_slope(elev1, elev2, dist):
+    """
+    Percent slope between points from their elevations and horizontal distance.
+    Works element-wise on arrays.
+
+    Returns:
+        float or ndarray: Slope in percent; NaN where the points coincide or
+        an elevation is missing.
+    """
+    elev1 = np.asarray(elev1, dtype=np.float64)
+    elev2 = np.asarray(elev2, dtype=np.float64)
+    dist = np.asarray(dist, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (np.abs(elev1 - elev2) / dist) * 100
+    return np.where(dist > 0, slope, np.nan)
+
+
+def dvs_and_sinuosity(elev_start, elev_end, length, x0, y0, x1, y1):
+    """
+    Down valley slope (%) and sinuosity of stream segments. Works
+    element-wise on arrays.
+
+    Parameters:
+        elev_start, elev_end: Elevation at the segment end points.
+        length: Along-channel length of the segment.
+        x0, y0, x1, y1: Segment end points.
+
+    Returns:
+        tuple: (DVS, SIN) arrays; NaN where the length (DVS) or the straight
+        end-to-end distance (SIN) is zero.
+    """
+    length = np.asarray(length, dtype=np.float64)
+    straight = np.hypot(np.subtract(x1, x0), np.subtract(y1, y0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dvs = ((np.subtract(elev_start, elev_end)) / length) * 100
+        sin = length / straight
+    return np.where(length > 0, dvs, np.nan), np.where(straight > 0, sin, np.nan)
+
+
+def least_squares_slope(owner, x, y, n):
+    """
+    Least-squares slope of y against x for n groups of samples at once.
+
+    Parameters:
+        owner (ndarray): Group of each sample (0..n-1).
+        x, y (ndarray): Sample coordinates; samples with NaN y are ignored.
+        n (int): Number of groups.
+
+    Returns:
+        ndarray: Slope per group; NaN for groups with fewer than two valid
+        samples at distinct x.
+    """
+    owner = np.asarray(owner, dtype=np.int64)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    ok = ~np.isnan(y)
+    owner, x, y = owner[ok], x[ok], y[ok]
+
+    count = np.bincount(owner, minlength=n).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_x = np.bincount(owner, x, minlength=n) / count
+        mean_y = np.bincount(owner, y, minlength=n) / count
+        dx = x - mean_x[owner]
+        sxx = np.bincount(owner, dx * dx, minlength=n)
+        sxy = np.bincount(owner, dx * (y - mean_y[owner]), minlength=n)
+        slope = sxy / sxx
+    return np.where((count >= 2) & (sxx > 0), slope, np.nan)
+
+
+def _running_minimum(owner, values):
+    """
+    Running minimum of `values` restarting at every new owner; `owner` must
+    be non-decreasing. NaN values are skipped and stay NaN.
+    """
+    finite = values[~np.isnan(values)]
+    if len(finite) == 0:
+        return values
+    # Shift each owner below all earlier ones so one accumulate restarts per owner
+    span = float(finite.max() - finite.min()) + 1.0
+    shift = owner * span
+    out = np.fmin.accumulate(values - shift) + shift
+    return np.where(np.isnan(values), np.nan, out)
+
+
+def profile_dvs(owner, distance, elevation, n, breach=False):
+    """
+    Down valley slope (%) of longitudinal profiles from a least-squares fit
+    of elevation against distance along the channel.
+
+    Parameters:
+        owner (ndarray): Profile of each sample (0..n-1), non-decreasing.
+        distance (ndarray): Distance of each sample from the segment start.
+        elevation (ndarray): Sampled elevation; NaN samples are ignored.
+        n (int): Number of profiles.
+        breach (bool): Breach the profile first (running minimum from the
+            segment start), cutting through bridges, culverts and other
+            obstructions that rise above the channel.
+
+    Returns:
+        ndarray: DVS per profile, positive downhill; NaN for profiles with
+        fewer than two valid samples at distinct distances.
+    """
+    owner = np.asarray(owner, dtype=np.int64)
+    distance = np.asarray(distance, dtype=np.float64)
+    elevation = np.asarray(elevation, dtype=np.float64)
+    if breach:
+        elevation = _running_minimum(owner, elevation)
+    return -least_squares_slope(owner, distance, elevation, n) * 100
+
+
+def multiscale_sinuosity(lines, windows, spacing, features=None):
+    """
+    Sinuosity of stream segments at several window lengths: the ratio of a
+    window's along-channel length to its chord, for windows starting every
+    `spacing` along each segment, summarised per segment. Windows that span
+    the gap between two parts of a multipart segment are skipped: their
+    chord would cross the gap while their length does not.
+
+    Parameters:
+        lines (PolylineSet): Stream segments.
+        windows (list): Window lengths along the channel.
+        spacing (float): Distance between window starts.
+        features (ndarray): Optional indices of the segments to evaluate.
+
+    Returns:
+        list: (mean, max) arrays per window, one entry per segment; NaN
+        where a segment is shorter than the window or has no window within
+        a single part.
+    """
+    # Window starts and the along-channel distances they need, walked once for all windows
+    owner, start, x, y = lines.densify(spacing, features)
+    features = np.arange(len(lines)) if features is None else np.asarray(features, dtype=np.int64)
+    n = len(features)
+    length = lines.lengths()[features]
+
+    # Part starts other than the first of each feature, on the running
+    # along-channel distance of all vertices (which does not grow across gaps)
+    _, along = lines.along()
+    first, _ = lines.vertex_range()
+    internal = np.ones(len(lines.part_offsets) - 1, dtype=bool)
+    internal[lines.feature_offsets[:-1][lines.feature_offsets[:-1] < len(internal)]] = False
+    gaps = along[lines.part_offsets[:-1][internal]]
+    origin = along[first[features[owner]]] + start
+
+    out = []
+    for window in windows:
+        tol = 1e-9 * window
+        inside = start + window <= length[owner] + tol
+        # A window that starts or ends on a gap is skipped too, since the
+        # point at that distance may lie on either side of it
+        inside &= (
+            np.searchsorted(gaps, origin + window + tol, side="right")
+            == np.searchsorted(gaps, origin - tol, side="left")
+        )
+        o = owner[inside]
+        ex, ey = lines.interpolate(features[o], start[inside] + window)
+        chord = np.hypot(ex - x[inside], ey - y[inside])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sin = np.where(chord > 0, window / chord, np.nan)
+        ok = ~np.isnan(sin)
+        o, sin = o[ok], sin[ok]
+
+        count = np.bincount(o, minlength=n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(count > 0, np.bincount(o, sin, minlength=n) / count, np.nan)
+        peak = np.full(n, np.nan)
+        if len(o):
+            first = np.flatnonzero(np.r_[True, o[1:] != o[:-1]])
+            peak[o[first]] = np.maximum.reduceat(sin, first)
+        out.append((mean, peak))
+    return out
@@ -0,0 +1,224 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .segments import SegmentSet
+from .segment_index import SegmentGrid
+from .ray_cast import cast_ray_chunk
+
+# Arrays of a SegmentSet needed to rebuild it in a worker
+SEGMENT_ARRAYS = ("x0", "y0", "x1", "y1", "fids", "offsets")
+
+
+# --- Shared memory ---
+class SharedArrays:
+    """
+    NumPy arrays copied once into shared memory so worker processes can map
+    them read-only instead of receiving a pickled copy each.
+
+    Use as a context manager; the blocks are released on exit.
+    """
+
+    def __init__(self, arrays):
+        self._blocks = []
+        self.spec = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self._blocks.append(block)
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(spec):
+    """
+    Map the arrays described by SharedArrays.spec.
+
+    Returns:
+        tuple: (blocks, arrays); keep `blocks` alive while the read-only
+        `arrays` views are in use.
+    """
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in spec.items():
+        # Spawned workers share the parent's resource tracker; only the parent unlinks
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        blocks.append(block)
+        arrays[name] = array
+    return blocks, arrays
+
+
+# --- Worker processes ---
+def python_executable():
+    """
+    Python interpreter for spawned workers. Inside QGIS `sys.executable` is
+    often the QGIS binary itself, so look for the bundled interpreter.
+
+    Returns:
+        str or None: Path to a Python executable, or None if none is found.
+    """
+    exe = sys.executable
+    if exe and os.path.basename(exe).lower().startswith("python"):
+        return exe
+    version = f"{sys.version_info.major}.{sys.version_info.minor}"
+    for candidate in (
+        os.path.join(sys.exec_prefix, "python.exe"),
+        os.path.join(sys.exec_prefix, "python3.exe"),
+        os.path.join(sys.exec_prefix, "bin", f"python{version}"),
+        os.path.join(sys.exec_prefix, "bin", "python3"),
+    ):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def worker_count(workers):
+    """Number of worker processes; 0 or less means one per CPU core."""
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+_worker = {}
+
+
+def _init_worker(spec, grid_scalars, increment, max_steps, hits=False):
+    blocks, arrays = attach(spec)
+    _worker["blocks"] = blocks
+    _worker["segments"] = SegmentSet(*[arrays[name] for name in SEGMENT_ARRAYS])
+    _worker["grid"] = SegmentGrid.from_arrays(grid_scalars, arrays["cell_start"], arrays["cell_segments"])
+    _worker["increment"] = increment
+    _worker["max_steps"] = max_steps
+    _worker["hits"] = hits
+
+
+def _cast_chunk(lo, ox, oy, ex, ey):
+    result = cast_ray_chunk(
+        ox, oy, ex, ey, _worker["segments"], _worker["grid"], _worker["increment"], _worker["max_steps"],
+        _worker["hits"]
+    )
+    return (lo,) + result
+
+
+def parallel_cast(ox, oy, ex, ey, segments, grid, increment, max_steps, workers,
+                  chunk_size=4096, is_canceled=None, progress=None, hits=False):
+    """
+    cast_ray_chunk over a process pool.
+
+    The valley segments and grid are placed in shared memory once and mapped
+    read-only by every worker; only ray chunks and their results travel
+    between processes. Results are written back by ray position, so the
+    output is identical to a sequential run whatever order chunks finish in.
+
+    Parameters:
+        ox, oy, ex, ey (ndarray): Rays, as for cast_ray_chunk.
+        segments (SegmentSet), grid (SegmentGrid): Valley line index.
+        increment (float), max_steps (int): As for cast_ray_chunk.
+        workers (int): Worker processes (0 = one per CPU core).
+        chunk_size (int): Rays per task.
+        is_canceled (callable): Polled while waiting; when it returns True
+            queued chunks are dropped and the partial result is returned.
+        progress (callable): Called with the fraction of rays done.
+        hits (bool): Also return the intersections, as cast_ray_chunk.
+
+    Returns:
+        tuple: (lengths, counts, n_candidates), plus the hits with `hits`;
+        rays of dropped chunks keep length and count 0 and have no hits.
+
+    Raises:
+        RuntimeError: If no Python interpreter is found or the pool breaks.
+        OSError: If shared memory or worker processes cannot be created.
+    """
+    n = len(ox)
+    lengths = np.zeros(n, dtype=np.float64)
+    counts = np.zeros(n, dtype=np.int64)
+    n_candidates = 0
+    chunk_hits = {}
+
+    exe = python_executable()
+    if exe is None:
+        raise RuntimeError("no Python interpreter found for worker processes")
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(exe)
+
+    arrays = {name: getattr(segments, name) for name in SEGMENT_ARRAYS}
+    arrays["cell_start"] = grid.cell_start
+    arrays["cell_segments"] = grid.cell_segments
+
+    with SharedArrays(arrays) as shared:
+        executor = ProcessPoolExecutor(
+            max_workers=worker_count(workers), mp_context=context,
+            initializer=_init_worker, initargs=(shared.spec, grid.scalars(), increment, max_steps, hits)
+        )
+        try:
+            pending = {
+                executor.submit(_cast_chunk, lo, ox[lo:lo + chunk_size], oy[lo:lo + chunk_size],
+                                ex[lo:lo + chunk_size], ey[lo:lo + chunk_size])
+                for lo in range(0, n, chunk_size)
+            }
+            done_rays = 0
+            while pending:
+                done, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+                for future in done:
+                    lo, chunk_lengths, chunk_counts, chunk_candidates, *rest = future.result()
+                    if hits:
+                        chunk_hits[lo] = rest[0]
+                    lengths[lo:lo + len(chunk_lengths)] = chunk_lengths
+                    counts[lo:lo + len(chunk_counts)] = chunk_counts
+                    n_candidates += chunk_candidates
+                    done_rays += len(chunk_lengths)
+                if progress is not None and done:
+                    progress(done_rays / n)
+                if is_canceled is not None and is_canceled():
+                    break
+        finally:
+            # Wait for running chunks so no worker still maps the blocks when they are unlinked
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    if not hits:
+        return lengths, counts, n_candidates
+    return lengths, counts, n_candidates, concat_hits(chunk_hits)
+
+
+def concat_hits(chunk_hits):
+    """
+    Join per-chunk hits ({first ray: (ray, segment, x, y)}, ray indices
+    local to the chunk) into one set in ray order.
+    """
+    parts = [(ray + lo, seg, x, y) for lo, (ray, seg, x, y) in sorted(chunk_hits.items())]
+    if not parts:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+    return tuple(np.concatenate(column) for column in zip(*parts))
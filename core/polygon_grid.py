@@ -0,0 +1,160 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from .segment_index import SegmentGrid, _expand_ranges
+
+
+class ClassGrid:
+    """
+    Polygons rasterized to a grid of polygon indices.
+
+    A cell holds the index of the one polygon covering it, NO_DATA where no
+    polygon covers it, or MIXED where a polygon boundary passes through the
+    cell or polygons overlap. Only MIXED cells can give a different answer
+    for different points inside them, so callers resolve those with an exact
+    point-in-polygon test and every other lookup is a single array index.
+    """
+
+    NO_DATA = -1
+    MIXED = -2
+
+    @staticmethod
+    def code_dtype(n_polygons):
+        """
+        Smallest signed integer type holding every polygon index, the
+        coverage count and the negative codes.
+        """
+        for dtype in (np.int8, np.int16, np.int32):
+            if n_polygons <= np.iinfo(dtype).max:
+                return dtype
+        return np.int64
+
+    @classmethod
+    def cell_bytes(cls, n_polygons):
+        """
+        Peak bytes per grid cell while building a grid of `n_polygons`:
+        coverage counts and codes, int32 owner sums and two boolean masks.
+        """
+        return 2 * np.dtype(cls.code_dtype(n_polygons)).itemsize + 4 + 2
+
+    def __init__(self, rings, cell_size):
+        """
+        Parameters:
+            rings (SegmentSet): Polygon ring edges; `fid` of each edge is the
+                polygon index. Parts (exterior rings, holes, multipolygon
+                parts) follow the even-odd rule.
+            cell_size (float): Grid resolution in layer units.
+        """
+        # Same layout as a SegmentGrid of the rings, without its CSR index
+        grid = SegmentGrid.layout(rings, cell_size=cell_size)
+        self.x_min, self.y_min = grid.x_min, grid.y_min
+        self.cell_size = grid.cell_size
+        self.nx, self.ny = grid.nx, grid.ny
+        n_polygons = int(rings.fid.max()) + 1 if len(rings) else 0
+        dtype = self.code_dtype(n_polygons)
+
+        count, owner = self._fill(rings, dtype)
+        # Owner sums wrap around in int32 where polygons overlap; those cells
+        # are MIXED, and single-polygon cells hold an index that fits
+        codes = owner.astype(dtype)
+        del owner
+        codes[count != 1] = self.MIXED
+        codes[count == 0] = self.NO_DATA
+        del count
+
+        # Cells touched by any ring edge, by the segment grid's padded registration
+        if len(rings):
+            codes.reshape(-1)[grid.registered_cells(rings)[1]] = self.MIXED
+        self.codes = codes
+
+    def _fill(self, rings, dtype):
+        """
+        Even-odd scanline fill at cell centers.
+
+        Returns:
+            tuple: (count, owner) arrays of shape (ny, nx); count (`dtype`)
+            is the number of polygons covering each cell center and owner
+            (int32) the sum of their indices, which is the index itself
+            where count == 1.
+        """
+        count = np.zeros((self.ny, self.nx + 1), dtype=dtype)
+        owner = np.zeros((self.ny, self.nx + 1), dtype=np.int32)
+        if len(rings) == 0:
+            return count[:, :-1], owner[:, :-1]
+
+        x0, y0, x1, y1, poly = rings.x0, rings.y0, rings.x1, rings.y1, rings.fid
+        cs = self.cell_size
+
+        # Rows whose center line yc satisfies min(y0, y1) <= yc < max(y0, y1)
+        lo = np.ceil((np.minimum(y0, y1) - self.y_min) / cs - 0.5).astype(np.int64)
+        hi = np.ceil((np.maximum(y0, y1) - self.y_min) / cs - 0.5).astype(np.int64)
+        lo, hi = np.clip(lo, 0, self.ny), np.clip(hi, 0, self.ny)
+        n = np.maximum(hi - lo, 0)
+        edge = np.repeat(np.arange(len(x0)), n)
+        row = _expand_ranges(lo, n)
+        if len(row) == 0:
+            return count[:, :-1], owner[:, :-1]
+
+        yc = self.y_min + (row + 0.5) * cs
+        x = x0[edge] + (yc - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+        p = poly[edge]
+
+        # Pair consecutive crossings of each (polygon, row) into filled spans
+        order = np.lexsort((x, row, p))
+        x, row, p = x[order], row[order], p[order]
+        new_group = np.ones(len(x), dtype=bool)
+        new_group[1:] = (p[1:] != p[:-1]) | (row[1:] != row[:-1])
+        start = np.flatnonzero(new_group)
+        position = np.arange(len(x)) - np.repeat(start, np.diff(np.append(start, len(x))))
+        enter = np.flatnonzero(position % 2 == 0)
+        enter = enter[enter + 1 < len(x)]
+        enter = enter[~new_group[enter + 1]]
+
+        # Cells whose center lies in [x_enter, x_leave)
+        c0 = np.ceil((x[enter] - self.x_min) / cs - 0.5).astype(np.int64)
+        c1 = np.ceil((x[enter + 1] - self.x_min) / cs - 0.5).astype(np.int64)
+        c0, c1 = np.clip(c0, 0, self.nx), np.clip(c1, 0, self.nx)
+        span = c1 > c0
+        r, c0, c1, p = row[enter][span], c0[span], c1[span], p[enter][span]
+
+        p = p.astype(np.int32)
+        np.add.at(count, (r, c0), 1)
+        np.add.at(count, (r, c1), -1)
+        np.add.at(owner, (r, c0), p)
+        np.add.at(owner, (r, c1), -p)
+        np.cumsum(count, axis=1, dtype=dtype, out=count)
+        np.cumsum(owner, axis=1, dtype=np.int32, out=owner)
+        return count[:, :-1], owner[:, :-1]
+
+    def lookup(self, xs, ys):
+        """
+        Cell code at each point: a polygon index, NO_DATA or MIXED.
+        Points outside the grid are NO_DATA; NaN coordinates are MIXED.
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        x_max = self.x_min + self.nx * self.cell_size
+        y_max = self.y_min + self.ny * self.cell_size
+        with np.errstate(invalid="ignore"):
+            inside = (xs >= self.x_min) & (xs <= x_max) & (ys >= self.y_min) & (ys <= y_max)
+            cols = np.clip(np.floor((xs - self.x_min) / self.cell_size), 0, self.nx - 1)
+            rows = np.clip(np.floor((ys - self.y_min) / self.cell_size), 0, self.ny - 1)
+        codes = np.full(len(xs), self.NO_DATA, dtype=np.int64)
+        codes[np.isnan(xs) | np.isnan(ys)] = self.MIXED
+        codes[inside] = self.codes[rows[inside].astype(np.int64), cols[inside].astype(np.int64)]
+        return codes
@@ -0,0 +1,252 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import struct
+
+import numpy as np
+
+# WKB geometry type codes
+WKB_LINESTRING = 2
+WKB_MULTILINESTRING = 5
+
+# EWKB flags
+EWKB_Z = 0x80000000
+EWKB_M = 0x40000000
+EWKB_SRID = 0x20000000
+
+
+# --- WKB ---
+def _wkb_header(blob, offset):
+    """
+    Byte order, base type, coordinate dimension and payload offset of the
+    WKB geometry at `offset`; handles ISO (1000/2000/3000) and EWKB types.
+    """
+    order = "<" if blob[offset] == 1 else ">"
+    code, = struct.unpack_from(order + "I", blob, offset + 1)
+    offset += 5
+    if code & (EWKB_Z | EWKB_M | EWKB_SRID):
+        dim = 2 + bool(code & EWKB_Z) + bool(code & EWKB_M)
+        if code & EWKB_SRID:
+            offset += 4
+        code &= 0x0FFFFFFF
+    else:
+        dim = 2 + (code // 1000 in (1, 2)) + 2 * (code // 1000 == 3)
+        code %= 1000
+    return order, code, dim, offset
+
+
+def _wkb_linestring(blob, offset, order, dim, parts):
+    n, = struct.unpack_from(order + "I", blob, offset)
+    offset += 4
+    coords = np.frombuffer(blob, dtype=order + "f8", count=n * dim, offset=offset)
+    parts.append(coords.reshape(n, dim)[:, :2])
+    return offset + 8 * n * dim
+
+
+def wkb_parts(blob):
+    """
+    Vertex arrays of the parts of a LineString or MultiLineString WKB.
+
+    Parameters:
+        blob (bytes): ISO or EWKB geometry; Z and M values are dropped.
+
+    Returns:
+        list: (n, 2) float64 arrays of x/y, one per part.
+
+    Raises:
+        ValueError: For any other geometry type.
+    """
+    parts = []
+    order, code, dim, offset = _wkb_header(blob, 0)
+    if code == WKB_LINESTRING:
+        _wkb_linestring(blob, offset, order, dim, parts)
+    elif code == WKB_MULTILINESTRING:
+        n, = struct.unpack_from(order + "I", blob, offset)
+        offset += 4
+        for _ in range(n):
+            part_order, part_code, part_dim, offset = _wkb_header(blob, offset)
+            if part_code != WKB_LINESTRING:
+                raise ValueError(f"Unsupported WKB part type {part_code}")
+            offset = _wkb_linestring(blob, offset, part_order, part_dim, parts)
+    else:
+        raise ValueError(f"Unsupported WKB geometry type {code}")
+    return parts
+
+
+# --- Vertex arrays ---
+class PolylineSet:
+    """
+    Line features (single or multipart) as flat vertex arrays.
+
+    `x`/`y` hold the vertices of every part of every feature in order;
+    `part_offsets[j]:part_offsets[j + 1]` is the vertex slice of part j and
+    `feature_offsets[i]:feature_offsets[i + 1]` the parts of feature i.
+    """
+
+    def __init__(self, x, y, part_offsets, feature_offsets):
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.part_offsets = np.ascontiguousarray(part_offsets, dtype=np.int64)
+        self.feature_offsets = np.ascontiguousarray(feature_offsets, dtype=np.int64)
+        self._steps = None
+
+    @classmethod
+    def from_parts(cls, features):
+        """
+        Build a PolylineSet from per-feature lists of (n, 2) vertex arrays
+        (an empty list for a NULL geometry).
+        """
+        parts = []
+        feature_counts = []
+        for feature_parts in features:
+            parts.extend(feature_parts)
+            feature_counts.append(len(feature_parts))
+        part_offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in parts], out=part_offsets[1:])
+        feature_offsets = np.zeros(len(feature_counts) + 1, dtype=np.int64)
+        np.cumsum(feature_counts, out=feature_offsets[1:])
+        xy = np.concatenate(parts) if parts else np.empty((0, 2), dtype=np.float64)
+        return cls(xy[:, 0], xy[:, 1], part_offsets, feature_offsets)
+
+    @classmethod
+    def from_wkb(cls, blobs):
+        """
+        Build a PolylineSet from LineString/MultiLineString WKB, one blob per
+        feature; None stands for a NULL geometry.
+        """
+        return cls.from_parts(wkb_parts(blob) if blob is not None else [] for blob in blobs)
+
+    def __len__(self):
+        return len(self.feature_offsets) - 1
+
+    def vertex_range(self):
+        """
+        First and one-past-last vertex index of every feature.
+
+        Returns:
+            tuple: (first, stop) int64 arrays of length len(self).
+        """
+        return self.part_offsets[self.feature_offsets[:-1]], self.part_offsets[self.feature_offsets[1:]]
+
+    def along(self):
+        """
+        Length of the step from each vertex to the next (0 from the last
+        vertex of a part to the first of the next) and the running sum of
+        the steps over all vertices. Computed once per set.
+
+        Returns:
+            tuple: (step, along) float64 arrays over all vertices; step has
+            one entry fewer than along.
+        """
+        if self._steps is None:
+            step = np.hypot(np.diff(self.x), np.diff(self.y))
+            step[self.part_offsets[1:-1][self.part_offsets[1:-1] > 0] - 1] = 0.0
+            along = np.zeros(len(self.x), dtype=np.float64)
+            np.cumsum(step, out=along[1:])
+            self._steps = step, along
+        return self._steps
+
+    def lengths(self):
+        """
+        Total length of every feature, summed over its parts; the gaps
+        between consecutive parts are not counted.
+        """
+        _, along = self.along()
+        first, stop = self.vertex_range()
+        lengths = np.zeros(len(self), dtype=np.float64)
+        has = stop > first
+        lengths[has] = along[stop[has] - 1] - along[first[has]]
+        return lengths
+
+    def endpoints(self):
+        """
+        Start and end vertex of every feature: the first vertex of its first
+        part and the last vertex of its last part, i.e. parts are taken in
+        digitized order. NaN for features with fewer than two vertices.
+
+        Returns:
+            tuple: (x0, y0, x1, y1) arrays.
+        """
+        first, stop = self.vertex_range()
+        valid = stop - first >= 2
+        out = [np.full(len(self), np.nan) for _ in range(4)]
+        out[0][valid] = self.x[first[valid]]
+        out[1][valid] = self.y[first[valid]]
+        out[2][valid] = self.x[stop[valid] - 1]
+        out[3][valid] = self.y[stop[valid] - 1]
+        return tuple(out)
+
+    def densify(self, spacing, features=None):
+        """
+        Points every `spacing` along features, from the start of the first
+        part to the end of the last part (end point included), as one batch.
+
+        Parameters:
+            spacing (float): Distance between points along the line.
+            features (ndarray): Optional indices of the features to sample;
+                all features by default.
+
+        Returns:
+            tuple: (owner, distance, x, y) arrays, one entry per point;
+            `owner` is the position of the point's feature in `features` and
+            `distance` its distance along the feature. Points are grouped by
+            owner in increasing distance; features with fewer than two
+            vertices get no points.
+        """
+        features = np.arange(len(self)) if features is None else np.asarray(features, dtype=np.int64)
+        _, along = self.along()
+        first, stop = self.vertex_range()
+        first, stop = first[features], stop[features]
+        has = stop - first >= 2
+        length = np.zeros(len(features), dtype=np.float64)
+        length[has] = along[stop[has] - 1] - along[first[has]]
+
+        count = np.where(has, np.floor(length / spacing).astype(np.int64) + 1, 0)
+        count += has & (length - (count - 1) * spacing > 1e-9 * spacing)
+        owner = np.repeat(np.arange(len(features)), count)
+        starts = np.cumsum(count) - count
+        distance = np.minimum((np.arange(len(owner)) - starts[owner]) * spacing, length[owner])
+
+        x, y = self.interpolate(features[owner], distance)
+        return owner, distance, x, y
+
+    def interpolate(self, features, distance):
+        """
+        Points at `distance` along features, walking their parts in order;
+        distances beyond either end are clamped to the end vertex.
+
+        Parameters:
+            features (ndarray): Feature index of every point; the features
+                must have at least two vertices.
+            distance (ndarray): Distance of every point along its feature.
+
+        Returns:
+            tuple: (x, y) arrays.
+        """
+        step, along = self.along()
+        first, stop = self.vertex_range()
+        first, stop = first[features], stop[features]
+
+        # Vertex step holding each point
+        position = along[first] + distance
+        j = np.searchsorted(along, position, side="right") - 1
+        j = np.clip(j, first, stop - 2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(step[j] > 0, (position - along[j]) / step[j], 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        x = self.x[j] + t * (self.x[j + 1] - self.x[j])
+        y = self.y[j] + t * (self.y[j + 1] - self.y[j])
+        return x, y
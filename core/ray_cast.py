@@ -0,0 +1,70 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from .segments import intersect_rays, drop_duplicate_hits
+
+
+def cast_ray_chunk(ox, oy, ex, ey, segments, grid, increment, max_steps, hits=False):
+    """
+    Casts a batch of half-transect rays and snaps each to the length the
+    incremental search would stop at.
+
+    Parameters:
+        ox, oy, ex, ey (ndarray): Ray origins and end points (cast to the
+            full reach, max_steps * increment).
+        segments (SegmentSet): Exploded valley lines.
+        grid (SegmentGrid): Segment index over the same valley lines.
+        increment (float): Extension increment.
+        max_steps (int): Number of increments in the full reach.
+        hits (bool): Also return the intersections within each snapped
+            half-transect.
+
+    Returns:
+        tuple: (lengths, counts, n_candidates) where lengths and counts are
+        aligned with the rays and n_candidates is the number of
+        (ray, segment) pairs tested. With `hits`, a fourth item holds the
+        (ray, segment, x, y) arrays of every intersection up to the ray's
+        length, sorted by ray and distance; repeated crossings are kept.
+    """
+    n = len(ox)
+    ray_idx, seg_idx = grid.query_rays(ox, oy, ex, ey)
+    n_candidates = len(seg_idx)
+    ray_idx, seg_idx, t, x, y = intersect_rays(ox, oy, ex, ey, segments, ray_idx, seg_idx)
+
+    order = np.lexsort((t, ray_idx))
+    ray_idx, seg_idx, t, x, y = ray_idx[order], seg_idx[order], t[order], x[order], y[order]
+    all_hits = (ray_idx, seg_idx, t, x, y)
+    keep = drop_duplicate_hits(ray_idx, x, y)
+    ray_idx, t = ray_idx[keep], t[keep]
+
+    n_hits = np.bincount(ray_idx, minlength=n)
+    first = np.concatenate(([0], np.cumsum(n_hits)[:-1]))
+    found = n_hits >= 2
+
+    steps = np.full(n, max_steps, dtype=np.int64)
+    second = t[first[found] + 1]
+    steps[found] = np.clip(np.ceil(second / increment), 1, max_steps).astype(np.int64)
+    lengths = steps * float(increment)
+
+    counts = np.bincount(ray_idx, weights=t <= lengths[ray_idx], minlength=n).astype(np.int64)
+    if not hits:
+        return lengths, counts, n_candidates
+
+    ray_idx, seg_idx, t, x, y = all_hits
+    inside = t <= lengths[ray_idx]
+    return lengths, counts, n_candidates, (ray_idx[inside], seg_idx[inside], x[inside], y[inside])
@@ -0,0 +1,266 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from .parallel import python_executable, worker_count
+
+try:
+    from scipy import ndimage
+except ImportError:  # Without SciPy the nearest channel pixel comes from jump flooding
+    ndimage = None
+
+
+# --- Nearest channel pixel ---
+def _jump_flood(seed_rows, seed_cols, shape, max_step, x_res, y_res):
+    """
+    Row and column of the (approximately) nearest seed of every pixel, by
+    jump flooding: log2(max_step) + 1 sweeps of whole-array shifts, plus a
+    final one-pixel sweep. Pixels with no seed within reach get -1.
+    """
+    h, w = shape
+    near_r = np.full(shape, -1, dtype=np.int32)
+    near_c = np.full(shape, -1, dtype=np.int32)
+    dist = np.full(shape, np.inf, dtype=np.float32)
+    near_r[seed_rows, seed_cols] = seed_rows
+    near_c[seed_rows, seed_cols] = seed_cols
+    dist[seed_rows, seed_cols] = 0.0
+    rows = np.arange(h, dtype=np.float32)[:, None] * np.float32(y_res)
+    cols = np.arange(w, dtype=np.float32)[None, :] * np.float32(x_res)
+
+    step = 1 << max(int(np.ceil(np.log2(max(max_step, 1)))), 0)
+    steps = []
+    while step >= 1:
+        steps.append(step)
+        step //= 2
+    for step in steps + [1]:
+        for dr in (-step, 0, step):
+            for dc in (-step, 0, step):
+                if (dr == 0 and dc == 0) or abs(dr) >= h or abs(dc) >= w:
+                    continue
+                # Pixel (i, j) looks at the seed held by pixel (i + dr, j + dc)
+                dst = (slice(max(-dr, 0), h - max(dr, 0)), slice(max(-dc, 0), w - max(dc, 0)))
+                src = (slice(max(dr, 0), h + min(dr, 0)), slice(max(dc, 0), w + min(dc, 0)))
+                cand_r = near_r[src]
+                cand_c = near_c[src]
+                dy = cand_r * np.float32(y_res) - rows[dst[0]]
+                dx = cand_c * np.float32(x_res) - cols[:, dst[1]]
+                d = dy * dy
+                d += dx * dx
+                better = d < dist[dst]
+                better &= cand_r >= 0
+                np.copyto(near_r[dst], cand_r, where=better)
+                np.copyto(near_c[dst], cand_c, where=better)
+                np.copyto(dist[dst], d, where=better)
+    return near_r, near_c
+
+
+def nearest_seed(seed_rows, seed_cols, shape, max_distance, x_res=1.0, y_res=1.0):
+    """
+    Row and column of the nearest seed pixel of every pixel of a grid.
+
+    Uses SciPy's exact Euclidean distance transform when SciPy is available
+    and jump flooding otherwise.
+
+    Parameters:
+        seed_rows, seed_cols (ndarray): Seed pixels (inside the grid).
+        shape (tuple): Grid shape (rows, cols).
+        max_distance (float): Search radius in map units; jump flooding
+            does not look further.
+        x_res, y_res (float): Pixel size.
+
+    Returns:
+        tuple: (rows, cols) int arrays of the grid's shape; -1 where there
+        is no seed.
+    """
+    if len(seed_rows) == 0:
+        return np.full(shape, -1, dtype=np.int32), np.full(shape, -1, dtype=np.int32)
+    if ndimage is not None:
+        background = np.ones(shape, dtype=bool)
+        background[seed_rows, seed_cols] = False
+        near_r, near_c = ndimage.distance_transform_edt(
+            background, sampling=(y_res, x_res), return_distances=False, return_indices=True
+        )
+        return near_r, near_c
+    max_step = int(np.ceil(max_distance / min(x_res, y_res)))
+    return _jump_flood(seed_rows, seed_cols, shape, max_step, x_res, y_res)
+
+
+# --- Tiles ---
+def tile_windows(width, height, tile_size):
+    """
+    Yields (r0, c0, r1, c1) pixel windows covering a raster in row-major order.
+    """
+    for r0 in range(0, height, tile_size):
+        for c0 in range(0, width, tile_size):
+            yield r0, c0, min(r0 + tile_size, height), min(c0 + tile_size, width)
+
+
+class SeedIndex:
+    """
+    Channel seed pixels bucketed by tile, so the seeds within the halo of a
+    tile are gathered from the neighbouring buckets instead of a scan of
+    all seeds.
+    """
+
+    def __init__(self, rows, cols, z, tile_size):
+        self.tile_size = tile_size
+        bucket_r = rows // tile_size
+        bucket_c = cols // tile_size
+        self.n_cols = int(bucket_c.max()) + 1 if len(cols) else 1
+        key = bucket_r * self.n_cols + bucket_c
+        order = np.argsort(key, kind="stable")
+        self.rows, self.cols, self.z = rows[order], cols[order], z[order]
+        self.key = key[order]
+
+    def window(self, r0, c0, r1, c1, halo):
+        """
+        Seeds inside the window grown by `halo` pixels on every side.
+
+        Returns:
+            tuple: (rows, cols, z) in raster pixel coordinates.
+        """
+        t = self.tile_size
+        b_r0, b_r1 = max(r0 - halo, 0) // t, (r1 - 1 + halo) // t
+        b_c0, b_c1 = max(c0 - halo, 0) // t, min((c1 - 1 + halo) // t, self.n_cols - 1)
+        parts = []
+        for b_r in range(b_r0, b_r1 + 1):
+            lo = np.searchsorted(self.key, b_r * self.n_cols + b_c0, side="left")
+            hi = np.searchsorted(self.key, b_r * self.n_cols + b_c1, side="right")
+            parts.append(np.arange(lo, hi))
+        idx = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        rows, cols = self.rows[idx], self.cols[idx]
+        keep = (rows >= r0 - halo) & (rows < r1 + halo) & (cols >= c0 - halo) & (cols < c1 + halo)
+        return rows[keep], cols[keep], self.z[idx][keep]
+
+
+def rem_tile(dem, r0, c0, seed_rows, seed_cols, seed_z, halo, max_distance, x_res, y_res):
+    """
+    Relative elevation of one DEM tile: the height of every pixel above the
+    elevation of its nearest channel pixel.
+
+    Parameters:
+        dem (ndarray): Tile elevations (NaN for no data).
+        r0, c0 (int): Raster row/column of the tile's first pixel.
+        seed_rows, seed_cols, seed_z (ndarray): Channel pixels in raster
+            coordinates within `halo` pixels of the tile, and their elevation.
+        halo (int): Pixels of overlap searched around the tile.
+        max_distance (float): Pixels further than this from every channel
+            get no data.
+        x_res, y_res (float): Pixel size.
+
+    Returns:
+        ndarray: float32 relative elevations, NaN for no data.
+    """
+    h, w = dem.shape
+    if len(seed_rows) == 0 or np.isnan(dem).all():
+        return np.full((h, w), np.nan, dtype=np.float32)
+    # Local grid: the tile plus its halo
+    top, left = r0 - halo, c0 - halo
+    shape = (h + 2 * halo, w + 2 * halo)
+    near_r, near_c = nearest_seed(seed_rows - top, seed_cols - left, shape, max_distance, x_res, y_res)
+    near_r = near_r[halo:halo + h, halo:halo + w]
+    near_c = near_c[halo:halo + h, halo:halo + w]
+
+    z = np.full(shape, np.nan)
+    z[seed_rows - top, seed_cols - left] = seed_z
+    has = near_r >= 0
+    base = np.full((h, w), np.nan)
+    base[has] = z[near_r[has], near_c[has]]
+    dy = (near_r - np.arange(halo, halo + h)[:, None]) * y_res
+    dx = (near_c - np.arange(halo, halo + w)[None, :]) * x_res
+    base[~has | (dx * dx + dy * dy > max_distance * max_distance)] = np.nan
+    return (dem - base).astype(np.float32)
+
+
+# --- Worker processes ---
+def _rem_task(window, dem, seeds, halo, max_distance, x_res, y_res):
+    return window, rem_tile(dem, window[0], window[1], *seeds, halo, max_distance, x_res, y_res)
+
+
+def _parallel_rem(windows, read_tile, seeds, halo, max_distance, x_res, y_res, write_tile,
+                  workers, is_canceled, progress):
+    exe = python_executable()
+    if exe is None:
+        raise RuntimeError("no Python interpreter found for worker processes")
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(exe)
+    max_workers = worker_count(workers)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        queue = iter(windows)
+        pending = set()
+        done_tiles = 0
+        while True:
+            while len(pending) < 2 * max_workers and not (is_canceled is not None and is_canceled()):
+                window = next(queue, None)
+                if window is None:
+                    break
+                pending.add(executor.submit(_rem_task, window, read_tile(window), seeds.window(*window, halo),
+                                            halo, max_distance, x_res, y_res))
+            if not pending:
+                return
+            done, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            for future in done:
+                write_tile(*future.result())
+                done_tiles += 1
+            if progress is not None and done:
+                progress(done_tiles / len(windows))
+            if is_canceled is not None and is_canceled():
+                executor.shutdown(wait=True, cancel_futures=True)
+                return
+
+
+def compute_rem(windows, read_tile, seeds, halo, max_distance, x_res, y_res, write_tile,
+                workers=1, is_canceled=None, progress=None, on_fallback=None):
+    """
+    Relative elevation model over tiles, in this process or a process pool.
+
+    Tiles are read and written in this process; with workers, at most two
+    tiles per worker are in flight so memory stays bounded.
+
+    Parameters:
+        windows (list): (r0, c0, r1, c1) tiles (tile_windows).
+        read_tile (callable): read_tile(window) -> DEM array of the tile.
+        seeds (SeedIndex): Channel pixels and elevations.
+        halo (int), max_distance (float), x_res, y_res (float): As for rem_tile.
+        write_tile (callable): write_tile(window, rem) stores a finished tile.
+        workers (int): Worker processes; 1 runs in this process, 0 uses one
+            per CPU core. Results do not depend on the worker count.
+        is_canceled (callable): Optional; polled between tiles.
+        progress (callable): Optional; called with the fraction of tiles done.
+        on_fallback (callable): Optional; called with the error message when
+            the process pool cannot start and the tiles are computed in this
+            process instead.
+    """
+    if workers != 1:
+        try:
+            return _parallel_rem(windows, read_tile, seeds, halo, max_distance, x_res, y_res, write_tile,
+                                 workers, is_canceled, progress)
+        except (OSError, RuntimeError) as e:
+            if on_fallback is not None:
+                on_fallback(f"Parallel REM tiles unavailable ({e}); using a single process.")
+
+    for k, window in enumerate(windows):
+        if is_canceled is not None and is_canceled():
+            return
+        window, rem = _rem_task(window, read_tile(window), seeds.window(*window, halo),
+                                halo, max_distance, x_res, y_res)
+        write_tile(window, rem)
+        if progress is not None:
+            progress((k + 1) / len(windows))
@@ -0,0 +1,143 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sqlite3
+
+import numpy as np
+
+# Transect state of every river segment; with the segment's own geometry
+# this is enough to rebuild its transect line
+TRANSECT_COLUMNS = ["context", "left_length", "right_length", "left_n", "right_n"]
+
+# The nine OpenRES features
+FEATURE_COLUMNS = ["ELE", "PRE", "GEO", "VFW", "VW", "LVS", "RVS", "DVS", "SIN"]
+
+COLUMNS = ["fingerprint", "t_id"] + TRANSECT_COLUMNS + FEATURE_COLUMNS
+
+
+class ResultStore:
+    """
+    SQLite store of per-segment pipeline results from the previous run,
+    keyed by the river segment's geometry fingerprint.
+
+    The store hands out t_IDs: a segment whose fingerprint is already known
+    keeps its t_ID, new segments get IDs above every ID ever issued, so IDs
+    of deleted segments are not reused. `run_key` identifies the parameters
+    and whole-layer inputs of a run; stored results are only reusable when
+    it is unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            "fingerprint TEXT PRIMARY KEY, t_id INTEGER UNIQUE NOT NULL, context TEXT, "
+            "left_length REAL, right_length REAL, left_n INTEGER, right_n INTEGER, "
+            "ELE REAL, PRE REAL, GEO, VFW REAL, VW REAL, LVS REAL, RVS REAL, DVS REAL, SIN REAL)"
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Metadata ---
+    def _meta(self, key, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def run_key(self):
+        return self._meta("run_key")
+
+    # --- Segments ---
+    def assign_ids(self, fingerprints):
+        """
+        t_IDs for the given fingerprints: stored IDs for known fingerprints,
+        fresh ones (in input order) for the rest. Fresh IDs are only
+        persisted by save().
+
+        Returns:
+            ndarray: int64 t_IDs aligned with `fingerprints`.
+        """
+        known = dict(self.db.execute("SELECT fingerprint, t_id FROM segments"))
+        next_id = int(self._meta("next_t_id", 0))
+        if known:
+            next_id = max(next_id, max(known.values()) + 1)
+        t_ids = np.empty(len(fingerprints), dtype=np.int64)
+        for i, fp in enumerate(fingerprints):
+            if fp in known:
+                t_ids[i] = known[fp]
+            else:
+                t_ids[i] = next_id
+                next_id += 1
+        return t_ids
+
+    def load(self, fingerprints):
+        """
+        Stored rows for the given fingerprints.
+
+        Returns:
+            dict: fingerprint -> {column: value} for the fingerprints found.
+        """
+        wanted = set(fingerprints)
+        cursor = self.db.execute(f"SELECT {', '.join(COLUMNS)} FROM segments")
+        return {row[0]: dict(zip(COLUMNS, row)) for row in cursor if row[0] in wanted}
+
+    def save(self, run_key, rows, keep):
+        """
+        Replace the store's contents for one run.
+
+        Parameters:
+            run_key (str): Key of the run that produced `rows`.
+            rows (list): {column: value} dicts of recomputed segments.
+            keep (iterable): Fingerprints present in the run; stored
+                segments not listed are deleted.
+        """
+        keep = set(keep)
+        with self.db:
+            stale = [(fp,) for (fp,) in self.db.execute("SELECT fingerprint FROM segments") if fp not in keep]
+            self.db.executemany("DELETE FROM segments WHERE fingerprint = ?", stale)
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO segments ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+                [tuple(_plain(row.get(c)) for c in COLUMNS) for row in rows]
+            )
+            max_id = self.db.execute("SELECT MAX(t_id) FROM segments").fetchone()[0]
+            if max_id is not None:
+                self._set_meta("next_t_id", max(int(self._meta("next_t_id", 0)), max_id + 1))
+            self._set_meta("run_key", run_key)
+
+
+def _plain(value):
+    """
+    SQLite-storable form of a value: NumPy scalars to Python, NaN to NULL.
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
@@ -0,0 +1,215 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+
+def _expand_ranges(starts, lengths):
+    """Concatenate the integer ranges [start, start + length) without a Python loop."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(np.asarray(starts, dtype=np.int64), lengths) + np.arange(lengths.sum(), dtype=np.int64) - offsets
+
+
+class SegmentGrid:
+    """
+    Static uniform grid over the segments of a SegmentSet.
+
+    Every segment is registered in each cell its (slightly padded) bounding
+    box overlaps. Cell contents are stored in CSR form: the segments of cell
+    `c` are `cell_segments[cell_start[c]:cell_start[c + 1]]`.
+
+    Queries walk the exact run of cells a ray crosses, so long rays over
+    large valley line layers only test the segments they actually pass near.
+    """
+
+    def __init__(self, segments, cell_size=None, segments_per_cell=4):
+        """
+        Parameters:
+            segments (SegmentSet): Exploded valley lines.
+            cell_size (float): Grid cell size in layer units. Chosen from the
+                layer extent and segment count when None.
+            segments_per_cell (int): Target average occupancy used to pick the
+                automatic cell size.
+        """
+        self._set_layout(segments, cell_size, segments_per_cell)
+        if self.n_segments == 0:
+            self.cell_start = np.zeros(2, dtype=np.int64)
+            self.cell_segments = np.empty(0, dtype=np.int64)
+            return
+
+        seg, cells = self.registered_cells(segments)
+        order = np.argsort(cells, kind="stable")
+        self.cell_segments = seg[order]
+        self.cell_start = np.zeros(self.nx * self.ny + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.nx * self.ny), out=self.cell_start[1:])
+
+    @classmethod
+    def layout(cls, segments, cell_size=None, segments_per_cell=4):
+        """
+        A grid with the origin, cell size and shape SegmentGrid(segments)
+        would have, but no cell arrays; for callers that only need
+        registered_cells and not the O(cells) CSR index.
+        """
+        grid = cls.__new__(cls)
+        grid._set_layout(segments, cell_size, segments_per_cell)
+        grid.cell_start = grid.cell_segments = None
+        return grid
+
+    def _set_layout(self, segments, cell_size, segments_per_cell):
+        self.n_segments = len(segments)
+        if self.n_segments == 0:
+            self.x_min = self.y_min = 0.0
+            self.cell_size = 1.0
+            self.nx = self.ny = 1
+            return
+
+        self.x_min = float(np.minimum(segments.x0, segments.x1).min())
+        self.y_min = float(np.minimum(segments.y0, segments.y1).min())
+        width = max(float(np.maximum(segments.x0, segments.x1).max()) - self.x_min, 0.0)
+        height = max(float(np.maximum(segments.y0, segments.y1).max()) - self.y_min, 0.0)
+
+        if cell_size is None:
+            lengths = np.hypot(segments.x1 - segments.x0, segments.y1 - segments.y0)
+            area = max(width * height, 1.0)
+            cell_size = max(np.sqrt(area * segments_per_cell / self.n_segments), float(np.median(lengths)), 1e-6)
+        self.cell_size = float(cell_size)
+        self.nx = int(width // self.cell_size) + 1
+        self.ny = int(height // self.cell_size) + 1
+
+    def registered_cells(self, segments):
+        """
+        Every (segment, cell) registration: each segment in each cell its
+        padded bounding box overlaps.
+
+        Returns:
+            tuple: (seg, cells) int64 arrays; cells are row-major indices.
+        """
+        # Pad so that crossings on a cell edge register on both sides
+        pad = self.cell_size * 1e-9
+        ix0, ix1 = self._col(np.minimum(segments.x0, segments.x1) - pad), self._col(np.maximum(segments.x0, segments.x1) + pad)
+        iy0, iy1 = self._row(np.minimum(segments.y0, segments.y1) - pad), self._row(np.maximum(segments.y0, segments.y1) + pad)
+        w = ix1 - ix0 + 1
+        counts = w * (iy1 - iy0 + 1)
+
+        seg = np.repeat(np.arange(len(segments), dtype=np.int64), counts)
+        k = np.arange(counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        w = np.repeat(w, counts)
+        cells = (np.repeat(iy0, counts) + k // w) * self.nx + np.repeat(ix0, counts) + k % w
+        return seg, cells
+
+    # Scalar attributes that, with cell_start and cell_segments, fully describe a grid
+    SCALARS = ("x_min", "y_min", "cell_size", "nx", "ny", "n_segments")
+
+    def scalars(self):
+        """Scalar grid attributes as a dict, for rebuilding with from_arrays."""
+        return {name: getattr(self, name) for name in self.SCALARS}
+
+    @classmethod
+    def from_arrays(cls, scalars, cell_start, cell_segments):
+        """
+        Rebuild a grid around existing cell arrays (e.g. views of shared
+        memory) without re-indexing the segments.
+        """
+        grid = cls.__new__(cls)
+        for name in cls.SCALARS:
+            setattr(grid, name, scalars[name])
+        grid.cell_start = cell_start
+        grid.cell_segments = cell_segments
+        return grid
+
+    def _col(self, x):
+        return np.clip(np.floor((x - self.x_min) / self.cell_size), 0, self.nx - 1).astype(np.int64)
+
+    def _row(self, y):
+        return np.clip(np.floor((y - self.y_min) / self.cell_size), 0, self.ny - 1).astype(np.int64)
+
+    def _clip(self, x0, y0, dx, dy):
+        """Liang-Barsky clip of p = (x0, y0) + u * (dx, dy), u in [0, 1], to the grid extent."""
+        lo = np.zeros(len(x0))
+        hi = np.ones(len(x0))
+        x_max = self.x_min + self.nx * self.cell_size
+        y_max = self.y_min + self.ny * self.cell_size
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for p, d, a, b in ((x0, dx, self.x_min, x_max), (y0, dy, self.y_min, y_max)):
+                ua = (a - p) / d
+                ub = (b - p) / d
+                enter = np.where(d != 0, np.minimum(ua, ub), np.where((p >= a) & (p <= b), -np.inf, np.inf))
+                leave = np.where(d != 0, np.maximum(ua, ub), np.where((p >= a) & (p <= b), np.inf, -np.inf))
+                lo = np.maximum(lo, enter)
+                hi = np.minimum(hi, leave)
+        return lo, hi
+
+    def _crossings(self, p0, d, ua, ub, origin):
+        """Parameters at which each clipped ray crosses the grid lines of one axis."""
+        a = np.floor((p0 + ua * d - origin) / self.cell_size)
+        b = np.floor((p0 + ub * d - origin) / self.cell_size)
+        first = np.minimum(a, b) + 1
+        n = np.maximum(np.abs(b - a), 0).astype(np.int64)
+        owner = np.repeat(np.arange(len(p0)), n)
+        k = _expand_ranges(np.zeros(len(n), dtype=np.int64), n)
+        line = origin + (np.repeat(first, n) + k) * self.cell_size
+        with np.errstate(divide="ignore", invalid="ignore"):
+            u = (line - p0[owner]) / d[owner]
+        return owner, u
+
+    def query_rays(self, x0, y0, x1, y1):
+        """
+        Candidate segments for a batch of rays (straight query segments).
+
+        Parameters:
+            x0, y0, x1, y1 (ndarray): Ray start and end coordinates.
+
+        Returns:
+            tuple: (ray_idx, seg_idx) arrays of unique candidate pairs, sorted
+            by ray. Every segment a ray intersects is among its candidates.
+        """
+        x0, y0 = np.asarray(x0, dtype=np.float64), np.asarray(y0, dtype=np.float64)
+        dx = np.asarray(x1, dtype=np.float64) - x0
+        dy = np.asarray(y1, dtype=np.float64) - y0
+        empty = np.empty(0, dtype=np.int64)
+        if self.n_segments == 0 or len(x0) == 0:
+            return empty, empty
+
+        ua, ub = self._clip(x0, y0, dx, dy)
+        inside = np.flatnonzero(ua <= ub)
+        if len(inside) == 0:
+            return empty, empty
+        x0, y0, dx, dy, ua, ub = x0[inside], y0[inside], dx[inside], dy[inside], ua[inside], ub[inside]
+
+        # Split every ray at its grid line crossings; the midpoint of each
+        # piece identifies one traversed cell
+        ox, ux = self._crossings(x0, dx, ua, ub, self.x_min)
+        oy, uy = self._crossings(y0, dy, ua, ub, self.y_min)
+        n = len(x0)
+        owner = np.concatenate((np.arange(n), np.arange(n), ox, oy))
+        u = np.concatenate((ua, ub, ux, uy))
+        order = np.lexsort((u, owner))
+        owner, u = owner[order], u[order]
+
+        piece = owner[1:] == owner[:-1]
+        mid = 0.5 * (u[1:] + u[:-1])[piece]
+        owner = owner[1:][piece]
+        cells = self._row(y0[owner] + mid * dy[owner]) * self.nx + self._col(x0[owner] + mid * dx[owner])
+
+        ray_cells = np.unique(owner * (self.nx * self.ny) + cells)
+        owner, cells = ray_cells // (self.nx * self.ny), ray_cells % (self.nx * self.ny)
+
+        starts = self.cell_start[cells]
+        counts = self.cell_start[cells + 1] - starts
+        seg = self.cell_segments[_expand_ranges(starts, counts)]
+        pairs = np.unique(np.repeat(owner, counts) * self.n_segments + seg)
+        return inside[pairs // self.n_segments], pairs % self.n_segments
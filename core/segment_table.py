@@ -0,0 +1,120 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+# t_ID used for features whose ID is NULL; it never matches a lookup
+MISSING_ID = np.iinfo(np.int64).min
+
+
+def lookup(keys, query):
+    """
+    Row of each query ID in `keys`, or -1 where it is absent.
+
+    When an ID occurs more than once in `keys` the last row wins, matching a
+    `{f[id]: f for f in features}` dictionary.
+
+    Parameters:
+        keys (ndarray): int64 IDs to search.
+        query (ndarray): int64 IDs to look up.
+
+    Returns:
+        ndarray: int64 row positions aligned with `query`.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    query = np.asarray(query, dtype=np.int64)
+    rows = np.full(len(query), -1, dtype=np.int64)
+    if len(keys) == 0 or len(query) == 0:
+        return rows
+
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    pos = np.searchsorted(sorted_keys, query, side="right") - 1
+    found = (pos >= 0) & (query != MISSING_ID)
+    found[found] = sorted_keys[pos[found]] == query[found]
+    rows[found] = order[pos[found]]
+    return rows
+
+
+class SegmentTable:
+    """
+    Columnar per-segment state keyed by t_ID.
+
+    Every stage reads and writes NumPy columns of one table instead of
+    editing QgsFeature attributes one by one: `t_id`, `x` and `y` hold the
+    segment center (or reference point) and `columns` maps a field name to an
+    array aligned with them. Computed values are float64 with NaN for
+    missing; attributes carried over from an input layer keep their values
+    in object arrays. Joins by t_ID are index lookups (see `lookup`), and
+    QGIS features are only built from the table when writing to a sink.
+    """
+
+    def __init__(self, t_id, x=None, y=None):
+        self.t_id = np.asarray(t_id, dtype=np.int64)
+        n = len(self.t_id)
+        self.x = np.full(n, np.nan) if x is None else np.asarray(x, dtype=np.float64)
+        self.y = np.full(n, np.nan) if y is None else np.asarray(y, dtype=np.float64)
+        self.columns = {}
+
+    def __len__(self):
+        return len(self.t_id)
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        values = np.asarray(values)
+        if len(values) != len(self):
+            raise ValueError(f"Column '{name}' has {len(values)} rows, table has {len(self)}")
+        self.columns[name] = values
+
+    def rows(self, t_ids):
+        """
+        Row of each t_ID in this table, or -1 where it is absent.
+        """
+        return lookup(self.t_id, t_ids)
+
+    def assign(self, name, t_ids, values, fill=np.nan):
+        """
+        Join per-t_ID values onto the table as float column `name`.
+
+        Every row whose t_ID appears in `t_ids` gets the matching value (the
+        last one if repeated); all other rows get `fill`.
+        """
+        src = lookup(t_ids, self.t_id)
+        column = np.full(len(self), fill, dtype=np.float64)
+        hit = src >= 0
+        column[hit] = np.asarray(values, dtype=np.float64)[src[hit]]
+        self.columns[name] = column
+
+    def accumulate(self, name, t_ids, values, fill=0.0):
+        """
+        Sum values per t_ID into float column `name`, adding to its current
+        contents if it already exists. Rows with no values keep `fill`.
+        """
+        t_ids = np.asarray(t_ids, dtype=np.int64)
+        if name not in self.columns or self.columns[name].dtype != np.float64:
+            self.columns[name] = np.full(len(self), fill, dtype=np.float64)
+        if len(t_ids) == 0:
+            return
+        unique_ids, inverse = np.unique(t_ids, return_inverse=True)
+        sums = np.bincount(inverse, weights=np.asarray(values, dtype=np.float64), minlength=len(unique_ids))
+        src = lookup(unique_ids, self.t_id)
+        hit = src >= 0
+        self.columns[name][hit] += sums[src[hit]]
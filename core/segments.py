@@ -0,0 +1,167 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+
+class SegmentSet:
+    """
+    Polylines exploded into contiguous arrays of straight segments.
+
+    Segments belonging to one feature are stored next to each other;
+    `offsets[i]:offsets[i + 1]` is the slice of the segment arrays owned by
+    feature `fids[i]`, and `fid` holds the owning feature id of every segment.
+    """
+
+    def __init__(self, x0, y0, x1, y1, fids, offsets):
+        self.x0 = np.ascontiguousarray(x0, dtype=np.float64)
+        self.y0 = np.ascontiguousarray(y0, dtype=np.float64)
+        self.x1 = np.ascontiguousarray(x1, dtype=np.float64)
+        self.y1 = np.ascontiguousarray(y1, dtype=np.float64)
+        self.fids = np.ascontiguousarray(fids, dtype=np.int64)
+        self.offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        self.fid = np.repeat(self.fids, np.diff(self.offsets))
+
+    @classmethod
+    def from_parts(cls, parts):
+        """
+        Build a SegmentSet from line parts.
+
+        Parameters:
+            parts (iterable): (fid, xs, ys) tuples, one per line part. Parts of
+                the same feature must be consecutive.
+
+        Returns:
+            SegmentSet
+        """
+        x0, y0, x1, y1 = [], [], [], []
+        fids, counts = [], []
+        for fid, xs, ys in parts:
+            xs = np.asarray(xs, dtype=np.float64)
+            ys = np.asarray(ys, dtype=np.float64)
+            if len(xs) < 2:
+                continue
+            x0.append(xs[:-1])
+            y0.append(ys[:-1])
+            x1.append(xs[1:])
+            y1.append(ys[1:])
+            if fids and fids[-1] == fid:
+                counts[-1] += len(xs) - 1
+            else:
+                fids.append(fid)
+                counts.append(len(xs) - 1)
+
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        if not x0:
+            empty = np.empty(0, dtype=np.float64)
+            return cls(empty, empty, empty, empty, fids, offsets)
+        return cls(np.concatenate(x0), np.concatenate(y0),
+                   np.concatenate(x1), np.concatenate(y1), fids, offsets)
+
+    @classmethod
+    def from_arrays(cls, x0, y0, x1, y1, fids, offsets, fid):
+        """
+        Wrap existing segment arrays (e.g. memory-mapped from an index file)
+        without copying them or recomputing the per-segment `fid`.
+        """
+        segments = cls.__new__(cls)
+        segments.x0, segments.y0, segments.x1, segments.y1 = x0, y0, x1, y1
+        segments.fids, segments.offsets, segments.fid = fids, offsets, fid
+        return segments
+
+    def __len__(self):
+        return len(self.x0)
+
+
+def intersect_rays(ox, oy, ex, ey, segments, ray_idx, seg_idx, eps=1e-12):
+    """
+    Intersect straight rays with valley segments for candidate (ray, segment) pairs.
+
+    Parameters:
+        ox, oy (ndarray): Ray origins.
+        ex, ey (ndarray): Ray end points.
+        segments (SegmentSet): Exploded valley lines.
+        ray_idx (ndarray): Ray index of each candidate pair.
+        seg_idx (ndarray): Segment index of each candidate pair.
+        eps (float): Slack on the line parameters so that crossings exactly on
+            a segment or ray end point are not lost to rounding.
+
+    Returns:
+        tuple: (ray_idx, seg_idx, t, x, y) for the pairs that cross, where t is
+        the distance of the crossing from the ray origin. Parallel and
+        collinear pairs are ignored, as they are by the point-only handling
+        of GEOS results elsewhere in OpenRES.
+    """
+    ray_idx = np.asarray(ray_idx, dtype=np.int64)
+    seg_idx = np.asarray(seg_idx, dtype=np.int64)
+
+    px, py = ox[ray_idx], oy[ray_idx]
+    rx, ry = ex[ray_idx] - px, ey[ray_idx] - py
+    qx, qy = segments.x0[seg_idx], segments.y0[seg_idx]
+    sx, sy = segments.x1[seg_idx] - qx, segments.y1[seg_idx] - qy
+
+    denom = rx * sy - ry * sx
+    wx, wy = qx - px, qy - py
+    with np.errstate(divide="ignore", invalid="ignore"):
+        u = (wx * sy - wy * sx) / denom
+        v = (wx * ry - wy * rx) / denom
+    hit = (denom != 0) & (u >= -eps) & (u <= 1 + eps) & (v >= -eps) & (v <= 1 + eps)
+
+    u = np.clip(u[hit], 0.0, 1.0)
+    rx, ry = rx[hit], ry[hit]
+    x = px[hit] + u * rx
+    y = py[hit] + u * ry
+    t = u * np.hypot(rx, ry)
+    return ray_idx[hit], seg_idx[hit], t, x, y
+
+
+def drop_duplicate_hits(group, x, y, tolerance=1e-8):
+    """
+    Mask of hits to keep after removing repeated crossings.
+
+    A hit is dropped when it lies within `tolerance` of the previous hit of
+    the same group, e.g. where a ray passes through a vertex shared by two
+    consecutive segments. Hits must already be sorted so that duplicates are
+    adjacent (by group, then by distance along the ray).
+    """
+    keep = np.ones(len(group), dtype=bool)
+    if len(group) > 1:
+        same_group = group[1:] == group[:-1]
+        close = np.hypot(x[1:] - x[:-1], y[1:] - y[:-1]) <= tolerance
+        keep[1:] = ~(same_group & close)
+    return keep
+
+
+def unique_hits(owner, fid, x, y, tolerance=1e-8):
+    """
+    Intersection points with repeated points of the same owner on the same
+    valley feature merged, as GEOS returns them for a single intersection.
+
+    Parameters:
+        owner (ndarray): Transect (or other query) index of every hit.
+        fid (ndarray): Valley feature id of every hit.
+        x, y (ndarray): Hit coordinates.
+        tolerance (float): Distance under which points are merged.
+
+    Returns:
+        tuple: (owner, x, y) of the kept hits, sorted by owner.
+    """
+    order = np.lexsort((y, x, fid, owner))
+    owner, fid, x, y = owner[order], fid[order], x[order], y[order]
+    group = np.cumsum(np.concatenate(([True], (owner[1:] != owner[:-1]) | (fid[1:] != fid[:-1]))))
+    keep = drop_duplicate_hits(group, x, y, tolerance)
+    return owner[keep], x[keep], y[keep]
@@ -0,0 +1,83 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+LEFT = 1
+RIGHT = -1
+
+
+def side_of(ox, oy, dx, dy, px, py):
+    """
+    Side of points relative to a direction vector, from the 2D cross
+    product. Works element-wise on arrays.
+
+    Parameters:
+        ox, oy: Origin of the reference vector.
+        dx, dy: Direction of the reference vector (e.g., stream flow).
+        px, py: Points to classify.
+
+    Returns:
+        int or ndarray: LEFT (1) where the cross product is positive,
+        otherwise RIGHT (-1).
+    """
+    cross = np.multiply(dx, np.subtract(py, oy)) - np.multiply(dy, np.subtract(px, ox))
+    side = np.where(cross > 0, LEFT, RIGHT)
+    return int(side) if np.ndim(side) == 0 else side
+
+
+def nearest_by_side(owner, px, py, mid_x, mid_y, flow, tolerance=1e-8, keep=2):
+    """
+    Splits transect intersections into left and right of the stream and
+    ranks them by distance to the transect midpoint.
+
+    Parameters:
+        owner (ndarray): Transect index of every intersection point.
+        px, py (ndarray): Intersection points.
+        mid_x, mid_y (ndarray): Transect midpoints, indexed by owner.
+        flow (tuple): (x0, y0, x1, y1) arrays indexed by owner; the stream
+            flow vector from its first vertex to its midpoint. Sides are
+            taken relative to the flow vector placed at the stream midpoint.
+        tolerance (float): Points closer than this to the midpoint are ignored.
+        keep (int): Points kept per transect and side, nearest first.
+
+    Returns:
+        tuple: (index, side, rank, distance) arrays for the kept points, where
+        index points into px/py, side is LEFT or RIGHT and rank is 0 for the
+        nearest point of its transect and side. Ties keep input order.
+    """
+    owner = np.asarray(owner, dtype=np.int64)
+    px = np.asarray(px, dtype=np.float64)
+    py = np.asarray(py, dtype=np.float64)
+    fx0, fy0, fx1, fy1 = (np.asarray(a, dtype=np.float64)[owner] for a in flow)
+
+    distance = np.hypot(px - np.asarray(mid_x, dtype=np.float64)[owner],
+                        py - np.asarray(mid_y, dtype=np.float64)[owner])
+    side = np.asarray(side_of(fx1, fy1, fx1 - fx0, fy1 - fy0, px, py)).reshape(-1)
+
+    index = np.flatnonzero(distance >= tolerance)
+    order = np.lexsort((index, distance[index], side[index], owner[index]))
+    index = index[order]
+
+    # Rank within each (owner, side) run of the sorted points
+    group_owner, group_side = owner[index], side[index]
+    starts = np.concatenate(([True], (group_owner[1:] != group_owner[:-1]) | (group_side[1:] != group_side[:-1])))
+    run_start = np.maximum.accumulate(np.where(starts, np.arange(len(index)), 0))
+    rank = np.arange(len(index)) - run_start
+
+    kept = rank < keep
+    index = index[kept]
+    return index, side[index], rank[kept], distance[index]
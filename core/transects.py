@@ -0,0 +1,148 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import math
+
+import numpy as np
+
+from .geometry import ray_endpoints
+from .ray_cast import cast_ray_chunk
+from .parallel import parallel_cast, worker_count, concat_hits
+from .segments import unique_hits
+
+
+def cast_transects(ox, oy, angles, segments, grid, increment, max_length,
+                   chunk_size=4096, workers=1, is_canceled=None, on_fallback=None, hits=False):
+    """
+    Single-shot, batched equivalent of growing each half-transect by
+    `increment` until it crosses two valley lines.
+
+    Casts one ray per side out to the furthest length the incremental search
+    could reach, intersects all rays with the exploded valley segments in
+    one vectorized pass (candidates come from the segment grid), then snaps
+    each half-transect back to the first multiple of `increment` that
+    contains its two nearest intersections.
+
+    Parameters:
+        ox, oy (array-like): Transect origins.
+        angles (array-like): Perpendicular angles in degrees.
+        segments (SegmentSet): Exploded valley lines.
+        grid (SegmentGrid): Segment index over the same valley lines.
+        increment (float): Extension increment.
+        max_length (float): Maximum half-transect length.
+        chunk_size (int): Rays per vectorized batch.
+        workers (int): Worker processes; 1 casts in this process, 0 uses one
+            per CPU core. Results do not depend on the worker count.
+        is_canceled (callable): Optional; polled between batches. Rays not
+            cast before cancelling keep count 0.
+        on_fallback (callable): Optional; called with the error message when
+            the process pool cannot start and the rays are cast in this
+            process instead.
+        hits (bool): Also return the intersections within the snapped
+            half-transects (see transect_hits).
+
+    Returns:
+        tuple: (lengths, counts, n_candidates). lengths and counts have two
+        entries per origin, left (direction -1) then right; counts matches
+        the number of intersections the incremental search would have
+        collected. n_candidates is the number of (ray, segment) pairs tested.
+        With `hits`, a fourth item holds the (ray, segment, x, y) arrays of
+        the intersections, where ray is 2 * origin index (+1 for right).
+    """
+    ox = np.asarray(ox, dtype=np.float64)
+    n_rays = 2 * len(ox)
+    lengths = np.zeros(n_rays, dtype=np.float64)
+    counts = np.zeros(n_rays, dtype=np.int64)
+    if increment <= 0 or max_length <= 0 or n_rays == 0:
+        return (lengths, counts, 0, concat_hits({})) if hits else (lengths, counts, 0)
+
+    # The incremental loop stops at the first multiple of increment >= max_length
+    max_steps = math.ceil(max_length / increment)
+    reach = max_steps * increment
+
+    ox = np.repeat(ox, 2)
+    oy = np.repeat(np.asarray(oy, dtype=np.float64), 2)
+    direction = np.tile([-1.0, 1.0], n_rays // 2)
+    ex, ey = ray_endpoints(ox, oy, np.repeat(angles, 2), direction * reach)
+
+    if worker_count(workers) > 1:
+        # Split into a few chunks per worker so cancellation stays responsive
+        parallel_chunk = max(256, min(chunk_size, math.ceil(n_rays / (4 * worker_count(workers)))))
+        try:
+            return parallel_cast(
+                ox, oy, ex, ey, segments, grid, increment, max_steps, workers,
+                parallel_chunk, is_canceled, hits=hits
+            )
+        except (OSError, RuntimeError) as e:
+            if on_fallback is not None:
+                on_fallback(f"Parallel ray casting unavailable ({e}); using a single process.")
+
+    n_candidates = 0
+    chunk_hits = {}
+    for lo in range(0, n_rays, chunk_size):
+        if is_canceled is not None and is_canceled():
+            break
+        hi = min(lo + chunk_size, n_rays)
+        lengths[lo:hi], counts[lo:hi], n_chunk, *rest = cast_ray_chunk(
+            ox[lo:hi], oy[lo:hi], ex[lo:hi], ey[lo:hi], segments, grid, increment, max_steps, hits
+        )
+        n_candidates += n_chunk
+        if hits:
+            chunk_hits[lo] = rest[0]
+    if hits:
+        return lengths, counts, n_candidates, concat_hits(chunk_hits)
+    return lengths, counts, n_candidates
+
+
+def transect_hits(hits, segments, ox, oy, angles, keep=None, tolerance=1e-8):
+    """
+    Intersections of whole transects from the half-transect hits of
+    cast_transects, as collect_transect_intersections in step [3] would
+    find them on the joined transect lines: repeated points on the same
+    valley feature are merged across both halves.
+
+    Parameters:
+        hits (tuple): (ray, segment, x, y) from cast_transects.
+        segments (SegmentSet): The valley lines that were cast against.
+        ox, oy, angles (array-like): Transect origins and angles.
+        keep (ndarray): Optional bool mask of the transects to report.
+        tolerance (float): Distance under which points are merged.
+
+    Returns:
+        tuple: (owner, half, rank, distance, x, y) arrays sorted by owner,
+        half and distance. half is -1 (left) or 1 (right) as in
+        cast_transects, rank counts from 1 along each half and distance is
+        measured from the transect origin.
+    """
+    ray, seg, x, y = hits
+    owner = ray // 2
+    if keep is not None:
+        inside = np.asarray(keep, dtype=bool)[owner]
+        owner, seg, x, y = owner[inside], seg[inside], x[inside], y[inside]
+    owner, x, y = unique_hits(owner, segments.fid[seg], x, y, tolerance)
+
+    ox = np.asarray(ox, dtype=np.float64)[owner]
+    oy = np.asarray(oy, dtype=np.float64)[owner]
+    dx, dy = ray_endpoints(0.0, 0.0, np.asarray(angles, dtype=np.float64)[owner], 1.0)
+    half = np.where((x - ox) * dx + (y - oy) * dy >= 0, 1, -1)
+    distance = np.hypot(x - ox, y - oy)
+
+    order = np.lexsort((distance, half, owner))
+    owner, half, distance, x, y = owner[order], half[order], distance[order], x[order], y[order]
+    run = np.concatenate(([True], (owner[1:] != owner[:-1]) | (half[1:] != half[:-1])))
+    starts = np.flatnonzero(run)
+    rank = np.arange(len(owner)) - np.repeat(starts, np.diff(np.append(starts, len(owner)))) + 1
+    return owner, half, rank, distance, x, y
@@ -0,0 +1,53 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from .raster_sampler import RasterSampler
+from .core.cross_sections import build_cross_sections
+from .extract_dvs_sinuosity import read_lines
+
+# File extension of cross-section profile stores
+STORE_SUFFIX = ".openres-xs"
+
+
+def raster_resolution(raster):
+    """
+    Pixel size of a raster layer (the finer of its x and y resolution).
+    """
+    return min(raster.rasterUnitsPerPixelX(), raster.rasterUnitsPerPixelY())
+
+
+def extract_cross_sections(transect_layer, raster, spacing=0, feedback=None, chunk_samples=1_000_000):
+    """
+    Cross-section profiles of every transect of a layer
+    (core.cross_sections.build_cross_sections).
+
+    Parameters:
+        transect_layer (QgsVectorLayer): Transect lines with t_ID.
+        raster (QgsRasterLayer): Elevation raster.
+        spacing (float): Distance between samples; 0 uses the raster's
+            pixel size.
+        feedback (QgsProcessingFeedback): Optional; cancels between batches.
+        chunk_samples (int): Samples per batch.
+
+    Returns:
+        CrossSections or None when cancelled.
+    """
+    t_ids, lines = read_lines(transect_layer, "t_ID")
+    sampler = RasterSampler(raster)
+    return build_cross_sections(
+        t_ids, lines, spacing or raster_resolution(raster), sampler.sample, chunk_samples,
+        is_canceled=feedback.isCanceled if feedback is not None else None
+    )
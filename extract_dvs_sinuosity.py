@@ -0,0 +1,137 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from qgis.core import QgsFeatureRequest, QgsGeometry, QgsProcessingException, QgsWkbTypes
+import numpy as np
+
+from .core.metrics import dvs_and_sinuosity, multiscale_sinuosity
+from .core.polylines import PolylineSet
+from .segment_layers import feature_ids
+
+# DVS_METHOD options of [5]: end point slope, or least-squares slope of a densified DEM profile
+DVS_METHODS = ["End points", "Profile (least squares)", "Profile (breached, least squares)"]
+
+
+def stream_wkb(geom):
+    """
+    WKB of a stream geometry for core.polylines; curved geometries are
+    segmentized first and NULL geometries become None.
+    """
+    if geom is None or geom.isNull():
+        return None
+    if QgsWkbTypes.isCurvedType(geom.wkbType()):
+        geom = QgsGeometry(geom.constGet().segmentize())
+    return bytes(geom.asWkb())
+
+
+def stream_lines(geometries):
+    """
+    Vertex arrays (core.polylines.PolylineSet) of stream segment geometries,
+    every part of multipart lines included.
+    """
+    return PolylineSet.from_wkb(stream_wkb(geom) for geom in geometries)
+
+
+def read_lines(layer, id_field="t_id"):
+    """
+    Reads a line layer (streams, transects) in one pass, loading only its
+    ID field.
+
+    Returns:
+        tuple: (t_ids ndarray, PolylineSet) aligned with the layer's features.
+    """
+    fields = layer.fields()
+    id_index = fields.lookupField(id_field)
+    request = QgsFeatureRequest().setSubsetOfAttributes([id_index] if id_index != -1 else [])
+    features = list(layer.getFeatures(request))
+    return feature_ids(features, fields, id_field), stream_lines(f.geometry() for f in features)
+
+
+def assign_dvs_sinuosity(centers, t_ids, x0, y0, x1, y1, lengths, elev_start, elev_end, dvs=None):
+    """
+    Computes DVS and SIN of stream segments (core.metrics.dvs_and_sinuosity)
+    and writes them to the centers table.
+
+    Parameters:
+        centers (SegmentTable): Segment centers; DVS and SIN are (re)written.
+        t_ids (ndarray): t_ID of every stream segment.
+        x0, y0, x1, y1 (ndarray): Segment start and end points
+            (PolylineSet.endpoints).
+        lengths (ndarray): Along-channel segment lengths.
+        elev_start, elev_end (ndarray): Elevations at the end points; segments
+            with a missing elevation are left as NULL.
+        dvs (ndarray): Optional DVS per segment replacing the end point
+            slope, e.g. core.metrics.profile_dvs; NaN is written as NULL.
+    """
+    elev_start = np.asarray(elev_start, dtype=np.float64)
+    elev_end = np.asarray(elev_end, dtype=np.float64)
+    endpoint_dvs, sin = dvs_and_sinuosity(elev_start, elev_end, lengths, x0, y0, x1, y1)
+    valid = ~(np.isnan(elev_start) | np.isnan(elev_end))
+    if dvs is None:
+        dvs = np.where(valid, endpoint_dvs, np.nan)
+    t_ids = np.asarray(t_ids, dtype=np.int64)
+    centers.assign("DVS", t_ids, dvs)
+    centers.assign("SIN", t_ids[valid], sin[valid])
+
+
+# --- Multi-scale sinuosity ---
+def parse_windows(text):
+    """
+    Window lengths from a comma-separated list such as "500, 1000, 2000".
+
+    Raises:
+        QgsProcessingException: For entries that are not positive numbers.
+    """
+    windows = []
+    for item in (text or "").replace(";", ",").split(","):
+        if not item.strip():
+            continue
+        try:
+            window = float(item)
+        except ValueError:
+            window = 0
+        if not window > 0:
+            raise QgsProcessingException(f"Invalid sinuosity window length: {item.strip()!r}")
+        windows.append(window)
+    return sorted(set(windows))
+
+
+def window_fields(windows):
+    """
+    Names of the mean and max sinuosity columns of each window, e.g.
+    SIN500_MEAN and SIN500_MAX.
+    """
+    return [(f"SIN{window:g}_MEAN", f"SIN{window:g}_MAX") for window in windows]
+
+
+def assign_window_sinuosity(centers, t_ids, lines, rows, windows, spacing):
+    """
+    Computes the sinuosity of stream segments over sliding windows of each
+    length in `windows` (core.metrics.multiscale_sinuosity) and writes the
+    mean and max per window to the centers table.
+
+    Parameters:
+        centers (SegmentTable): Segment centers.
+        t_ids (ndarray): t_ID of every evaluated segment.
+        lines (PolylineSet): Stream segments.
+        rows (ndarray): Index in `lines` of every evaluated segment.
+        windows (list): Window lengths along the channel.
+        spacing (float): Distance between window starts.
+    """
+    results = multiscale_sinuosity(lines, windows, spacing, rows)
+    for (mean_name, max_name), (mean, peak) in zip(window_fields(windows), results):
+        centers.assign(mean_name, t_ids, mean)
+        centers.assign(max_name, t_ids, peak)
@@ -0,0 +1,217 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from qgis.core import Qgis, QgsGeometry, QgsPointXY, QgsSpatialIndex
+import numpy as np
+import os
+
+from .core.segments import SegmentSet
+from .core.polygon_grid import ClassGrid
+from .debug import log
+
+# GEO value for points outside every polygon
+NO_DATA = "No Data"
+
+# Memory budget of the rasterized class grid, e.g. OPENRES_GEO_GRID_MB=2048 qgis;
+# finer resolutions fall back to the exact lookup
+MAX_GRID_MB = int(os.environ.get("OPENRES_GEO_GRID_MB", "512"))
+
+
+class PreparedPolygonLookup:
+    """
+    Point-in-polygon attribute lookup over polygon geometries cached by fid.
+
+    Geometries and attribute values are read once, so candidates from the
+    spatial index need no provider round trip, and each polygon's GEOS
+    engine is prepared on first use. Candidates are tested in spatial index
+    order and the first containing polygon wins.
+    """
+
+    def __init__(self, geometries, values):
+        """
+        Parameters:
+            geometries (dict): Polygon QgsGeometry by fid.
+            values (dict): Attribute value by fid.
+        """
+        self.geometries = geometries
+        self.values = values
+        self._engines = {}
+        self.index = QgsSpatialIndex()
+        for fid, geom in geometries.items():
+            if geom is not None and not geom.isNull():
+                self.index.addFeature(fid, geom.boundingBox())
+
+    @classmethod
+    def from_layer(cls, polygon_layer, polygon_attribute):
+        return cls(*read_polygons(polygon_layer, polygon_attribute))
+
+    def engine(self, fid):
+        engine = self._engines.get(fid)
+        if engine is None:
+            engine = QgsGeometry.createGeometryEngine(self.geometries[fid].constGet())
+            engine.prepareGeometry()
+            self._engines[fid] = engine
+        return engine
+
+    def value_at(self, x, y):
+        point = QgsGeometry.fromPointXY(QgsPointXY(x, y))
+        abstract = point.constGet()
+        for fid in self.index.intersects(point.boundingBox()):
+            if fid in self.geometries and self.engine(fid).contains(abstract):
+                return self.values[fid]
+        return NO_DATA
+
+    def lookup(self, xs, ys):
+        return [self.value_at(x, y) for x, y in zip(xs, ys)]
+
+
+class RasterizedPolygonLookup:
+    """
+    Point-in-polygon attribute lookup through a rasterized class grid.
+
+    The polygons are burned once into a core.polygon_grid.ClassGrid at
+    `resolution`; a point in a cell covered by exactly one polygon (or none)
+    is answered by an array index. Cells crossed by a polygon boundary or
+    covered by overlapping polygons fall back to PreparedPolygonLookup, so
+    the values are the same as the exact lookup at any resolution. The
+    exact lookup is only built when points fall in such cells, over the
+    polygons whose extent reaches those points.
+    """
+
+    def __init__(self, polygon_layer, polygon_attribute, resolution):
+        self.geometries, self.values = read_polygons(polygon_layer, polygon_attribute)
+        self.fids = list(self.geometries)
+
+        parts = []
+        for i, fid in enumerate(self.fids):
+            for xs, ys in polygon_rings(self.geometries[fid]):
+                parts.append((i, xs, ys))
+        self.grid = ClassGrid(SegmentSet.from_parts(parts), resolution)
+
+        # Value of each class code; the negative codes index from the end,
+        # so NO_DATA (-1) reads the last entry and MIXED (-2) a placeholder
+        self.code_values = np.empty(len(self.fids) + 2, dtype=object)
+        self.code_values[:len(self.fids)] = [self.values[fid] for fid in self.fids]
+        self.code_values[ClassGrid.NO_DATA] = NO_DATA
+
+    @staticmethod
+    def grid_bytes(polygon_layer, resolution):
+        """
+        Peak memory of the class grid of `polygon_layer` at `resolution`.
+        """
+        extent = polygon_layer.extent()
+        n_cells = (extent.width() / resolution + 1) * (extent.height() / resolution + 1)
+        return n_cells * ClassGrid.cell_bytes(polygon_layer.featureCount())
+
+    def exact(self, xs, ys):
+        """
+        PreparedPolygonLookup over the polygons whose bounding box meets the
+        extent of the points (xs, ys); None if there are no finite points.
+        """
+        finite = np.isfinite(xs) & np.isfinite(ys)
+        if not finite.any():
+            return None
+        x_min, x_max = xs[finite].min(), xs[finite].max()
+        y_min, y_max = ys[finite].min(), ys[finite].max()
+        geometries, values = {}, {}
+        for fid, geom in self.geometries.items():
+            if geom is None or geom.isNull():
+                continue
+            box = geom.boundingBox()
+            if (box.xMinimum() <= x_max and box.xMaximum() >= x_min
+                    and box.yMinimum() <= y_max and box.yMaximum() >= y_min):
+                geometries[fid] = geom
+                values[fid] = self.values[fid]
+        return PreparedPolygonLookup(geometries, values)
+
+    def lookup(self, xs, ys):
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        codes = self.grid.lookup(xs, ys)
+        values = np.take(self.code_values, codes)
+
+        mixed = np.flatnonzero(codes == ClassGrid.MIXED)
+        if len(mixed):
+            exact = self.exact(xs[mixed], ys[mixed])
+            values[mixed] = [
+                exact.value_at(x, y) if exact is not None else NO_DATA
+                for x, y in zip(xs[mixed].tolist(), ys[mixed].tolist())
+            ]
+        return values.tolist()
+
+
+def read_polygons(polygon_layer, polygon_attribute):
+    """
+    Reads polygon geometries and attribute values in one pass.
+
+    Returns:
+        tuple: ({fid: QgsGeometry}, {fid: value})
+    """
+    geometries, values = {}, {}
+    for feature in polygon_layer.getFeatures():
+        geometries[feature.id()] = feature.geometry()
+        values[feature.id()] = feature[polygon_attribute]
+    return geometries, values
+
+
+def polygon_rings(geom):
+    """
+    Rings (exterior and holes) of a polygon or multipolygon geometry.
+
+    Returns:
+        list: (xs, ys) coordinate lists, one per ring.
+    """
+    if geom is None or geom.isNull():
+        return []
+    polygons = geom.asMultiPolygon() if geom.isMultipart() else [geom.asPolygon()]
+    return [
+        ([p.x() for p in ring], [p.y() for p in ring])
+        for polygon in polygons
+        for ring in polygon
+    ]
+
+
+def polygon_attribute_at(polygon_layer, polygon_attribute, xs, ys, resolution=0):
+    """
+    Looks up the polygon attribute at each point.
+
+    Parameters:
+        polygon_layer (QgsVectorLayer): Polygons (e.g., geology).
+        polygon_attribute (str): Field to read from the containing polygon.
+        xs, ys (array-like): Point coordinates.
+        resolution (float): 0 tests points against prepared polygon
+            geometries; a positive value rasterizes the polygons to a class
+            grid of that cell size first, unless the grid would need more
+            than MAX_GRID_MB. Both give the same values.
+
+    Returns:
+        list: Attribute value of the first polygon containing each point, or
+        "No Data" where no polygon contains it.
+    """
+    xs = np.asarray(xs, dtype=np.float64).tolist()
+    ys = np.asarray(ys, dtype=np.float64).tolist()
+    rasterize = bool(resolution and resolution > 0)
+    if rasterize:
+        grid_bytes = RasterizedPolygonLookup.grid_bytes(polygon_layer, resolution)
+        if grid_bytes > MAX_GRID_MB * 2**20:
+            log(f"Geology grid at resolution {resolution} needs {grid_bytes / 2**20:.0f} MB "
+                f"(OPENRES_GEO_GRID_MB={MAX_GRID_MB}); using the exact lookup", Qgis.Warning)
+            rasterize = False
+    if rasterize:
+        lookup = RasterizedPolygonLookup(polygon_layer, polygon_attribute, resolution)
+    else:
+        lookup = PreparedPolygonLookup.from_layer(polygon_layer, polygon_attribute)
+    return lookup.lookup(xs, ys)
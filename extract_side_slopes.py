@@ -15,16 +15,19 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from qgis.core import (
-    QgsVectorLayer,
-    QgsFeature,
-    QgsField,
     QgsPointXY,
-    QgsRaster,
     QgsRasterLayer
 )
-from PyQt5.QtCore import QVariant
+import numpy as np
 import math
 
+from .raster_sampler import sample_raster
+from .core.metrics import side_slope
+from .core.segment_table import lookup
+
+# SLOPE_METHOD options of [4]: two DEM samples per side, or a regression over the cross-section profile
+SLOPE_METHODS = ["Reference points", "Cross-section regression"]
+
 
 def get_elevation_at_point(point, raster_layer):
     """
@@ -37,108 +40,76 @@ def get_elevation_at_point(point, raster_layer):
     Returns:
         float or None: Elevation value or None if invalid.
     """
-    pt_xy = point if isinstance(point, QgsPointXY) else QgsPointXY(point.x(), point.y())
-    ident = raster_layer.dataProvider().identify(pt_xy, QgsRaster.IdentifyFormatValue)
-    return ident.results().get(1, None) if ident.isValid() else None
+    value = sample_raster(raster_layer, [point.x()], [point.y()])[0]
+    return None if math.isnan(value) else float(value)
 
 
-def build_pairwise_slope_input(layer_a, layer_b, raster, id_field="t_id"):
+def build_pairwise_slope_input(table_a, table_b, raster):
     """
-    Constructs dictionary with geometry-based distance and elevation extracted from raster.
+    Joins two reference point tables by t_ID and samples elevation at both ends.
 
     Parameters:
-        layer_a (QgsVectorLayer): First layer (e.g., VW).
-        layer_b (QgsVectorLayer): Second layer (e.g., VFW).
+        table_a (SegmentTable): First points (e.g., VW).
+        table_b (SegmentTable): Second points (e.g., VFW).
         raster (QgsRasterLayer): Elevation raster.
-        id_field (str): Common ID field (e.g., 't_id').
 
     Returns:
-        dict: {t_id: {'elev1': float, 'elev2': float, 'dist': float}}
+        tuple: (t_ids, elev1, elev2, dist) arrays for every t_ID found in both
+        tables; elevations are NaN where the raster has no data.
     """
-    dict_a = {f[id_field]: f for f in layer_a.getFeatures()}
-    dict_b = {f[id_field]: f for f in layer_b.getFeatures()}
-
-    slope_data = {}
+    rows_b = table_b.rows(table_a.t_id)
+    paired = rows_b >= 0
+    rows_b = rows_b[paired]
 
-    for t_id in dict_a:
-        if t_id not in dict_b:
-            continue
+    x1, y1 = table_a.x[paired], table_a.y[paired]
+    x2, y2 = table_b.x[rows_b], table_b.y[rows_b]
 
-        feat1 = dict_a[t_id]
-        feat2 = dict_b[t_id]
-        pt1 = feat1.geometry().asPoint()
-        pt2 = feat2.geometry().asPoint()
+    # Sample both ends of every pair in one batched raster read
+    elevations = sample_raster(raster, np.concatenate([x1, x2]), np.concatenate([y1, y2]))
+    n = len(x1)
 
-        elev1 = get_elevation_at_point(pt1, raster)
-        elev2 = get_elevation_at_point(pt2, raster)
+    return table_a.t_id[paired], elevations[:n], elevations[n:], np.hypot(x2 - x1, y2 - y1)
 
-        if elev1 is None or elev2 is None:
-            continue
 
-        dist = math.hypot(pt2.x() - pt1.x(), pt2.y() - pt1.y())
-
-        slope_data[t_id] = {
-            "elev1": elev1,
-            "elev2": elev2,
-            "dist": dist
-        }
+def calculate_side_slopes_from_pairs(centers,
+                                     left_vw, left_vfw,
+                                     right_vw, right_vfw,
+                                     elevation_raster):
+    """
+    Calculates LVS and RVS using paired intersection points and elevation sampled from raster.
 
-    return slope_data
+    Parameters:
+        centers (SegmentTable): Segment centers where LVS and RVS will be written.
+        left_vw (SegmentTable): Left side valley wall points.
+        left_vfw (SegmentTable): Left side valley floor wall points.
+        right_vw (SegmentTable): Right side valley wall points.
+        right_vfw (SegmentTable): Right side valley floor wall points.
+        elevation_raster (QgsRasterLayer): Elevation raster.
+    """
+    for field_name, vw, vfw in [("LVS", left_vw, left_vfw), ("RVS", right_vw, right_vfw)]:
+        t_ids, elev1, elev2, dist = build_pairwise_slope_input(vw, vfw, elevation_raster)
+        centers.assign(field_name, t_ids, side_slope(elev1, elev2, dist))
 
 
-def calculate_side_slopes_from_pairs(center_points_layer,
-                                     left_vw_layer, left_vfw_layer,
-                                     right_vw_layer, right_vfw_layer,
-                                     elevation_raster,
-                                     id_field="t_id"):
+def calculate_side_slopes_from_profiles(centers, sections,
+                                        left_vw, left_vfw,
+                                        right_vw, right_vfw):
     """
-    Calculates LSS and RSS using paired intersection points and elevation sampled from raster.
+    Calculates LVS and RVS as least-squares slopes of the cross-section
+    profiles between the VFW and VW points of each side
+    (core.cross_sections.CrossSections.window_slope).
 
     Parameters:
-        center_points_layer (QgsVectorLayer): Centerline points where LVS and RVS will be written.
-        left_vw_layer (QgsVectorLayer): Left side valley wall points.
-        left_vfw_layer (QgsVectorLayer): Left side valley floor wall points.
-        right_vw_layer (QgsVectorLayer): Right side valley wall points.
-        right_vfw_layer (QgsVectorLayer): Right side valley floor wall points.
-        elevation_raster (QgsRasterLayer): Elevation raster.
-        id_field (str): Field to join all layers (e.g., 't_id').
+        centers (SegmentTable): Segment centers where LVS and RVS will be written.
+        sections (CrossSections): Cross-section profiles keyed by t_ID.
+        left_vw, left_vfw, right_vw, right_vfw (SegmentTable): Valley wall
+            and valley floor wall points of each side.
     """
-    # Add LSS and RSS fields if missing
-    for field_name in ["LVS", "RVS"]:
-        if center_points_layer.fields().indexFromName(field_name) == -1:
-            center_points_layer.dataProvider().addAttributes([QgsField(field_name, QVariant.Double)])
-    center_points_layer.updateFields()
-
-    # Build slope info from raster
-    left_slopes = build_pairwise_slope_input(left_vw_layer, left_vfw_layer, elevation_raster, id_field)
-    right_slopes = build_pairwise_slope_input(right_vw_layer, right_vfw_layer, elevation_raster, id_field)
-
-    # Start editing
-    center_points_layer.startEditing()
-    for feature in center_points_layer.getFeatures():
-        t_id = feature[id_field]
-
-        # Left Side Slope
-        if t_id in left_slopes:
-            l = left_slopes[t_id]
-            elev_diff = abs(l["elev1"] - l["elev2"])
-            slope = (elev_diff / l["dist"]) * 100 if l["dist"] > 0 else None
-            feature["LVS"] = slope
-        else:
-            feature["LVS"] = None
-
-        # Right Side Slope
-        if t_id in right_slopes:
-            r = right_slopes[t_id]
-            elev_diff = abs(r["elev1"] - r["elev2"])
-            slope = (elev_diff / r["dist"]) * 100 if r["dist"] > 0 else None
-            feature["RVS"] = slope
-        else:
-            feature["RVS"] = None
-
-        center_points_layer.updateFeature(feature)
-
-    if center_points_layer.commitChanges():
-        print("✅ LVS and RVS calculated using elevation raster.")
-    else:
-        print("❌ Failed to commit LVS and RVS.")
+    for field_name, vw, vfw in [("LVS", left_vw, left_vfw), ("RVS", right_vw, right_vfw)]:
+        rows_b = vfw.rows(vw.t_id)
+        rows_s = lookup(sections.t_id, vw.t_id)
+        paired = (rows_b >= 0) & (rows_s >= 0)
+        rows_b, rows_s = rows_b[paired], rows_s[paired]
+        start = sections.stations_of(rows_s, vfw.x[rows_b], vfw.y[rows_b])
+        stop = sections.stations_of(rows_s, vw.x[paired], vw.y[paired])
+        centers.assign(field_name, vw.t_id[paired], sections.window_slope(rows_s, start, stop))
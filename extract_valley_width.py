@@ -24,9 +24,22 @@ from qgis.core import (
     QgsField,               # Represents an attribute field
     QgsProject,             # Interface to the current QGIS project
     QgsSpatialIndex,        # Optimized spatial lookup for vector features
-    QgsWkbTypes             # Enum for identifying geometry types (Point, Line, etc.)
+    QgsWkbTypes,            # Enum for identifying geometry types (Point, Line, etc.)
+    QgsFeatureRequest,      # Feature filters (here: read a single feature)
+    QgsFields               # Ordered collection of attribute fields
 )
 from PyQt5.QtCore import QVariant  # Used for defining attribute types
+import numpy as np
+
+from .core.segments import intersect_rays, unique_hits
+from .core.geometry import interpolate, line_length, flow_direction
+from .core.sides import LEFT, RIGHT, side_of, nearest_by_side
+from .valley_lines import build_valley_index, line_parts, xy_parts
+from .segment_layers import table_from_hits, table_features, feature_ids
+from .core.segment_table import lookup
+from .feature_sink import write_features
+from .profiling import phase
+from .debug import log
 
 # --- Determine which side of the transect a point lies on ---
 def determine_side(start_point, direction_vector, intersect_point):
@@ -42,41 +55,252 @@ def determine_side(start_point, direction_vector, intersect_point):
     Returns:
         str: "left" or "right"
     """
-    # Create vector from start to intersection
-    intersect_vector = QgsPointXY(
-        intersect_point.x() - start_point.x(),
-        intersect_point.y() - start_point.y()
-    )
+    side = side_of(start_point.x(), start_point.y(), direction_vector.x(), direction_vector.y(),
+                   intersect_point.x(), intersect_point.y())
+    return "left" if side == LEFT else "right"
 
-    # 2D cross product to determine relative side
-    cross_product = (
-        direction_vector.x() * intersect_vector.y() -
-        direction_vector.y() * intersect_vector.x()
-    )
+# --- Add a batch of point features to a memory layer ---
+def reference_fields():
+    """
+    Fields of the VW/VFW reference point layers.
 
-    return "left" if cross_product > 0 else "right"
+    Returns:
+        QgsFields: side (String), t_ID (Int), distance (Double)
+    """
+    fields = QgsFields()
+    fields.append(QgsField("side", QVariant.String))
+    fields.append(QgsField("t_ID", QVariant.Int))     # Field needed downstream
+    fields.append(QgsField("distance", QVariant.Double))
+    return fields
 
-# --- Add a batch of point features to a memory layer ---
-def add_points_in_batch(points, layer, side):
+
+def add_points_in_batch(points, sink, side):
     """
-    Adds a batch of QgsPointXY features to a given memory layer.
+    Writes a table of reference points to a feature sink.
 
     Parameters:
-        points (list): List of tuples (QgsPointXY, t_ID, distance)
-        layer (QgsVectorLayer): Target memory layer
+        points (SegmentTable): Reference points with t_ID and distance columns.
+        sink (QgsFeatureSink): Target sink with reference_fields().
         side (str): "left" or "right" – assigned as an attribute
     """
-    features = []
-    for point, transect_id, distance in points:
-        new_feature = QgsFeature()
-        new_feature.setGeometry(QgsGeometry.fromPointXY(point))
-        new_feature.setAttributes([side, transect_id, distance])
-        features.append(new_feature)
+    write_features(sink, table_features(points, reference_fields(), {"side": [side] * len(points)}))
+
+# --- Vectorized intersection of all transects with the valley segments ---
+def collect_transect_intersections(transect_geoms, segments, grid, tolerance=1e-8):
+    """
+    Intersects every transect with the exploded valley lines in one vectorized
+    pass instead of one GEOS call per candidate feature.
+
+    Parameters:
+        transect_geoms (list): Transect QgsGeometry lines.
+        segments (SegmentSet): Valley lines exploded with explode_valley_lines.
+        grid (SegmentGrid): Segment-level index over the same valley lines.
+        tolerance (float): Distance under which repeated points on the same
+            valley feature are merged, as GEOS does for a single intersection.
+
+    Returns:
+        tuple: (owner, x, y) arrays of intersection points, where owner is
+        the index of the transect in transect_geoms; points are grouped by
+        transect in input order.
+    """
+    qx0, qy0, qx1, qy1, q_owner = [], [], [], [], []
+    for i, transect_geom in enumerate(transect_geoms):
+        for part in line_parts(transect_geom):
+            for a, b in zip(part[:-1], part[1:]):
+                qx0.append(a.x())
+                qy0.append(a.y())
+                qx1.append(b.x())
+                qy1.append(b.y())
+                q_owner.append(i)
+
+    if not qx0 or len(segments) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+
+    # Every straight piece of every transect is queried as its own ray
+    qx0, qy0, qx1, qy1 = (np.asarray(a, dtype=np.float64) for a in (qx0, qy0, qx1, qy1))
+    q_owner = np.asarray(q_owner, dtype=np.int64)
+    pair_q, pair_seg = grid.query_rays(qx0, qy0, qx1, qy1)
+
+    q_idx, seg_hit, _, x, y = intersect_rays(qx0, qy0, qx1, qy1, segments, pair_q, pair_seg)
+    return unique_hits(q_owner[q_idx], segments.fid[seg_hit], x, y, tolerance)
+
+
+def read_intersection_table(layer, t_ids):
+    """
+    Reads the transect intersection side table written by step [1] into the
+    (owner, x, y) layout of collect_transect_intersections.
+
+    Parameters:
+        layer (QgsVectorLayer or QgsFeatureSource): Intersection points with
+            a t_ID field.
+        t_ids (ndarray): int64 transect IDs; owner is the position of a
+            point's t_ID in this array. Points of other t_IDs are skipped.
+
+    Returns:
+        tuple: (owner, x, y) arrays grouped by transect.
+    """
+    features = [f for f in layer.getFeatures() if f.hasGeometry()]
+    points = [f.geometry().asPoint() for f in features]
+    owner = lookup(t_ids, feature_ids(features, layer.fields()))
+    xs = np.asarray([p.x() for p in points], dtype=np.float64)
+    ys = np.asarray([p.y() for p in points], dtype=np.float64)
+
+    found = np.flatnonzero(owner >= 0)
+    found = found[np.argsort(owner[found], kind="stable")]
+    return owner[found], xs[found], ys[found]
+
+def intersection_table_signature(layer):
+    """
+    The valley lines signature (sources.signature_digest) stored in an
+    intersection side table by step [1]; None if the table has none, e.g.
+    when it predates the `lines_sig` field or was written for valley lines
+    with unsaved edits.
+    """
+    index = layer.fields().indexOf("lines_sig")
+    if index == -1:
+        return None
+    for feature in layer.getFeatures(QgsFeatureRequest().setSubsetOfAttributes([index]).setLimit(1)):
+        value = feature.attributes()[index]
+        return value or None
+    return None
+
+def merge_intersections(first, second):
+    """
+    Merges two (owner, x, y) intersection sets into one grouped by transect.
+    """
+    owner, xs, ys = (np.concatenate([a, b]) for a, b in zip(first, second))
+    order = np.argsort(owner, kind="stable")
+    return owner[order], xs[order], ys[order]
+
+def points_to_arrays(point_lists):
+    """
+    Flattens one list of QgsPointXY per transect into (owner, x, y) arrays,
+    the layout returned by collect_transect_intersections.
+    """
+    owner = np.repeat(np.arange(len(point_lists), dtype=np.int64), [len(p) for p in point_lists])
+    xs = np.asarray([pt.x() for points in point_lists for pt in points], dtype=np.float64)
+    ys = np.asarray([pt.y() for points in point_lists for pt in points], dtype=np.float64)
+    return owner, xs, ys
+
+# --- fid-keyed cache of prepared valley line geometries ---
+class PreparedGeometryCache:
+    """
+    Caches valley line geometries by feature id, together with a spatial index
+    and prepared GEOS engines for repeated intersects tests.
+
+    Engines are prepared on first use, so only features that sit near a
+    transect pay the preparation cost.
+    """
 
-    layer.dataProvider().addFeatures(features)
+    def __init__(self, layer):
+        self.index = QgsSpatialIndex()
+        self.geometries = {}
+        self._engines = {}
+        for feature in layer.getFeatures():
+            self.index.addFeature(feature)
+            self.geometries[feature.id()] = feature.geometry()
+
+    def engine(self, fid):
+        engine = self._engines.get(fid)
+        if engine is None:
+            engine = QgsGeometry.createGeometryEngine(self.geometries[fid].constGet())
+            engine.prepareGeometry()
+            self._engines[fid] = engine
+        return engine
+
+    def intersecting(self, geom):
+        """
+        Returns the cached geometries that intersect `geom`. Candidate lookup
+        is O(k) in the number of spatial index hits.
+        """
+        abstract = geom.constGet()
+        return [
+            self.geometries[fid]
+            for fid in self.index.intersects(geom.boundingBox())
+            if fid in self.geometries and self.engine(fid).intersects(abstract)
+        ]
+
+# --- Per-feature GEOS intersection of one transect ---
+def geos_transect_intersections(transect_geom, other_geoms):
+    """
+    Intersects one transect with valley line geometries known to intersect it.
+
+    Returns:
+        list: QgsPointXY intersection points.
+    """
+    points = []
+    for other_geom in other_geoms:
+        # Compute intersection geometry
+        intersection = transect_geom.intersection(other_geom)
+
+        # Handle different geometry types robustly
+        if intersection.isMultipart():
+            points.extend(intersection.asMultiPoint())
+        elif intersection.wkbType() == QgsWkbTypes.Point:
+            points.append(intersection.asPoint())
+        elif intersection.wkbType() == QgsWkbTypes.MultiPoint:
+            points.extend(intersection.asMultiPoint())
+        elif intersection.wkbType() == QgsWkbTypes.GeometryCollection:
+            for i in range(intersection.numGeometries()):
+                g = intersection.geometryN(i)
+                if g.wkbType() == QgsWkbTypes.Point:
+                    points.append(g.asPoint())
+    return points
+
+# --- Left/right classification of the intersections of all transects ---
+def classify_intersections(owner, xs, ys, t_ids, transect_geoms, stream_geoms, tolerance=1e-8, debug=False):
+    """
+    Splits intersection points into left and right of the stream and keeps
+    the two nearest to the transect midpoint on each side
+    (core.sides.nearest_by_side).
+
+    Parameters:
+        owner, xs, ys (ndarray): Intersection points and the index of the
+            transect each belongs to, as from collect_transect_intersections.
+        t_ids (list): Transect IDs, aligned with transect_geoms.
+        transect_geoms (list): Transect QgsGeometry lines.
+        stream_geoms (list): Stream segment QgsGeometry per transect, used
+            for flow direction; transects with None are skipped.
+        tolerance (float): Points this close to the midpoint are ignored.
+        debug (bool): If True, logs the kept points for diagnostics (debug.log, OPENRES_DEBUG=1).
+
+    Returns:
+        tuple: Four SegmentTables of reference points (t_ID, x/y, distance):
+            left_first, left_second, right_first, right_second
+    """
+    n = len(transect_geoms)
+    mid_x, mid_y = np.full(n, np.nan), np.full(n, np.nan)
+    flow = np.full((4, n), np.nan)
+    for i, (transect_geom, stream_geom) in enumerate(zip(transect_geoms, stream_geoms)):
+        if stream_geom is None:
+            continue
+        transect_parts = xy_parts(transect_geom)
+        midpoint = interpolate(transect_parts, line_length(transect_parts) / 2)
+        direction = flow_direction(xy_parts(stream_geom))
+        if midpoint is not None and direction is not None:
+            mid_x[i], mid_y[i] = midpoint
+            flow[:, i] = direction
+
+    owner = np.asarray(owner, dtype=np.int64)
+    valid = ~np.isnan(flow[0][owner]) & ~np.isnan(mid_x[owner])
+    owner, xs, ys = owner[valid], np.asarray(xs)[valid], np.asarray(ys)[valid]
+    index, side, rank, distance = nearest_by_side(owner, xs, ys, mid_x, mid_y, flow, tolerance)
+
+    t_ids = np.asarray(t_ids, dtype=np.int64)
+    if debug:
+        for i, s, d in zip(index.tolist(), side.tolist(), distance.tolist()):
+            log(f"t_ID {t_ids[owner[i]]}: side={'left' if s == LEFT else 'right'} | dist={d:.2f}")
+
+    tables = []
+    for wanted_side in (LEFT, RIGHT):
+        for wanted_rank in (0, 1):
+            pick = (side == wanted_side) & (rank == wanted_rank)
+            hits = index[pick]
+            tables.append(table_from_hits(t_ids[owner[hits]], xs[hits], ys[hits], distance[pick]))
+    return tuple(tables)
 
 # --- Core intersection logic for identifying left/right candidates ---
-def find_two_intersections_by_side(transect_layer, other_layer, split_layer, tolerance=1e-8, debug=False):
+def find_two_intersections_by_side(transect_layer, other_layer, split_layer, tolerance=1e-8, debug=False, vectorized=True, profiler=None, intersection_layer=None, feedback=None):
     """
     For each transect, find the two nearest intersection points on each side
     (left and right) with a reference geometry (e.g., valley walls).
@@ -86,171 +310,91 @@ def find_two_intersections_by_side(transect_layer, other_layer, split_layer, tol
         other_layer (QgsVectorLayer): Intersecting lines (e.g., valley edges).
         split_layer (QgsVectorLayer): Stream network with 't_ID', used for direction.
         tolerance (float): Distance threshold to filter near-duplicate points.
-        debug (bool): If True, prints intersection metadata for diagnostics.
+        debug (bool): If True, logs intersection metadata for diagnostics.
+        vectorized (bool): If True, intersect all transects at once with the
+            NumPy segment kernel; otherwise test candidates with prepared GEOS
+            geometries from a PreparedGeometryCache.
+        profiler (Profiler): Optional; times index build, intersection and
+            classification.
+        intersection_layer (QgsVectorLayer): Optional intersection side
+            table from step [1]; when given, its points are classified
+            instead of intersecting the transects with `other_layer` again.
+            Transects without points in the table are still intersected.
+        feedback (QgsProcessingFeedback): Optional; warned about transects
+            missing from `intersection_layer`.
 
     Returns:
-        tuple: Four lists of tuples (point, t_ID, distance):
+        tuple: Four SegmentTables of reference points (t_ID, x/y, distance):
             left_first, left_second, right_first, right_second
     """
 
     # Preload features
-    transect_features = list(transect_layer.getFeatures())
-    other_features = list(other_layer.getFeatures())
-    stream_segments = {f['t_ID']: f for f in split_layer.getFeatures()}
-    other_index = QgsSpatialIndex(other_layer.getFeatures())  # spatial index for fast lookups
-
-    # Output holders
-    left_first, left_second = [], []
-    right_first, right_second = [], []
-
-    for transect in transect_features:
-        t_id = transect['t_ID']
-        transect_geom = transect.geometry()
-        midpoint = transect_geom.interpolate(transect_geom.length() / 2).asPoint()
-
-        stream_segment = stream_segments.get(t_id)
-        if not stream_segment:
-            continue  # Skip if no stream segment found for this transect
-
-        # Use stream flow direction from start to midpoint
-        stream_geom = stream_segment.geometry()
-        stream_start = stream_geom.vertexAt(0)
-        stream_mid = stream_geom.interpolate(stream_geom.length() / 2).asPoint()
-
-        direction_vector = QgsPointXY(
-            stream_mid.x() - stream_start.x(),
-            stream_mid.y() - stream_start.y()
+    with phase(profiler, "read layers") as p:
+        transect_features = list(transect_layer.getFeatures())
+        stream_segments = {f['t_ID']: f for f in split_layer.getFeatures()}
+        p["count"] = len(transect_features)
+
+    # Transects to intersect with other_layer (positions in transect_features)
+    missing = np.arange(len(transect_features))
+    transect_hits = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+    if intersection_layer is not None:
+        # Intersections found by step [1]
+        with phase(profiler, "read intersection side table") as p:
+            transect_hits = read_intersection_table(
+                intersection_layer, feature_ids(transect_features, transect_layer.fields())
+            )
+            p["count"] = len(transect_hits[0])
+        # Step [1] writes points for every transect it emits, so transects
+        # without any come from elsewhere and are intersected below
+        missing = np.setdiff1d(missing, transect_hits[0])
+        if len(missing) and feedback is not None:
+            feedback.pushWarning(
+                f"{len(missing)} of {len(transect_features)} transects have no points in the "
+                "intersection side table; intersecting them with the valley lines"
+            )
+
+    if len(missing):
+        with phase(profiler, "valley line index") as p:
+            if vectorized:
+                segments, grid = build_valley_index(other_layer)
+                p["count"] = len(segments)
+            else:
+                other_cache = PreparedGeometryCache(other_layer)
+                p["count"] = len(other_cache.geometries)
+
+        with phase(profiler, "intersections", len(missing)):
+            geometries = [transect_features[k].geometry() for k in missing.tolist()]
+            if vectorized:
+                owner, xs, ys = collect_transect_intersections(geometries, segments, grid, tolerance)
+            else:
+                owner, xs, ys = points_to_arrays([
+                    geos_transect_intersections(g, other_cache.intersecting(g)) for g in geometries
+                ])
+            transect_hits = merge_intersections(transect_hits, (missing[owner], xs, ys))
+
+    with phase(profiler, "intersection classification", len(transect_features)):
+        tables = classify_intersections(
+            *transect_hits,
+            [f['t_ID'] for f in transect_features],
+            [f.geometry() for f in transect_features],
+            [stream_segments[f['t_ID']].geometry() if f['t_ID'] in stream_segments else None
+             for f in transect_features],
+            tolerance, debug
         )
-
-        # Spatial filter
-        nearby_ids = other_index.intersects(transect_geom.boundingBox())
-        nearby_feats = [f for f in other_features if f.id() in nearby_ids]
-
-        # Temporary lists for this transect
-        left_candidates = []
-        right_candidates = []
-
-        for other in nearby_feats:
-            other_geom = other.geometry()
-            if not transect_geom.intersects(other_geom):
-                continue
-
-            # Compute intersection geometry
-            intersection = transect_geom.intersection(other_geom)
-            points = []
-
-            # Handle different geometry types robustly
-            if intersection.isMultipart():
-                points.extend(intersection.asMultiPoint())
-            elif intersection.wkbType() == QgsWkbTypes.Point:
-                points.append(intersection.asPoint())
-            elif intersection.wkbType() == QgsWkbTypes.MultiPoint:
-                points.extend(intersection.asMultiPoint())
-            elif intersection.wkbType() == QgsWkbTypes.GeometryCollection:
-                for i in range(intersection.numGeometries()):
-                    g = intersection.geometryN(i)
-                    if g.wkbType() == QgsWkbTypes.Point:
-                        points.append(g.asPoint())
-
-            for pt in points:
-                # Skip very close-to-midpoint duplicates
-                if pt.distance(QgsPointXY(midpoint)) < tolerance:
-                    continue
-
-                # Vector from stream midpoint to this point
-                vec = QgsPointXY(pt.x() - stream_mid.x(), pt.y() - stream_mid.y())
-
-                # Determine side
-                cross = direction_vector.x() * vec.y() - direction_vector.y() * vec.x()
-                side = "left" if cross > 0 else "right"
-
-                dist = midpoint.distance(pt)
-
-                # Store
-                if side == "left":
-                    left_candidates.append((pt, t_id, dist))
-                else:
-                    right_candidates.append((pt, t_id, dist))
-
-                # Optional debug info
-                if debug:
-                    print(f"t_ID {t_id}: side={side} | dist={dist:.2f} | cross={cross:.4f}")
-
-        # Sort by distance and retain top 2
-        left_sorted = sorted(left_candidates, key=lambda x: x[2])
-        right_sorted = sorted(right_candidates, key=lambda x: x[2])
-
-        if len(left_sorted) > 0:
-            left_first.append(left_sorted[0])
-        if len(left_sorted) > 1:
-            left_second.append(left_sorted[1])
-        if len(right_sorted) > 0:
-            right_first.append(right_sorted[0])
-        if len(right_sorted) > 1:
-            right_second.append(right_sorted[1])
-
-    return left_first, left_second, right_first, right_second
+    return tables
 
 # --- Compute valley width by summing left and right distances ---
-from qgis.core import (
-    QgsVectorLayer, QgsFeature, QgsField, QgsFeatureRequest,
-    QgsWkbTypes, QgsProject, QgsGeometry, QgsPointXY, QgsFields
-)
-from PyQt5.QtCore import QVariant
-
-def compute_valley_width(center_layer, left_points, right_points, out_field="VW"):
+def compute_valley_width(centers, left_points, right_points, out_field="VW"):
     """
     Calculates total valley width by summing distances from center point
     to the nearest left and right intersections.
 
-    Returns a new QgsVectorLayer with the calculated values.
+    Parameters:
+        centers (SegmentTable): Segment centers; `out_field` is (re)written.
+        left_points, right_points (SegmentTable): Reference points with a
+            distance column, joined to the centers by t_ID.
+        out_field (str): Column to write ("VW" or "VFW").
     """
-    # Clone layer
-    provider = center_layer.dataProvider()
-    fields = center_layer.fields()
-    crs = center_layer.sourceCrs()
-    cloned_layer = QgsVectorLayer(f"Point?crs={crs.authid()}", "updated_centers", "memory")
-    cloned_layer_data = cloned_layer.dataProvider()
-    cloned_layer_data.addAttributes(fields)
-    cloned_layer.updateFields()
-
-    # Add output field if missing
-    if cloned_layer.fields().indexFromName(out_field) == -1:
-        cloned_layer_data.addAttributes([QgsField(out_field, QVariant.Double)])
-        cloned_layer.updateFields()
-
-    # Build distance dictionaries
-    def build_distance_dict(points):
-        distance_dict = {}
-        for point, tid, distance in points:
-            distance_dict[tid] = distance_dict.get(tid, 0) + distance
-        return distance_dict
-
-    left_distances = build_distance_dict(left_points)
-    right_distances = build_distance_dict(right_points)
-
-    features = []
-    for feat in center_layer.getFeatures():
-        new_feat = QgsFeature(cloned_layer.fields())
-        new_feat.setGeometry(feat.geometry())
-        new_feat.setAttributes(feat.attributes())
-
-        tid = feat["t_ID"]
-        lw = left_distances.get(tid, 0)
-        rw = right_distances.get(tid, 0)
-
-        new_attrs = new_feat.attributes()
-        if out_field in center_layer.fields().names():
-            new_attrs[cloned_layer.fields().indexFromName(out_field)] = lw + rw
-        else:
-            new_attrs.append(lw + rw)
-        new_feat.setAttributes(new_attrs)
-
-        features.append(new_feat)
-
-    cloned_layer.startEditing()
-    cloned_layer.addFeatures(features)
-    cloned_layer.commitChanges()
-
-    return cloned_layer
-
+    centers[out_field] = np.zeros(len(centers))
+    centers.accumulate(out_field, left_points.t_id, left_points["distance"])
+    centers.accumulate(out_field, right_points.t_id, right_points["distance"])
@@ -0,0 +1,84 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from qgis.core import QgsFeatureSink, QgsProcessingException
+import os
+import time
+
+# Features handed to the sink per addFeatures call, e.g. OPENRES_SINK_BATCH=50000 qgis
+DEFAULT_BATCH_SIZE = int(os.environ.get("OPENRES_SINK_BATCH", "10000"))
+
+
+class BatchedSink:
+    """
+    Buffers features and writes them to a QgsFeatureSink with FastInsert in
+    batches, so memory stays bounded by the batch and file outputs
+    (GeoPackage, FlatGeobuf, ...) receive large writes instead of one call
+    per row. Use as a context manager, or call flush() when done.
+    """
+
+    def __init__(self, sink, batch_size=None):
+        self.sink = sink
+        self.batch_size = batch_size or DEFAULT_BATCH_SIZE
+        self.count = 0
+        self.seconds = 0.0
+        self._buffer = []
+
+    def add(self, feature):
+        self._buffer.append(feature)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer and self.sink is not None:
+            t0 = time.perf_counter()
+            if not self.sink.addFeatures(self._buffer, QgsFeatureSink.FastInsert):
+                raise QgsProcessingException(f"Could not write features to output: {self.sink.lastError()}")
+            self.seconds += time.perf_counter() - t0
+            self.count += len(self._buffer)
+        self._buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.flush()
+
+
+def write_features(sink, features, batch_size=None, feedback=None):
+    """
+    Streams features from an iterable into a sink in FastInsert batches.
+
+    Parameters:
+        sink (QgsFeatureSink): Destination; None (skipped output) discards.
+        features (iterable): QgsFeatures, typically a generator.
+        batch_size (int): Features per addFeatures call (default
+            OPENRES_SINK_BATCH or 10000).
+        feedback (QgsProcessingFeedback): Optional; writing stops between
+            batches when cancelled.
+
+    Returns:
+        int: Number of features written.
+    """
+    if sink is None:
+        return 0
+    with BatchedSink(sink, batch_size) as writer:
+        for i, feature in enumerate(features):
+            if i % writer.batch_size == 0 and feedback is not None and feedback.isCanceled():
+                break
+            writer.add(feature)
+    return writer.count
@@ -0,0 +1,168 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from qgis.core import QgsGeometry, QgsPointXY, QgsField, QgsFields
+from PyQt5.QtCore import QVariant
+import numpy as np
+
+from .core.geometry import perpendicular_angle, ray_endpoints, line_origin
+from .core import transects
+from .core.segment_table import SegmentTable
+from .segment_layers import table_features
+from .valley_lines import xy_parts
+
+
+# --- Perpendicular direction of a river segment ---
+def calculate_perpendicular_angle(line_start, line_end):
+    """
+    Angle (degrees) perpendicular to the line from line_start to line_end,
+    pointing to its left.
+    """
+    return perpendicular_angle(line_start.x(), line_start.y(), line_end.x(), line_end.y())
+
+# --- Midpoint and transect direction of a river segment ---
+def transect_origin(river_geom):
+    """
+    Midpoint of a river segment and the perpendicular angle of the segment
+    within 500 m of it (core.geometry.line_origin).
+
+    Returns:
+        tuple: (QgsPointXY midpoint, float angle in degrees)
+    """
+    x, y, angle = line_origin(xy_parts(river_geom), window=500)
+    return QgsPointXY(x, y), angle
+
+# --- Half-transect geometry ---
+def build_half_transect(midpoint, angle, direction, length):
+    """
+    Straight line of `length` from the midpoint along `angle` (direction 1)
+    or against it (direction -1). Left halves are built towards the midpoint
+    so that left + right join into one line.
+    """
+    ex, ey = ray_endpoints(midpoint.x(), midpoint.y(), angle, direction * length)
+    endpoint = QgsPointXY(float(ex), float(ey))
+    if direction == -1:
+        return QgsGeometry.fromPolylineXY([endpoint, midpoint])
+    return QgsGeometry.fromPolylineXY([midpoint, endpoint])
+
+def join_half_transects(left_geom, right_geom):
+    """
+    Join the left and right half-transects into one transect line.
+    """
+    return QgsGeometry.fromPolylineXY(left_geom.asPolyline() + right_geom.asPolyline()[1:])
+
+# --- Batched single-shot ray casting ---
+def cast_transects(midpoints, angles, segments, grid, increment, max_length, feedback=None, chunk_size=4096, workers=1, hits=False):
+    """
+    QGIS adapter for core.transects.cast_transects: casts both half-transects
+    of every midpoint at once.
+
+    Parameters:
+        midpoints (list): QgsPointXY transect origins.
+        angles (list): Perpendicular angles in degrees.
+        segments (SegmentSet): Exploded valley lines.
+        grid (SegmentGrid): Segment index over the same valley lines.
+        increment (int): Extension increment (m).
+        max_length (int): Maximum half-transect length (m).
+        feedback (QgsProcessingFeedback): Optional, for index statistics,
+            cancellation and the single-process fallback message.
+        workers (int): Worker processes; 1 casts in this process, 0 uses one
+            per CPU core. Results do not depend on the worker count.
+        hits (bool): Also return the intersection hits of the snapped
+            half-transects, for core.transects.transect_hits.
+
+    Returns:
+        tuple: (lengths, counts) arrays with two entries per midpoint, left
+        (direction -1) then right, plus the hits with `hits`.
+    """
+    lengths, counts, n_candidates, *rest = transects.cast_transects(
+        [p.x() for p in midpoints], [p.y() for p in midpoints], angles,
+        segments, grid, increment, max_length, chunk_size, workers,
+        is_canceled=feedback.isCanceled if feedback is not None else None,
+        on_fallback=feedback.reportError if feedback is not None else None,
+        hits=hits
+    )
+    if feedback is not None and len(lengths):
+        feedback.pushInfo(
+            f"Valley segment index: {len(segments)} segments in {grid.nx}x{grid.ny} cells, "
+            f"{n_candidates / len(lengths):.1f} candidate segments per ray"
+        )
+    return (lengths, counts) + tuple(rest)
+
+# --- River layer t_ID ---
+def tag_river_layer(layer, t_ids):
+    """
+    Writes the t_ID of every transect to its river feature through the
+    layer's edit buffer, so the change is on the undo stack and the layer
+    emits its usual signals. A layer that was already being edited keeps
+    its edit session open with the changes in it; otherwise they are
+    committed.
+
+    Parameters:
+        layer (QgsVectorLayer): River network.
+        t_ids (dict): {river feature id: t_ID}.
+
+    Returns:
+        bool: False if the layer could not be edited or committed.
+    """
+    was_editing = layer.isEditable()
+    if not was_editing and not layer.startEditing():
+        return False
+    if layer.fields().indexFromName("t_ID") == -1:
+        layer.addAttribute(QgsField("t_ID", QVariant.Int))
+    field_index = layer.fields().indexFromName("t_ID")
+    layer.beginEditCommand("OpenRES t_ID")
+    for fid, t_id in t_ids.items():
+        layer.changeAttributeValue(fid, field_index, t_id)
+    layer.endEditCommand()
+    return was_editing or layer.commitChanges()
+
+# --- Intersection side table ---
+def intersection_fields():
+    """
+    Fields of the transect intersection side table written by step [1].
+    """
+    fields = QgsFields()
+    fields.append(QgsField("t_ID", QVariant.Int))
+    fields.append(QgsField("half", QVariant.String))
+    fields.append(QgsField("rank", QVariant.Int))
+    fields.append(QgsField("distance", QVariant.Double))
+    fields.append(QgsField("lines_sig", QVariant.String))
+    return fields
+
+def intersection_features(t_ids, half, rank, distance, xs, ys, lines_sig=None):
+    """
+    Yields the point features of the intersection side table: one per
+    intersection of a transect with the valley lines, ordered by t_ID, half
+    ("left"/"right") and rank along the half.
+
+    Parameters:
+        t_ids (array-like): t_ID of every intersection.
+        half (array-like): -1 (left) or 1 (right).
+        rank (array-like): 1-based position along the half, from the center.
+        distance (array-like): Distance from the segment center.
+        xs, ys (array-like): Intersection coordinates.
+        lines_sig (str): signature_digest of the valley lines the transects
+            were intersected with, checked by [3] before reusing the table.
+    """
+    table = SegmentTable(t_ids, xs, ys)
+    table["t_ID"] = table.t_id
+    labels = np.empty(len(table), dtype=object)
+    labels[:] = np.where(np.asarray(half) < 0, "left", "right")
+    table["half"] = labels
+    table["rank"] = np.asarray(rank, dtype=np.int64)
+    table["distance"] = np.asarray(distance, dtype=np.float64)
+    return table_features(table, intersection_fields(), {"lines_sig": [lines_sig] * len(table)})
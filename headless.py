@@ -0,0 +1,125 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from qgis.core import (
+    QgsApplication,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProject,
+)
+
+from .openres_provider import OpenRESProvider
+
+# Kept alive for the whole process once started
+_app = None
+_provider = None
+
+
+# --- Headless QGIS session ---
+def start_qgis():
+    """
+    Start a QGIS application without GUI (unless one is already running) and
+    register the OpenRES Processing provider.
+
+    The processing plugin is not needed; algorithms are created from the
+    Processing registry.
+
+    Returns:
+        OpenRESProvider: The registered provider.
+    """
+    global _app, _provider
+    if QgsApplication.instance() is None:
+        _app = QgsApplication([], False)
+        _app.initQgis()
+    registry = QgsApplication.processingRegistry()
+    if registry.providerById("openres") is None:
+        _provider = OpenRESProvider()
+        registry.addProvider(_provider)
+    return registry.providerById("openres")
+
+
+def stop_qgis():
+    """
+    Exit the QGIS application started by start_qgis(), if any.
+    """
+    global _app, _provider
+    if _provider is not None:
+        QgsApplication.processingRegistry().removeProvider(_provider)
+        _provider = None
+    if _app is not None:
+        _app.exitQgis()
+        _app = None
+
+
+class LogFeedback(QgsProcessingFeedback):
+    """
+    Processing feedback that writes messages to a text stream and keeps the
+    reported errors, for runs without the Processing dialog.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__()
+        self.stream = stream if stream is not None else sys.stdout
+        self.errors = []
+
+    def pushInfo(self, info):
+        print(info, file=self.stream, flush=True)
+
+    def pushWarning(self, warning):
+        print(f"WARNING: {warning}", file=self.stream, flush=True)
+
+    def reportError(self, error, fatalError=False):
+        self.errors.append(error)
+        print(f"ERROR: {error}", file=self.stream, flush=True)
+
+
+def run_algorithm(name, parameters, feedback=None):
+    """
+    Run an OpenRES algorithm in this process.
+
+    Parameters:
+        name (str): Algorithm name without the provider prefix, e.g. "run_pipeline".
+        parameters (dict): Processing parameters; outputs may be file paths.
+        feedback (QgsProcessingFeedback): Optional; defaults to a LogFeedback
+            on stdout.
+
+    Returns:
+        dict: Algorithm results.
+
+    Raises:
+        QgsProcessingException: If the algorithm is unknown or fails.
+    """
+    start_qgis()
+    algorithm = QgsApplication.processingRegistry().createAlgorithmById(f"openres:{name}")
+    if algorithm is None:
+        raise QgsProcessingException(f"Unknown OpenRES algorithm: {name}")
+
+    feedback = feedback if feedback is not None else LogFeedback()
+    context = QgsProcessingContext()
+    context.setProject(QgsProject.instance())
+    context.setFeedback(feedback)
+
+    results, ok = algorithm.run(parameters, context, feedback)
+    if not ok:
+        errors = getattr(feedback, "errors", None)
+        raise QgsProcessingException(errors[-1] if errors else f"openres:{name} failed")
+    return results
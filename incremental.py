@@ -0,0 +1,133 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+
+import numpy as np
+
+from .core.fingerprint import unique_fingerprints, transect_context
+from .core.result_store import FEATURE_COLUMNS
+from .core.segment_table import SegmentTable
+
+
+# --- Change detection ---
+def segment_fingerprints(geometries):
+    """
+    Fingerprints of river segment geometries (see
+    core.fingerprint.unique_fingerprints), from their WKB.
+    """
+    return unique_fingerprints(bytes(geom.asWkb()) for geom in geometries)
+
+def run_key(settings):
+    """
+    Key of a pipeline run from its parameters and input signatures; results
+    stored by a run are only reused by runs with the same key.
+    """
+    return json.dumps(settings, sort_keys=True)
+
+def clean_segments(stored, fingerprints, origins, angles, segments, grid):
+    """
+    Segments whose stored results are still valid: the segment geometry is
+    unchanged (its fingerprint is stored) and its stored transect crosses
+    the same valley line segments as before.
+
+    Parameters:
+        stored (dict): fingerprint -> stored row (ResultStore.load).
+        fingerprints (list): Fingerprints of the current segments.
+        origins (list): QgsPointXY transect origins of the current segments.
+        angles (list): Perpendicular angles in degrees.
+        segments (SegmentSet): Exploded current valley lines.
+        grid (SegmentGrid): Segment index over the same valley lines.
+
+    Returns:
+        ndarray: bool mask aligned with `fingerprints`.
+    """
+    clean = np.zeros(len(fingerprints), dtype=bool)
+    known = [k for k, fp in enumerate(fingerprints) if fp in stored]
+    if not known:
+        return clean
+    rows = [stored[fingerprints[k]] for k in known]
+    contexts = transect_context(
+        [origins[k].x() for k in known], [origins[k].y() for k in known], [angles[k] for k in known],
+        [row["left_length"] for row in rows], [row["right_length"] for row in rows],
+        segments, grid
+    )
+    for k, row, context in zip(known, rows, contexts):
+        clean[k] = row["context"] == context
+    return clean
+
+
+# --- Store rows ---
+def result_rows(fingerprints, t_ids, lengths, counts, contexts, centers):
+    """
+    Store rows of recomputed segments.
+
+    Parameters:
+        fingerprints, t_ids (list): Recomputed segments.
+        lengths, counts (ndarray): Half-transect lengths and intersection
+            counts, two entries per segment (left then right).
+        contexts (list): transect_context of each segment.
+        centers (SegmentTable): Features of the segments with a valid
+            transect.
+
+    Returns:
+        list: {column: value} dicts for ResultStore.save.
+    """
+    rows = centers.rows(t_ids)
+    out = []
+    for k, (fp, t_id) in enumerate(zip(fingerprints, t_ids)):
+        row = {
+            "fingerprint": fp, "t_id": int(t_id), "context": contexts[k],
+            "left_length": float(lengths[2 * k]), "right_length": float(lengths[2 * k + 1]),
+            "left_n": int(counts[2 * k]), "right_n": int(counts[2 * k + 1])
+        }
+        if rows[k] >= 0:
+            for name in FEATURE_COLUMNS:
+                if name in centers:
+                    row[name] = centers[name][rows[k]]
+        out.append(row)
+    return out
+
+def merge_stored(centers, stored_rows, xs, ys):
+    """
+    Table of recomputed and reused segments, sorted by t_ID.
+
+    Parameters:
+        centers (SegmentTable): Recomputed segments.
+        stored_rows (list): Store rows of the reused segments.
+        xs, ys (list): Centers of the reused segments.
+
+    Returns:
+        SegmentTable: with a column per feature and t_ID.
+    """
+    t_ids = np.concatenate([centers.t_id, np.array([row["t_id"] for row in stored_rows], dtype=np.int64)])
+    order = np.argsort(t_ids, kind="stable")
+    merged = SegmentTable(
+        t_ids[order],
+        np.concatenate([centers.x, np.asarray(xs, dtype=np.float64)])[order],
+        np.concatenate([centers.y, np.asarray(ys, dtype=np.float64)])[order]
+    )
+    merged["t_ID"] = merged.t_id
+    for name in FEATURE_COLUMNS:
+        current = centers[name] if name in centers else np.full(len(centers), np.nan)
+        if name == "GEO":
+            previous = np.empty(len(stored_rows), dtype=object)
+            previous[:] = [row[name] for row in stored_rows]
+            merged[name] = np.concatenate([current.astype(object), previous])[order]
+        else:
+            previous = np.array([np.nan if row[name] is None else row[name] for row in stored_rows], dtype=np.float64)
+            merged[name] = np.concatenate([current.astype(np.float64), previous])[order]
+    return merged
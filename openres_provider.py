@@ -15,24 +15,21 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from pathlib import Path
-from qgis.core import QgsProcessingProvider,QgsMessageLog,Qgis
-import os
+from qgis.core import QgsProcessingProvider,Qgis
 from qgis.PyQt.QtGui import QIcon
 
+from .debug import log as _log
+
+from .algorithms.run_pipeline_algorithm import RunPipelineAlgorithm
 from .algorithms.generate_transects_algorithm import GenerateTransectsAlgorithm
 from .algorithms.extract_vw_algorithm import ExtractVWAlgorithm
 from .algorithms.extract_point_data_algorithm import ExtractPointDataAlgorithm
 from .algorithms.extract_dvs_sin_algorithm import ExtractDVSAlgorithm
 from .algorithms.extract_side_slopes_algorithm import ExtractSideSlopesAlgorithm
+from .algorithms.extract_cross_sections_algorithm import ExtractCrossSectionsAlgorithm
+from .algorithms.relative_elevation_algorithm import RelativeElevationAlgorithm
 
 
-#To use log, type OPENRES_DEBUG=1 qgis in bash, then check Log Messages Panel → OpenRES tab for messages
-
-DEBUG = os.environ.get("OPENRES_DEBUG") == "1"
-def _log(msg, level=Qgis.Info):
-    if DEBUG:
-        QgsMessageLog.logMessage(msg, "OpenRES", level)
-
 class OpenRESProvider(QgsProcessingProvider):
     def __init__(self):
         super().__init__()
@@ -69,11 +66,14 @@ class OpenRESProvider(QgsProcessingProvider):
 
 
     def loadAlgorithms(self):
+        self.addAlgorithm(RunPipelineAlgorithm())
         self.addAlgorithm(GenerateTransectsAlgorithm())
         self.addAlgorithm(ExtractVWAlgorithm())
         self.addAlgorithm(ExtractPointDataAlgorithm())
         self.addAlgorithm(ExtractDVSAlgorithm())
         self.addAlgorithm(ExtractSideSlopesAlgorithm())
+        self.addAlgorithm(ExtractCrossSectionsAlgorithm())
+        self.addAlgorithm(RelativeElevationAlgorithm())
 
     def id(self):
         return "openres"
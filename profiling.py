@@ -0,0 +1,139 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+import json
+import os
+import time
+
+from .raster_cache import tile_cache
+from .raster_sampler import SAMPLE_STATS
+
+# Directory for JSON run profiles, e.g. OPENRES_PROFILE_DIR=/tmp/openres qgis
+PROFILE_DIR = os.environ.get("OPENRES_PROFILE_DIR")
+
+
+def _raster_counters():
+    cache = tile_cache()
+    return {
+        "raster_points": SAMPLE_STATS["points"],
+        "blocks_read": cache.misses,
+        "blocks_cached": cache.hits,
+    }
+
+
+class Profiler:
+    """
+    Wall time, feature counts and raster reads per phase of an algorithm run.
+
+    Wrap each phase in `with profiler.phase(name) as p:` and set `p["count"]`
+    to the number of features it handled; work timed elsewhere (e.g. sink
+    writes spread over a loop) is added with `record()` and may overlap the
+    phase it happened in. `report()` pushes a summary to the
+    Processing log and, when OPENRES_PROFILE_DIR is set, writes the phases
+    to `<algorithm>_<timestamp>.json` there.
+    """
+
+    def __init__(self, algorithm, feedback=None):
+        self.algorithm = algorithm
+        self.feedback = feedback
+        self.phases = []
+        self._started = time.time()
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name, count=None):
+        record = {"phase": name, "count": count}
+        before = _raster_counters()
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - t0
+            after = _raster_counters()
+            record["seconds"] = round(seconds, 6)
+            record["per_second"] = round(record["count"] / seconds, 1) if record["count"] and seconds > 0 else None
+            record.update({key: after[key] - before[key] for key in after})
+            self.phases.append(record)
+
+    def record(self, name, seconds, count=None):
+        """
+        Add a phase timed by the caller (no raster counters).
+        """
+        self.phases.append({
+            "phase": name,
+            "count": count,
+            "seconds": round(seconds, 6),
+            "per_second": round(count / seconds, 1) if count and seconds > 0 else None,
+            "raster_points": 0,
+            "blocks_read": 0,
+            "blocks_cached": 0,
+        })
+
+    def summary(self):
+        """
+        Run profile as a JSON-serialisable dict.
+        """
+        return {
+            "algorithm": self.algorithm,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._started)),
+            "total_seconds": round(time.perf_counter() - self._t0, 6),
+            "phases": self.phases,
+        }
+
+    def report(self):
+        """
+        Push one line per phase to the Processing log and dump the JSON
+        profile if OPENRES_PROFILE_DIR is set.
+
+        Returns:
+            dict: The summary.
+        """
+        summary = self.summary()
+        if self.feedback is not None:
+            self.feedback.pushInfo(f"OpenRES profile: {self.algorithm} ({summary['total_seconds']:.2f} s)")
+            for p in self.phases:
+                line = f"  {p['phase']:<28} {p['seconds']:9.3f} s"
+                if p["count"] is not None:
+                    line += f"  {p['count']:>9} features"
+                if p["per_second"] is not None:
+                    line += f"  {p['per_second']:>11.1f}/s"
+                if p["raster_points"]:
+                    line += f"  raster: {p['raster_points']} points, {p['blocks_read']} blocks read, {p['blocks_cached']} cached"
+                self.feedback.pushInfo(line)
+
+        if PROFILE_DIR:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self._started))
+            path = os.path.join(PROFILE_DIR, f"{self.algorithm}_{stamp}.json")
+            with open(path, "w") as f:
+                json.dump(summary, f, indent=2)
+            if self.feedback is not None:
+                self.feedback.pushInfo(f"Profile written to {path}")
+        return summary
+
+
+@contextmanager
+def phase(profiler, name, count=None):
+    """
+    profiler.phase(name) when a profiler is given, otherwise a no-op
+    yielding a throwaway record; for helpers that take an optional profiler.
+    """
+    if profiler is None:
+        yield {"phase": name, "count": count}
+    else:
+        with profiler.phase(name, count) as record:
+            yield record
@@ -0,0 +1,308 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from qgis.core import Qgis, QgsProviderRegistry, QgsRectangle
+
+from .raster_cache import tile_cache, source_key
+from .debug import log
+
+try:
+    from osgeo import gdal, gdal_array
+except ImportError:  # Non-GDAL builds fall back to QgsRasterBlock reads
+    gdal = None
+
+
+def _numpy_dtype(data_type):
+    """
+    Map a Qgis.DataType to the NumPy dtype of a QgsRasterBlock buffer.
+    """
+    types = {
+        Qgis.DataType.Byte: np.uint8,
+        Qgis.DataType.UInt16: np.uint16,
+        Qgis.DataType.Int16: np.int16,
+        Qgis.DataType.UInt32: np.uint32,
+        Qgis.DataType.Int32: np.int32,
+        Qgis.DataType.Float32: np.float32,
+        Qgis.DataType.Float64: np.float64,
+    }
+    if hasattr(Qgis.DataType, "Int8"):  # QGIS >= 3.30
+        types[Qgis.DataType.Int8] = np.int8
+    if data_type not in types:
+        raise ValueError(f"Unsupported raster data type: {data_type}")
+    return types[data_type]
+
+
+def _float_type(dtype):
+    # Keep float32 for types it represents exactly to halve the cache footprint
+    dtype = np.dtype(dtype)
+    return np.float32 if dtype.itemsize <= 2 or dtype == np.float32 else np.float64
+
+
+class NoDataMask:
+    """
+    Source and user no data values of one band, applied as NaN.
+
+    Readers that see the raw stored values (GDAL, memory map) pass the GDAL
+    band: its no data value is then matched before, and its scale and offset
+    applied after, as the provider does for QgsRasterBlock reads. User no
+    data ranges are always in scaled values.
+    """
+
+    def __init__(self, provider, band, gdal_band=None):
+        self.value = None
+        if provider.sourceHasNoDataValue(band) and provider.useSourceNoDataValue(band):
+            self.value = provider.sourceNoDataValue(band)
+            if gdal_band is not None and gdal_band.GetNoDataValue() is not None:
+                self.value = gdal_band.GetNoDataValue()
+        self.ranges = [(r.min(), r.max()) for r in provider.userNoDataValues(band)]
+        self.scale, self.offset = 1.0, 0.0
+        if gdal_band is not None:
+            self.scale = gdal_band.GetScale() or 1.0
+            self.offset = gdal_band.GetOffset() or 0.0
+
+    def apply(self, values):
+        missing = values == self.value if self.value is not None else None
+        if self.scale != 1.0 or self.offset != 0.0:
+            values *= self.scale
+            values += self.offset
+        if missing is not None:
+            values[missing] = np.nan
+        for lo, hi in self.ranges:
+            values[(values >= lo) & (values <= hi)] = np.nan
+        return values
+
+
+class BlockReader:
+    """
+    Gathers pixel values block by block through the process-wide tile cache.
+
+    Subclasses decode a single window with `_decode(r0, c0, r1, c1)`; only
+    the blocks touched by a batch of points are read, so memory stays bounded
+    by the tile cache budget regardless of raster size.
+    """
+
+    def __init__(self, source, band, width, height, block_width, block_height, nodata):
+        self.source = source
+        self.band = band
+        self.width = width
+        self.height = height
+        self.block_width = block_width
+        self.block_height = block_height
+        self.blocks_x = -(-width // block_width)
+        self.nodata = nodata
+
+    def read_block(self, block_row, block_col):
+        """
+        Return one block as a float array with no data pixels set to NaN,
+        served from the tile cache when possible.
+        """
+        key = (self.source, self.band, self.block_width, self.block_height, block_row, block_col)
+        return tile_cache().get(key, lambda: self._load(block_row, block_col))
+
+    def _load(self, block_row, block_col):
+        r0, c0 = block_row * self.block_height, block_col * self.block_width
+        r1 = min(r0 + self.block_height, self.height)
+        c1 = min(c0 + self.block_width, self.width)
+        values = self._decode(r0, c0, r1, c1)
+        return self.nodata.apply(values.astype(_float_type(values.dtype)))
+
+    def _decode(self, r0, c0, r1, c1):
+        raise NotImplementedError
+
+    def gather(self, rows, cols):
+        """
+        Values at pixel rows/cols (all inside the raster), as float64.
+        """
+        values = np.full(len(rows), np.nan)
+        if len(rows) == 0:
+            return values
+        block_rows = rows // self.block_height
+        block_cols = cols // self.block_width
+        order = np.argsort(block_rows * self.blocks_x + block_cols, kind="stable")
+        block_ids = (block_rows * self.blocks_x + block_cols)[order]
+        bounds = np.flatnonzero(np.diff(block_ids)) + 1
+
+        for group in np.split(order, bounds):
+            block_row, block_col = block_rows[group[0]], block_cols[group[0]]
+            data = self.read_block(block_row, block_col)
+            values[group] = data[rows[group] - block_row * self.block_height, cols[group] - block_col * self.block_width]
+        tile_cache().log_stats()
+        return values
+
+
+class ProviderBlockReader(BlockReader):
+    """
+    Reads blocks through QgsRasterDataProvider.block(); works for any provider.
+    """
+
+    def __init__(self, provider, band, block_size=512):
+        super().__init__(source_key(provider), band, provider.xSize(), provider.ySize(),
+                         block_size, block_size, NoDataMask(provider, band))
+        self.provider = provider
+        extent = provider.extent()
+        self.x_min = extent.xMinimum()
+        self.y_max = extent.yMaximum()
+        self.x_res = extent.width() / self.width
+        self.y_res = extent.height() / self.height
+
+    def _decode(self, r0, c0, r1, c1):
+        rect = QgsRectangle(
+            self.x_min + c0 * self.x_res, self.y_max - r1 * self.y_res,
+            self.x_min + c1 * self.x_res, self.y_max - r0 * self.y_res
+        )
+        block = self.provider.block(self.band, rect, c1 - c0, r1 - r0)
+        dtype = _numpy_dtype(block.dataType())
+        return np.frombuffer(bytes(block.data()), dtype=dtype).reshape(r1 - r0, c1 - c0)
+
+
+class GdalWindowReader(BlockReader):
+    """
+    Reads windows with GDAL ReadAsArray, aligned to the file's own block
+    layout so every window decodes whole TIFF tiles or strips.
+    """
+
+    def __init__(self, dataset, provider, band, block_size=512):
+        self.dataset = dataset  # keep the dataset alive for the band handle
+        self.gdal_band = dataset.GetRasterBand(band)
+        block_width, block_height = self.gdal_band.GetBlockSize()
+        # Striped files report one-row blocks; group rows so windows are not tiny
+        if block_width * block_height < block_size * block_size:
+            block_height = max(block_height, (block_size * block_size) // max(block_width, 1))
+        super().__init__(source_key(provider), band, dataset.RasterXSize, dataset.RasterYSize,
+                         block_width, block_height, NoDataMask(provider, band, self.gdal_band))
+
+    def _decode(self, r0, c0, r1, c1):
+        return self.gdal_band.ReadAsArray(int(c0), int(r0), int(c1 - c0), int(r1 - r0))
+
+
+class MemmapReader:
+    """
+    Memory-maps the pixel data of an uncompressed GeoTIFF band.
+
+    Supported when the band's strips or tiles are stored back to back in row
+    major order, which is what GDAL writes for uncompressed files. Pages are
+    loaded by the OS on demand, so peak memory does not grow with raster size.
+
+    Reads do not go through the tile cache: a point costs one array index
+    into pages the OS page cache already keeps, and copying those pages into
+    the LRU would only hold the same pixels twice and evict decoded blocks
+    of compressed rasters.
+    """
+
+    def __init__(self, array, tiled, tile_width, tile_height, nodata):
+        self.array = array
+        self.tiled = tiled
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.nodata = nodata
+
+    @classmethod
+    def open(cls, path, dataset, provider, band):
+        """
+        Return a MemmapReader for `band`, or None if the layout does not allow
+        a memory map.
+        """
+        if dataset.GetDriver().ShortName != "GTiff":
+            return None
+        structure = dataset.GetMetadata("IMAGE_STRUCTURE") or {}
+        if structure.get("COMPRESSION") or (dataset.RasterCount > 1 and structure.get("INTERLEAVE") != "BAND"):
+            return None
+        gdal_band = dataset.GetRasterBand(band)
+        if gdal_band.GetMetadataItem("NBITS", "IMAGE_STRUCTURE"):
+            return None
+
+        width, height = dataset.RasterXSize, dataset.RasterYSize
+        tile_width, tile_height = gdal_band.GetBlockSize()
+        tiles_x = -(-width // tile_width)
+        tiles_y = -(-height // tile_height)
+        tiled = tile_width != width
+
+        def offset(bx, by):
+            value = gdal_band.GetMetadataItem(f"BLOCK_OFFSET_{bx}_{by}", "TIFF")
+            return int(value) if value else None
+
+        dtype = np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(gdal_band.DataType))
+        with open(path, "rb") as f:
+            byte_order = f.read(2)
+        dtype = dtype.newbyteorder("<" if byte_order == b"II" else ">")
+
+        tile_bytes = tile_width * tile_height * dtype.itemsize
+        base = offset(0, 0)
+        if base is None:
+            return None
+        # Blocks must follow each other with no gaps for a single memory map
+        for bx, by in ((tiles_x - 1, tiles_y - 1), (min(1, tiles_x - 1), 0), (0, min(1, tiles_y - 1))):
+            if offset(bx, by) != base + (by * tiles_x + bx) * tile_bytes:
+                return None
+
+        if tiled:
+            shape = (tiles_y, tiles_x, tile_height, tile_width)
+        else:
+            shape = (height, width)
+        array = np.memmap(path, dtype=dtype, mode="r", offset=base, shape=shape)
+        log(f"Memory-mapped {path} band {band} ({'tiled' if tiled else 'striped'})")
+        return cls(array, tiled, tile_width, tile_height, NoDataMask(provider, band, gdal_band))
+
+    def gather(self, rows, cols):
+        """
+        Values at pixel rows/cols (all inside the raster), as float64. Points
+        are visited in file order so each page is touched once per batch.
+        """
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+        if self.tiled:
+            raw = self.array[rows // self.tile_height, cols // self.tile_width,
+                             rows % self.tile_height, cols % self.tile_width]
+        else:
+            raw = self.array[rows, cols]
+        values = np.empty(len(order))
+        values[order] = self.nodata.apply(raw.astype(np.float64))
+        return values
+
+
+def gdal_path(provider):
+    """
+    File path behind a GDAL raster provider, or None.
+    """
+    if gdal is None or provider.name() != "gdal":
+        return None
+    return QgsProviderRegistry.instance().decodeUri("gdal", provider.dataSourceUri()).get("path")
+
+
+def open_reader(raster_layer, band=1, block_size=512):
+    """
+    Pick the cheapest way to read `band` of `raster_layer`:
+
+    1. memory map, for uncompressed GeoTIFFs with contiguous strips/tiles;
+    2. GDAL windowed ReadAsArray over the file's own blocks;
+    3. QgsRasterDataProvider.block() for every other provider.
+
+    Readers 2 and 3 go through the shared tile cache; the memory map relies
+    on the OS page cache instead. All three return scaled values with no
+    data as NaN.
+    """
+    provider = raster_layer.dataProvider()
+    path = gdal_path(provider)
+    if path:
+        dataset = gdal.Open(path, gdal.GA_ReadOnly)
+        if dataset is not None and dataset.RasterXSize == provider.xSize() and dataset.RasterYSize == provider.ySize():
+            reader = MemmapReader.open(path, dataset, provider, band)
+            if reader is not None:
+                return reader
+            return GdalWindowReader(dataset, provider, band, block_size)
+    return ProviderBlockReader(provider, band, block_size)
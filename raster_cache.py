@@ -0,0 +1,111 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import threading
+from collections import OrderedDict
+
+from .debug import log
+
+
+class TileCache:
+    """
+    Process-wide LRU cache of decoded raster tiles.
+
+    Tiles are keyed by (raster source, band, tile size, tile row, tile col)
+    and evicted least recently used first once the cached arrays exceed the
+    memory budget. Cached arrays are read-only because they are shared by
+    every algorithm that samples the same raster.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """
+        Return the tile stored under `key`, calling `loader()` to decode it on
+        a miss.
+        """
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return tile
+            self.misses += 1
+
+        tile = loader()
+        tile.flags.writeable = False
+
+        with self._lock:
+            if key not in self._tiles:
+                self._tiles[key] = tile
+                self.nbytes += tile.nbytes
+                self._evict()
+        return tile
+
+    def set_budget(self, budget_bytes):
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self.nbytes = 0
+
+    def _evict(self):
+        # Always keep the most recent tile, even if it alone exceeds the budget
+        while self.nbytes > self.budget_bytes and len(self._tiles) > 1:
+            _, tile = self._tiles.popitem(last=False)
+            self.nbytes -= tile.nbytes
+            self.evictions += 1
+
+    def log_stats(self):
+        log(
+            f"Raster tile cache: {self.hits} hits, {self.misses} misses, {self.evictions} evictions, "
+            f"{len(self._tiles)} tiles / {self.nbytes / 2**20:.1f} of {self.budget_bytes / 2**20:.0f} MB"
+        )
+
+
+# Memory budget in MB, e.g. OPENRES_TILE_CACHE_MB=2048 qgis
+_cache = TileCache(int(os.environ.get("OPENRES_TILE_CACHE_MB", "512")) * 2**20)
+
+
+def tile_cache():
+    """
+    Return the process-wide TileCache shared by all OpenRES algorithms.
+    """
+    return _cache
+
+
+def source_key(provider):
+    """
+    Identify a raster source for cache keys. Local files also include their
+    size and modification time, so edited rasters are not served stale tiles.
+    """
+    uri = provider.dataSourceUri()
+    path = uri.split("|")[0]
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return (uri, stat.st_size, stat.st_mtime_ns)
+    return (uri,)
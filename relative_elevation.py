@@ -0,0 +1,99 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from qgis.core import (
+    Qgis,
+    QgsFeatureRequest,
+    QgsProcessingException,
+    QgsRasterBlock,
+    QgsRasterFileWriter
+)
+from qgis.PyQt.QtCore import QByteArray
+import os
+
+import numpy as np
+
+from .core.rem import SeedIndex
+from .extract_dvs_sinuosity import stream_lines
+
+# No data value of REM rasters
+NODATA = -9999.0
+
+
+# --- Channel pixels ---
+def channel_seeds(river_layer, sampler, tile_size):
+    """
+    DEM pixels crossed by the river network and their elevations, as the
+    seeds of the relative elevation model.
+
+    Rivers are densified at half the pixel size (core.polylines) so that
+    every pixel a channel crosses is hit, and each pixel is kept once.
+
+    Parameters:
+        river_layer (QgsFeatureSource): River network (same CRS as the DEM).
+        sampler (RasterSampler): DEM sampler.
+        tile_size (int): Tile size of the REM run, for bucketing the seeds.
+
+    Returns:
+        SeedIndex
+    """
+    request = QgsFeatureRequest().setNoAttributes()
+    lines = stream_lines(f.geometry() for f in river_layer.getFeatures(request))
+    _, _, xs, ys = lines.densify(min(sampler.x_res, sampler.y_res) / 2)
+    rows, cols, inside = sampler.pixel_indices(xs, ys)
+    pixels = np.unique(rows[inside] * sampler.width + cols[inside])
+    rows, cols = pixels // sampler.width, pixels % sampler.width
+    z = sampler.reader.gather(rows, cols)
+    valid = ~np.isnan(z)
+    return SeedIndex(rows[valid], cols[valid], z[valid], tile_size)
+
+
+def read_tile(sampler, window):
+    """
+    DEM values of a pixel window (r0, c0, r1, c1), NaN for no data.
+    """
+    r0, c0, r1, c1 = window
+    rows, cols = np.mgrid[r0:r1, c0:c1]
+    return sampler.reader.gather(rows.ravel(), cols.ravel()).reshape(r1 - r0, c1 - c0)
+
+
+# --- Output raster ---
+class RemWriter:
+    """
+    Single-band Float32 raster on the DEM grid, written tile by tile.
+    """
+
+    def __init__(self, path, raster, sampler):
+        writer = QgsRasterFileWriter(path)
+        writer.setOutputFormat(QgsRasterFileWriter.driverForExtension(os.path.splitext(path)[1].lstrip(".")) or "GTiff")
+        self.provider = writer.createOneBandRaster(
+            Qgis.DataType.Float32, sampler.width, sampler.height, raster.dataProvider().extent(), raster.crs()
+        )
+        if self.provider is None or not self.provider.isValid():
+            raise QgsProcessingException(f"Could not create output raster {path}")
+        self.provider.setNoDataValue(1, NODATA)
+        self.provider.setEditable(True)
+
+    def write(self, window, rem):
+        r0, c0, r1, c1 = window
+        values = np.where(np.isnan(rem), NODATA, rem).astype(np.float32)
+        block = QgsRasterBlock(Qgis.DataType.Float32, c1 - c0, r1 - r0)
+        block.setData(QByteArray(values.tobytes()))
+        if not self.provider.writeBlock(block, 1, c0, r0):
+            raise QgsProcessingException(f"Could not write REM tile at row {r0}, column {c0}")
+
+    def close(self):
+        self.provider.setEditable(False)
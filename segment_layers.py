@@ -0,0 +1,147 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from qgis.core import (
+    QgsFeature,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsPointXY,
+    NULL
+)
+import numpy as np
+
+from .core.segment_table import SegmentTable, MISSING_ID
+
+
+# --- Layers to tables ---
+def feature_ids(features, fields, id_field="t_ID"):
+    """
+    t_ID of each feature as an int64 array; NULL or missing IDs become
+    MISSING_ID, which never matches a lookup.
+    """
+    id_index = fields.lookupField(id_field)
+    t_ids = []
+    for feature in features:
+        t_id = feature.attributes()[id_index] if id_index != -1 else None
+        t_ids.append(MISSING_ID if t_id is None or t_id == NULL else int(t_id))
+    return np.asarray(t_ids, dtype=np.int64)
+
+
+def table_from_layer(layer, id_field="t_ID"):
+    """
+    Reads a point layer into a SegmentTable.
+
+    Point coordinates go to `x`/`y` (first point of multipoints) and every
+    attribute is kept as an object column so it is written back unchanged.
+
+    Parameters:
+        layer (QgsVectorLayer): Point layer with an ID field.
+        id_field (str): Name of the t_ID field (matched case-insensitively).
+
+    Returns:
+        SegmentTable
+    """
+    fields = layer.fields()
+    features = list(layer.getFeatures())
+
+    xs, ys, attributes = [], [], []
+    for feature in features:
+        geom = feature.geometry()
+        if geom is None or geom.isNull():
+            xs.append(np.nan)
+            ys.append(np.nan)
+        else:
+            point = geom.asPoint() if not geom.isMultipart() else geom.asMultiPoint()[0]
+            xs.append(point.x())
+            ys.append(point.y())
+
+        attributes.append(feature.attributes())
+
+    table = SegmentTable(feature_ids(features, fields, id_field), xs, ys)
+    for i, name in enumerate(fields.names()):
+        column = np.empty(len(attributes), dtype=object)
+        column[:] = [attrs[i] for attrs in attributes]
+        table[name] = column
+    return table
+
+
+def table_from_hits(t_ids, xs, ys, distances):
+    """
+    Builds a reference point table from intersection points, as returned by
+    find_two_intersections_by_side.
+
+    Returns:
+        SegmentTable: One row per hit with a float `distance` column.
+    """
+    table = SegmentTable(t_ids, xs, ys)
+    table["t_ID"] = table.t_id
+    table["distance"] = np.asarray(distances, dtype=np.float64)
+    return table
+
+
+# --- Tables to features (sink boundary only) ---
+def extend_fields(fields, new_fields):
+    """
+    Copy of `fields` with each (name, QVariant type) in `new_fields` appended
+    unless a field of that name already exists.
+    """
+    out = QgsFields(fields)
+    for name, field_type in new_fields:
+        if out.indexFromName(name) == -1:
+            out.append(QgsField(name, field_type))
+    return out
+
+
+def _column_values(column):
+    if column.dtype == np.float64:
+        return [None if v != v else v for v in column.tolist()]
+    return column.tolist()
+
+
+def table_features(table, fields, values=None):
+    """
+    Yields point QgsFeatures from a table, one per row, for streaming into a
+    sink with feature_sink.write_features.
+
+    Parameters:
+        table (SegmentTable): Source rows; `x`/`y` become the point geometry.
+        fields (QgsFields): Output fields. Each field is filled from the
+            table column of the same name (NULL if there is none); NaN in
+            float columns is written as NULL.
+        values (dict): Optional {field name: list} overriding table columns,
+            e.g. constant attributes.
+
+    Yields:
+        QgsFeature
+    """
+    values = values or {}
+    columns = []
+    for name in fields.names():
+        if name in values:
+            columns.append(values[name])
+        elif name in table:
+            columns.append(_column_values(table[name]))
+        else:
+            columns.append([None] * len(table))
+
+    for x, y, attrs in zip(table.x.tolist(), table.y.tolist(), zip(*columns) if columns else [()] * len(table)):
+        feature = QgsFeature(fields)
+        if x == x and y == y:
+            feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+        feature.setAttributes(list(attrs))
+        yield feature
+
@@ -0,0 +1,102 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+
+
+# --- Source signatures ---
+def source_files(path):
+    """
+    Files holding a file-based source: the file itself, a GeoPackage/SQLite
+    write-ahead log and the attribute and index sidecars of a shapefile.
+    """
+    stem, ext = os.path.splitext(path)
+    candidates = [path, path + "-wal"]
+    if ext.lower() == ".shp":
+        candidates += [stem + sidecar for sidecar in (".dbf", ".shx", ".prj", ".cpg")]
+    return [f for f in candidates if os.path.isfile(f)]
+
+def file_signature(path):
+    """
+    Absolute path, size and modification time of each file of a file-based
+    source (source_files).
+    """
+    return [[os.path.abspath(f), os.stat(f).st_size, os.stat(f).st_mtime_ns] for f in source_files(path)]
+
+def feature_checksum(layer):
+    """
+    Digest of every feature's geometry (WKB) and attributes, in feature order.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for feature in layer.getFeatures():
+        geom = feature.geometry()
+        if geom is not None and not geom.isNull():
+            h.update(bytes(geom.asWkb()))
+        h.update(repr(feature.attributes()).encode("utf-8"))
+    return h.hexdigest()
+
+def source_signature(layer):
+    """
+    Signature of a layer's data source: its source string with the size and
+    modification time of the files behind it, so that an edited or replaced
+    file gets a new signature. Vector layers that are not files (memory
+    layers, databases) are identified by a checksum of their features.
+
+    Returns:
+        list: JSON-serializable signature; None for no layer.
+    """
+    if layer is None:
+        return None
+    source = layer.source()
+    path = source.split("|")[0]
+    if os.path.isfile(path):
+        return [source, file_signature(path)]
+    if hasattr(layer, "getFeatures"):
+        return [source, feature_checksum(layer)]
+    return [source]
+
+def signature_digest(layer):
+    """
+    Short hex digest of a vector layer's source_signature, for tagging data
+    derived from the layer; None for layers with unsaved edits, which the
+    signature does not describe.
+    """
+    if layer is None or layer.isModified():
+        return None
+    signature = json.dumps(source_signature(layer)).encode("utf-8")
+    return hashlib.blake2b(signature, digest_size=8).hexdigest()
+
+# --- Sidecar files ---
+def index_path(layer, suffix=".openres-index"):
+    """
+    Sidecar file next to a file-based layer, e.g. "valleys.gpkg.lines.openres-index"
+    for layer "lines" of valleys.gpkg; None for layers that are not files.
+    """
+    if layer is None:
+        return None
+    source = layer.source()
+    parts = source.split("|")
+    if not os.path.isfile(parts[0]):
+        return None
+    name = parts[0]
+    for option in parts[1:]:
+        if option.startswith("layername="):
+            name += "." + option[len("layername="):]
+        elif option.startswith("layerid="):
+            name += "." + option[len("layerid="):]
+    return name + suffix
@@ -0,0 +1,378 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from qgis.core import (
+    QgsApplication,
+    QgsCoordinateReferenceSystem,
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsProcessingAlgorithm,
+    QgsProcessingFeatureSourceDefinition,
+    QgsWkbTypes
+)
+from PyQt5.QtCore import QVariant
+from functools import lru_cache
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+from .core.fingerprint import digest
+from .feature_sink import write_features
+from .sources import file_signature, source_signature
+from .profiling import Profiler
+
+# The cache is off unless given a size budget, e.g. OPENRES_CACHE_MB=2048 qgis
+# (default folder: "openres/stage_cache" in the QGIS settings folder, or OPENRES_CACHE_DIR)
+CACHE_DIR = os.environ.get("OPENRES_CACHE_DIR")
+CACHE_MB = int(os.environ.get("OPENRES_CACHE_MB", "0"))
+
+# Parameters that do not change an algorithm's outputs
+UNKEYED_PARAMETERS = {"BYPASS_CACHE", "WORKERS"}
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENTRY_FILE = "entry.json"
+
+
+@lru_cache(maxsize=1)
+def code_version():
+    """
+    Digest of the plugin's Python sources (path, size, modification time),
+    so that cached results are not reused across plugin versions or edits.
+    """
+    files = []
+    for root, dirs, names in os.walk(PLUGIN_DIR):
+        dirs[:] = sorted(d for d in dirs if d not in ("__pycache__", "benchmarks", ".git"))
+        for name in sorted(names):
+            if name.endswith(".py") or name == "metadata.txt":
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files.append([os.path.relpath(path, PLUGIN_DIR), stat.st_size, stat.st_mtime_ns])
+    return digest(json.dumps(files))
+
+
+def _plain(value):
+    """
+    Picklable attribute value: NULL QVariants become None.
+    """
+    if isinstance(value, QVariant):
+        return None if value.isNull() else value.value()
+    return value
+
+
+# --- Recording outputs ---
+class RecordingSink:
+    """
+    Wraps a QgsFeatureSink and appends every batch it accepts to a pickle
+    stream, so that the output can be replayed from the cache later.
+    """
+
+    def __init__(self, sink, path):
+        self.sink = sink
+        self.count = 0
+        self._file = open(path, "wb")
+
+    def addFeature(self, feature, flags=QgsFeatureSink.Flags()):
+        return self.addFeatures([feature], flags)
+
+    def addFeatures(self, features, flags=QgsFeatureSink.Flags()):
+        features = list(features)
+        if not self.sink.addFeatures(features, flags):
+            return False
+        rows = []
+        for feature in features:
+            geom = feature.geometry()
+            wkb = bytes(geom.asWkb()) if geom is not None and not geom.isNull() else None
+            rows.append((wkb, [_plain(v) for v in feature.attributes()]))
+        pickle.dump(rows, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.count += len(rows)
+        return True
+
+    def lastError(self):
+        return self.sink.lastError()
+
+    def flushBuffer(self):
+        return self.sink.flushBuffer()
+
+    def close(self):
+        self._file.close()
+
+
+class Recording:
+    """
+    Outputs of one algorithm run being written to a temporary cache entry.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix="tmp-", dir=directory)
+        self.outputs = {}
+        self.sinks = {}
+
+    def sink(self, name, sink, fields, geometry_type, crs):
+        self.outputs[name] = {
+            "fields": [[f.name(), int(f.type()), f.typeName(), f.length(), f.precision()] for f in fields],
+            "geometry_type": int(geometry_type),
+            "crs": crs.toWkt() if crs is not None and crs.isValid() else "",
+        }
+        self.sinks[name] = RecordingSink(sink, os.path.join(self.path, f"{name}.pkl"))
+        return self.sinks[name]
+
+    def close(self):
+        for name, sink in self.sinks.items():
+            sink.close()
+            self.outputs[name]["count"] = sink.count
+
+    def discard(self):
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+# --- Cache folder ---
+class StageCache:
+    """
+    On-disk cache of algorithm outputs, one folder per key holding
+    entry.json (fields, geometry type and CRS of each output sink) and a
+    pickle stream of the features of each output. Folders are evicted
+    least recently used first once the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+        The entry stored under key, or None. A hit marks the entry as
+        recently used.
+        """
+        path = os.path.join(self._entry_path(key), ENTRY_FILE)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def record(self):
+        return Recording(self.directory)
+
+    def commit(self, key, recording):
+        """
+        Store a finished recording under key and evict old entries. If
+        another process stored the same key meanwhile, its entry is kept.
+        """
+        recording.close()
+        with open(os.path.join(recording.path, ENTRY_FILE), "w") as f:
+            json.dump({"key": key, "created": time.time(), "outputs": recording.outputs}, f)
+        try:
+            os.rename(recording.path, self._entry_path(key))
+        except OSError:
+            shutil.rmtree(recording.path, ignore_errors=True)
+        self.evict()
+
+    def features(self, key, name, fields):
+        """
+        Yields the QgsFeatures recorded for output `name` of an entry.
+        """
+        with open(os.path.join(self._entry_path(key), f"{name}.pkl"), "rb") as f:
+            while True:
+                try:
+                    rows = pickle.load(f)
+                except EOFError:
+                    return
+                for wkb, attrs in rows:
+                    feature = QgsFeature(fields)
+                    if wkb is not None:
+                        geom = QgsGeometry()
+                        geom.fromWkb(wkb)
+                        feature.setGeometry(geom)
+                    feature.setAttributes(attrs)
+                    yield feature
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache fits max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            path = self._entry_path(name)
+            marker = os.path.join(path, ENTRY_FILE)
+            if name.startswith("tmp-") or not os.path.isfile(marker):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(marker), size, path))
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def stage_cache():
+    """
+    The stage cache configured by OPENRES_CACHE_DIR / OPENRES_CACHE_MB, or
+    None when it is turned off.
+    """
+    if CACHE_MB <= 0:
+        return None
+    directory = CACHE_DIR
+    if not directory:
+        settings = QgsApplication.qgisSettingsDirPath() or tempfile.gettempdir()
+        directory = os.path.join(settings, "openres", "stage_cache")
+    return StageCache(directory, CACHE_MB * 1024 * 1024)
+
+
+# --- Cached algorithms ---
+def _subset_of_layer(value):
+    """
+    Whether a parameter value is a feature source definition that reads only
+    part of its layer.
+    """
+    if not isinstance(value, QgsProcessingFeatureSourceDefinition):
+        return False
+    # featureLimit (QGIS 3.14) and filterExpression (QGIS 3.32) are missing on older versions
+    return (
+        value.selectedFeaturesOnly
+        or getattr(value, "featureLimit", -1) not in (-1, None)
+        or bool(getattr(value, "filterExpression", ""))
+        or bool(value.flags & QgsProcessingFeatureSourceDefinition.FlagOverrideDefaultGeometryCheck)
+    )
+
+
+class CachedAlgorithm(QgsProcessingAlgorithm):
+    """
+    Base class of the OpenRES algorithms. Subclasses implement run_stage()
+    in place of processAlgorithm() and add a BYPASS_CACHE parameter, unless
+    their cacheable() is always False (file and raster outputs).
+
+    The cache key hashes the algorithm, the plugin code, the source
+    signature of every input layer and file (sources.source_signature) and
+    all other parameter values, plus the outputs requested. On a hit, the outputs are written to
+    the requested sinks from the cache instead of being computed. The entry
+    is stored under the key taken after the run, so that algorithms that
+    tag their input layer (t_ID) hit on the next identical run.
+    """
+
+    BYPASS_CACHE = 'BYPASS_CACHE'
+
+    def run_stage(self, parameters, context, feedback):
+        raise NotImplementedError
+
+    def cacheable(self, parameters, context):
+        """
+        Whether this run may use the cache. Runs on a subset of a layer
+        (selected features, a feature limit or filter expression, a geometry
+        check that skips features) always recompute, as do runs on layers
+        with unsaved edits: neither the subset nor the edit buffer is part
+        of the layer signature the key is built from.
+        """
+        if any(_subset_of_layer(value) for value in parameters.values()):
+            return False
+        for definition in self.parameterDefinitions():
+            if definition.isDestination() or definition.type() not in ("source", "vector"):
+                continue
+            layer = self.parameterAsVectorLayer(parameters, definition.name(), context)
+            if layer is not None and layer.isModified():
+                return False
+        return True
+
+    def cache_key(self, parameters, context):
+        inputs = {}
+        outputs = []
+        for definition in self.parameterDefinitions():
+            name = definition.name()
+            if definition.isDestination():
+                if parameters.get(name) is not None:
+                    outputs.append(name)
+                continue
+            if name in UNKEYED_PARAMETERS:
+                continue
+            if definition.type() in ("source", "vector"):
+                inputs[name] = source_signature(self.parameterAsVectorLayer(parameters, name, context))
+            elif definition.type() == "raster":
+                inputs[name] = source_signature(self.parameterAsRasterLayer(parameters, name, context))
+            elif definition.type() == "file":
+                path = self.parameterAsFile(parameters, name, context)
+                inputs[name] = [path, file_signature(path)] if path else None
+            else:
+                inputs[name] = parameters.get(name, definition.defaultValue())
+        return digest(json.dumps(
+            {"algorithm": self.name(), "code": code_version(), "inputs": inputs, "outputs": sorted(outputs)},
+            sort_keys=True, default=str
+        ))
+
+    def parameterAsSink(self, parameters, name, context, fields, geometryType=QgsWkbTypes.NoGeometry,
+                        crs=QgsCoordinateReferenceSystem(), *args, **kwargs):
+        sink, dest_id = super().parameterAsSink(parameters, name, context, fields, geometryType, crs, *args, **kwargs)
+        recording = getattr(self, "_recording", None)
+        if recording is not None and sink is not None:
+            sink = recording.sink(name, sink, fields, geometryType, crs)
+        return sink, dest_id
+
+    def processAlgorithm(self, parameters, context, feedback):
+        cache = stage_cache()
+        if (cache is None or self.parameterAsBool(parameters, self.BYPASS_CACHE, context)
+                or not self.cacheable(parameters, context)):
+            return self.run_stage(parameters, context, feedback)
+
+        key = self.cache_key(parameters, context)
+        entry = cache.get(key)
+        if entry is not None:
+            return self.replay(cache, key, entry, parameters, context, feedback)
+
+        self._recording = cache.record()
+        try:
+            results = self.run_stage(parameters, context, feedback)
+            if results and not feedback.isCanceled():
+                cache.commit(self.cache_key(parameters, context), self._recording)
+        finally:
+            self._recording.discard()
+            self._recording = None
+        return results
+
+    def replay(self, cache, key, entry, parameters, context, feedback):
+        """
+        Write the cached outputs of `entry` to the requested sinks.
+        """
+        feedback.pushInfo(f"Stage cache hit: outputs replayed from {os.path.join(cache.directory, key)}")
+        profiler = Profiler(self.name(), feedback)
+        results = {}
+        with profiler.phase("cache replay") as p:
+            p["count"] = 0
+            for name, output in entry["outputs"].items():
+                fields = QgsFields()
+                for field_name, field_type, type_name, length, precision in output["fields"]:
+                    fields.append(QgsField(field_name, QVariant.Type(field_type), type_name, length, precision))
+                crs = QgsCoordinateReferenceSystem.fromWkt(output["crs"]) if output["crs"] else QgsCoordinateReferenceSystem()
+                sink, dest_id = self.parameterAsSink(
+                    parameters, name, context, fields, QgsWkbTypes.Type(output["geometry_type"]), crs
+                )
+                p["count"] += write_features(sink, cache.features(key, name, fields), feedback=feedback)
+                results[name] = dest_id
+        profiler.report()
+        return results
@@ -0,0 +1,116 @@
+# OpenRES: Open Riverine Ecosystem Synthesis
+# Copyright (C) 2025  Jacob Nesslage
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+
+from .core.segments import SegmentSet
+from .core.segment_index import SegmentGrid
+from .core.index_file import save_index, load_index
+from .debug import log
+from .sources import index_path, source_signature
+
+# Keep valley line indexes in sidecar files; OPENRES_INDEX_SIDECAR=0 always rebuilds
+SIDECAR = os.environ.get("OPENRES_INDEX_SIDECAR", "1") != "0"
+
+
+def line_parts(geom):
+    """
+    Return the vertex lists (QgsPointXY) of every part of a line geometry.
+    """
+    if geom is None or geom.isNull():
+        return []
+    if geom.isMultipart():
+        return geom.asMultiPolyline()
+    return [geom.asPolyline()]
+
+
+def xy_parts(geom):
+    """
+    Return every part of a line geometry as an (xs, ys) pair of coordinate
+    lists, the polyline form used by core.geometry.
+    """
+    return [([p.x() for p in part], [p.y() for p in part]) for part in line_parts(geom)]
+
+
+def explode_valley_lines(source):
+    """
+    Explode a valley lines layer into a SegmentSet of straight segments.
+
+    Parameters:
+        source (QgsFeatureSource or QgsVectorLayer): Valley lines.
+
+    Returns:
+        SegmentSet: Segments keyed by the feature ids of `source`.
+    """
+    def parts():
+        for feature in source.getFeatures():
+            for part in line_parts(feature.geometry()):
+                yield feature.id(), [p.x() for p in part], [p.y() for p in part]
+
+    return SegmentSet.from_parts(parts())
+
+
+def _whole_saved_layer(source, layer):
+    """
+    Whether `source` reads every feature of `layer` as saved on disk, which
+    is all the sidecar signature describes.
+    """
+    if layer is None or layer.isModified() or layer.subsetString():
+        return False
+    return source is layer or source.allFeatureIds() == layer.allFeatureIds()
+
+
+def build_valley_index(source, cell_size=None, layer=None):
+    """
+    Explode a valley lines layer and build a segment-level grid index over it.
+
+    For file-based layers the index is kept in a sidecar file next to the
+    layer (sources.index_path) and memory-mapped by later runs, until the
+    layer's files change (sources.source_signature). Sources that are not
+    the whole saved layer (selected features, subset strings, unsaved
+    edits) are always indexed from scratch.
+
+    Parameters:
+        source (QgsFeatureSource or QgsVectorLayer): Valley lines.
+        cell_size (float): Optional grid cell size in layer units.
+        layer (QgsVectorLayer): Layer behind `source` when `source` is a
+            Processing feature source; defaults to `source` itself.
+
+    Returns:
+        tuple: (SegmentSet, SegmentGrid)
+    """
+    if layer is None and hasattr(source, "dataProvider"):
+        layer = source
+    path = None
+    if SIDECAR and _whole_saved_layer(source, layer):
+        path = index_path(layer)
+    if path:
+        signature = json.dumps([source_signature(layer), cell_size])
+        loaded = load_index(path, signature)
+        if loaded is not None:
+            log(f"Valley line index loaded from {path}")
+            return loaded
+
+    segments = explode_valley_lines(source)
+    grid = SegmentGrid(segments, cell_size=cell_size)
+    if path:
+        try:
+            save_index(path, segments, grid, signature)
+            log(f"Valley line index written to {path}")
+        except OSError as e:
+            log(f"Valley line index not written to {path}: {e}")
+    return segments, grid